@@ -0,0 +1,582 @@
+"""
+Analysis Engine
+Face, attention and emotion pipeline without any GUI dependency
+Academic Project - Polis University
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+
+from batch_inference import EmotionBatcher, predict_crops
+from detector_backends import LandmarkEyes, create_detector
+from face_tracker import FaceTracker
+from frame_sources import frames_from
+from instrumentation import NULL_METRICS
+from model_registry import registry
+from result_cache import predict_crops_cached
+from temporal import ChangeGate
+from tracks import TrackManager
+
+LOOKING = "Looking at screen"
+NOT_LOOKING = "Not looking at screen"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FaceAttention:
+    """Eyes, gaze and attention state of one face"""
+    status: str = NOT_LOOKING
+    eyes: List[Tuple[int, int, int, int]] = field(default_factory=list)  # Or an (N, 4) array from the cascade
+    gaze: Optional[Tuple[float, float]] = None  # Average iris offset in percent of eye size
+
+
+@dataclass
+class AttentionResult:
+    """Attention state of the primary face in a frame, plus every other face"""
+    status: str = NOT_LOOKING
+    face: Optional[Tuple[int, int, int, int]] = None
+    faces: List[Tuple[int, int, int, int]] = field(default_factory=list)  # Every face, largest first
+    eyes: List[Tuple[int, int, int, int]] = field(default_factory=list)
+    gaze: Optional[Tuple[float, float]] = None  # Average iris offset in percent of eye size
+    track_ids: List[int] = field(default_factory=list)           # Aligned with faces
+    per_face: List[FaceAttention] = field(default_factory=list)  # Aligned with faces
+    idle: bool = False  # Not analyzed, the motion gate saw an empty, still scene
+
+
+@dataclass
+class EmotionResult:
+    """Emotion distribution of a face, scores in percent"""
+    emotions: Dict[str, float]
+    dominant_emotion: str
+    confidence: float
+
+    @classmethod
+    def from_scores(cls, emotions):
+        dominant_emotion = max(emotions, key=emotions.get)
+        return cls(emotions, dominant_emotion, float(emotions[dominant_emotion]))
+
+
+@dataclass
+class FaceResult:
+    """One detected face with its track, emotion and attention"""
+    face_index: int
+    box: Tuple[int, int, int, int]
+    emotion: Optional[EmotionResult] = None
+    track_id: Optional[int] = None
+    attention: Optional[FaceAttention] = None
+
+
+@dataclass
+class FrameResult:
+    """Everything the pipeline found in one frame"""
+    frame_id: int
+    timestamp: float
+    attention: Optional[AttentionResult] = None
+    emotion: Optional[EmotionResult] = None  # Emotion of the largest face
+    faces: List[FaceResult] = field(default_factory=list)
+    latency: float = 0.0  # Seconds spent analyzing the frame
+    idle: bool = False    # Skipped by the motion gate
+
+
+class AnalysisEngine:
+    def __init__(self, emotion_backend="deepface", gaze_threshold=15,
+                 max_batch_size=8, max_wait=0.05, face_margin=0.1, wait_for_model=True,
+                 detect_every=1, detect_scale=0.5, min_face_size=60, change_threshold=None,
+                 result_cache=None, cache_near=False, metrics=None, detector="haar", motion_gate=None):
+        # "deepface", "fer" or None to disable emotion inference
+        self.emotion_backend = emotion_backend
+        self.emotion_model = None
+
+        # When False, frames analyzed while the model is still loading get no emotions
+        self.wait_for_model = wait_for_model
+
+        # Face crops are scored in batches of up to max_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.face_margin = face_margin  # Extra border around each crop, fraction of face size
+
+        # Threshold for "looking at screen" - percent offset of the iris from eye center
+        self.gaze_threshold = gaze_threshold
+
+        # Face and eye detector: "haar" cascades, "yunet" (faces and eye landmarks
+        # in one pass) or "ssd", see detector_backends.py
+        self.detector = create_detector(detector)
+        # Eye landmarks of the last detection, reused for the (tracked) face boxes
+        self.landmark_eyes = LandmarkEyes()
+
+        # Faces are searched on a copy downscaled by detect_scale, smaller faces
+        # than min_face_size pixels (full resolution) are ignored
+        self.detect_scale = detect_scale
+        self.min_face_size = min_face_size
+        # Gray and downscaled buffers are reused per thread instead of reallocated per frame
+        self.buffers = threading.local()
+
+        # With detect_every > 1 the face cascade only runs every N frames and
+        # faces are followed by template matching in between
+        self.tracker = FaceTracker(detect_every) if detect_every > 1 else None
+
+        # Stable IDs and per-person state for every face in view
+        self.tracks = TrackManager()
+
+        # With a change_threshold, tracked faces whose crop barely changed since
+        # their last inference reuse that result instead of running the model
+        self.change_gate = ChangeGate(change_threshold) if change_threshold else None
+
+        # Optional ResultCache: emotion and gaze results of pixels seen before are reused.
+        # cache_near also reuses the emotions of near-identical crops (live cameras only)
+        self.result_cache = result_cache
+        self.cache_near = cache_near
+
+        # Stage timings and failure counts, a no-op unless a Metrics instance is passed
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        # Without metrics, failures are logged as warnings, at most once per interval and kind
+        self.failure_log_interval = 30.0
+        self.failure_logged = {}
+
+        # Optional MotionGate: while nobody is in view and nothing moves, only a
+        # frame now and then runs the face, eye and emotion stages
+        self.motion_gate = motion_gate
+
+    def start_loading(self):
+        """Build and warm up the emotion model in the background"""
+        if self.emotion_backend is not None:
+            registry.load_async(self.emotion_backend)
+
+    def load_emotion_model(self, wait=True):
+        """Shared warm emotion model, None while still loading if wait is False"""
+        if self.emotion_model is None and self.emotion_backend is not None:
+            self.emotion_model = registry.get(self.emotion_backend, wait=wait)
+        return self.emotion_model
+
+    def model_report(self):
+        """Load and warmup timings of the emotion model once it is ready"""
+        if self.emotion_backend is None:
+            return None
+        return registry.report(self.emotion_backend)
+
+    def create_batcher(self):
+        """Background batcher for streaming callers that submit crops as frames arrive"""
+        return EmotionBatcher(self.load_emotion_model(), self.max_batch_size, self.max_wait)
+
+    def crop_face(self, frame, box):
+        """Cut a face out of the frame with a small margin, clipped to the image"""
+        x, y, w, h = box
+        pad_x, pad_y = int(w * self.face_margin), int(h * self.face_margin)
+        x0, y0 = max(x - pad_x, 0), max(y - pad_y, 0)
+        x1, y1 = min(x + w + pad_x, frame.shape[1]), min(y + h + pad_y, frame.shape[0])
+        return frame[y0:y1, x0:x1]
+
+    def find_emotion_faces(self, frame):
+        """Faces for the emotion stage, from the backend detector (MTCNN) or Haar"""
+        faces = self.emotion_model.detect_faces(frame)
+        if faces is None:
+            faces = [tuple(int(v) for v in face) for face in self.detect_face_opencv(frame)]
+        # Largest face first so index 0 is the primary subject
+        return sorted(faces, key=lambda rect: rect[2] * rect[3], reverse=True)
+
+    def detect_emotions(self, frame, faces=None):
+        """Run emotion inference on every face of a frame, returns the largest face's result
+
+        Pass `faces` (e.g. tracked boxes from the attention path) to skip face detection.
+        """
+        faces = self.analyze_emotions([(0, frame)], None if faces is None else [faces])[0]
+        return faces[0].emotion if faces else None
+
+    def analyze_emotions(self, frames, face_boxes=None, face_keys=None):
+        """Score all faces of several (frame_id, frame) pairs in shared batches
+
+        `face_boxes` optionally holds already known face boxes for each frame,
+        `face_keys` the matching track IDs used by the change gate.
+        Returns one list of FaceResult per input frame, in input order.
+        """
+        if self.load_emotion_model(wait=self.wait_for_model) is None:
+            return [[] for _ in frames]
+
+        face_lists = []
+        items = []
+        scores = {}
+        gated = {}  # (frame_id, face_index) -> (key, thumbnail) to store after inference
+        for i, (frame_id, frame) in enumerate(frames):
+            if face_boxes is None or face_boxes[i] is None:
+                faces = self.find_emotion_faces(frame)
+            else:
+                faces = list(face_boxes[i])
+            keys = face_keys[i] if face_keys is not None else None
+            face_lists.append(faces)
+            for face_index, box in enumerate(faces):
+                crop = self.crop_face(frame, box)
+                if crop.size == 0:
+                    continue
+                if self.change_gate is not None and keys is not None and keys[face_index] is not None:
+                    cached, thumbnail = self.change_gate.lookup(keys[face_index], crop)
+                    if cached is not None:
+                        scores[(frame_id, face_index)] = cached
+                        continue
+                    gated[(frame_id, face_index)] = (keys[face_index], thumbnail)
+                items.append((frame_id, face_index, crop))
+
+        self.metrics.count("emotion_crops_skipped_total", len(scores))
+        if items:
+            with self.metrics.timer("emotion_inference"):
+                if self.result_cache is not None:
+                    predicted = predict_crops_cached(self.result_cache, self.emotion_model, items,
+                                                     self.max_batch_size, near=self.cache_near)
+                else:
+                    predicted = predict_crops(self.emotion_model, items, self.max_batch_size)
+            self.metrics.count("emotion_crops_total", len(items))
+            for item_key, (key, thumbnail) in gated.items():
+                if item_key in predicted:
+                    self.change_gate.store(key, thumbnail, predicted[item_key])
+            scores.update(predicted)
+
+        results = []
+        for (frame_id, _), faces in zip(frames, face_lists):
+            frame_faces = []
+            for face_index, box in enumerate(faces):
+                emotions = scores.get((frame_id, face_index))
+                emotion = EmotionResult.from_scores(emotions) if emotions else None
+                frame_faces.append(FaceResult(face_index, box, emotion))
+            results.append(frame_faces)
+        return results
+
+    def to_gray(self, frame):
+        """Convert a frame to grayscale into this thread's reused buffer"""
+        gray = getattr(self.buffers, "gray", None)
+        if gray is None or gray.shape != frame.shape[:2]:
+            gray = None
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
+        self.buffers.gray = gray
+        return gray
+
+    def downscale(self, image):
+        """Shrink a gray or BGR frame by detect_scale into this thread's reused buffer"""
+        height, width = image.shape[:2]
+        size = (max(int(width * self.detect_scale), 1), max(int(height * self.detect_scale), 1))
+        name = "small" if image.ndim == 2 else "small_color"
+        small = getattr(self.buffers, name, None)
+        if small is None or small.shape[:2] != (size[1], size[0]):
+            small = None
+        small = cv2.resize(image, size, dst=small, interpolation=cv2.INTER_AREA)
+        setattr(self.buffers, name, small)
+        return small
+
+    def locate_faces(self, frame, gray):
+        """Face boxes for this frame, largest first, from the cascade or the tracker"""
+        if self.tracker is None:
+            faces = self.detect_face_opencv(frame, gray)
+        else:
+            faces, _ = self.tracker.update(gray, lambda: self.detect_face_opencv(frame, gray))
+        faces = [tuple(int(v) for v in face) for face in faces]
+        return sorted(faces, key=lambda rect: rect[2] * rect[3], reverse=True)
+
+    def detect_face_opencv(self, frame, gray=None):
+        """Detect faces with the detector backend on a downscaled frame, boxes in full resolution"""
+        image = frame
+        if not self.detector.color:
+            image = gray if gray is not None else self.to_gray(frame)
+        if self.detect_scale >= 1.0:
+            faces, eyes = self.detector.detect_faces(image, self.min_face_size)
+        else:
+            min_side = max(int(self.min_face_size * self.detect_scale), 1)
+            faces, eyes = self.detector.detect_faces(self.downscale(image), min_side)
+            # Map the boxes (and eye landmarks) back to full resolution
+            scale = 1.0 / self.detect_scale
+            faces = [tuple(int(round(v * scale)) for v in face) for face in faces]
+            eyes = [None if face_eyes is None else [tuple(int(round(v * scale)) for v in eye) for eye in face_eyes]
+                    for face_eyes in eyes]
+        self.landmark_eyes.store(faces, eyes)
+        return faces
+
+    def detect_eyes_in_face(self, gray_frame, face_rect):
+        """Detect eyes within a face region, from landmarks when the detector gave them"""
+        eyes = self.landmark_eyes.lookup(face_rect)
+        if eyes is None:
+            eyes = self.detector.detect_eyes(gray_frame, face_rect)
+        return eyes
+
+    def analyze_eye_gaze(self, gray_frame, eye_rect):
+        """Analyze if eye is looking forward by detecting iris/pupil position"""
+        ex, ey, ew, eh = eye_rect
+
+        # Extract eye region
+        eye_roi = gray_frame[ey:ey+eh, ex:ex+ew]
+        if eye_roi.size == 0 or ew < 10 or eh < 10:
+            return None
+
+        # Apply Gaussian blur to reduce noise
+        eye_roi_blur = cv2.GaussianBlur(eye_roi, (5, 5), 0)
+
+        # Use adaptive threshold to find dark regions (pupil/iris)
+        thresh = cv2.adaptiveThreshold(eye_roi_blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                       cv2.THRESH_BINARY_INV, 11, 2)
+
+        # Find contours
+        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        if len(contours) > 0:
+            # Filter contours by area (pupil should be reasonably sized)
+            min_area = (ew * eh) * 0.05  # At least 5% of eye area
+            max_area = (ew * eh) * 0.4   # At most 40% of eye area
+            valid_contours = [c for c in contours if min_area < cv2.contourArea(c) < max_area]
+
+            if len(valid_contours) > 0:
+                # Find the largest valid contour (likely the pupil)
+                largest_contour = max(valid_contours, key=cv2.contourArea)
+
+                # Get the center of the contour
+                M = cv2.moments(largest_contour)
+                if M["m00"] != 0:
+                    cx = int(M["m10"] / M["m00"])
+                    cy = int(M["m01"] / M["m00"])
+
+                    # Calculate offset from eye center
+                    eye_center_x = ew // 2
+                    eye_center_y = eh // 2
+                    offset_x = cx - eye_center_x
+                    offset_y = cy - eye_center_y
+
+                    # Normalize offset (as percentage of eye size)
+                    offset_x_percent = (offset_x / ew) * 100 if ew > 0 else 0
+                    offset_y_percent = (offset_y / eh) * 100 if eh > 0 else 0
+
+                    return (offset_x_percent, offset_y_percent)
+
+        # Alternative method: find darkest point in eye region
+        # This works when threshold fails
+        min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(eye_roi_blur)
+        cx, cy = min_loc  # Darkest point (likely pupil)
+
+        # Calculate offset from eye center
+        eye_center_x = ew // 2
+        eye_center_y = eh // 2
+        offset_x = cx - eye_center_x
+        offset_y = cy - eye_center_y
+
+        # Normalize offset
+        offset_x_percent = (offset_x / ew) * 100 if ew > 0 else 0
+        offset_y_percent = (offset_y / eh) * 100 if eh > 0 else 0
+
+        return (offset_x_percent, offset_y_percent)
+
+    def face_attention(self, gray, face):
+        """Decide whether one face looks at the screen from its eye gaze"""
+        return self.faces_attention(gray, [face])[0]
+
+    def faces_attention(self, gray, faces):
+        """Eyes, gaze and attention of every face"""
+        if self.result_cache is None:
+            return self._faces_attention(gray, faces)
+
+        # Faces whose pixels were analyzed before with the same settings come from the cache
+        namespace = f"gaze:{self.detector.name}:{self.gaze_threshold}"
+        per_face = [None] * len(faces)
+        misses = []
+        for i, (x, y, w, h) in enumerate(faces):
+            cached = self.result_cache.get(namespace, gray[y:y+h, x:x+w])
+            if cached is None:
+                misses.append(i)
+                continue
+            per_face[i] = FaceAttention(
+                status=cached["status"],
+                eyes=[(ex + x, ey + y, ew, eh) for ex, ey, ew, eh in cached["eyes"]],
+                gaze=tuple(cached["gaze"]) if cached["gaze"] is not None else None,
+            )
+
+        computed = self._faces_attention(gray, [faces[i] for i in misses])
+        for i, state in zip(misses, computed):
+            per_face[i] = state
+            x, y, w, h = faces[i]
+            self.result_cache.put(namespace, gray[y:y+h, x:x+w], {
+                "status": state.status,
+                "eyes": [(int(ex - x), int(ey - y), int(ew), int(eh)) for ex, ey, ew, eh in state.eyes],
+                "gaze": state.gaze,
+            })
+        return per_face
+
+    def _faces_attention(self, gray, faces):
+        """faces_attention without the result cache"""
+        return [self._face_attention(gray, face) for face in faces]
+
+    def _face_attention(self, gray, face):
+        """Eyes, gaze and attention of one face, without the result cache"""
+        # Detect eyes within the face
+        eyes = self.detect_eyes_in_face(gray, face)
+        result = FaceAttention(eyes=eyes)
+
+        if len(eyes) < 2:
+            # Need at least 2 eyes for gaze detection
+            return result
+
+        # Analyze gaze direction for each eye
+        gaze_offsets = []
+        for eye in eyes[:2]:  # Use first 2 eyes detected
+            gaze = self.analyze_eye_gaze(gray, eye)
+            if gaze is not None:
+                gaze_offsets.append(gaze)
+
+        if len(gaze_offsets) < 2:
+            # Couldn't analyze both eyes
+            return result
+
+        # Calculate average gaze offset
+        avg_offset_x = sum(g[0] for g in gaze_offsets) / len(gaze_offsets)
+        avg_offset_y = sum(g[1] for g in gaze_offsets) / len(gaze_offsets)
+        result.gaze = (avg_offset_x, avg_offset_y)
+
+        # If looking forward, iris should be near the center of each eye
+        if abs(avg_offset_x) < self.gaze_threshold and abs(avg_offset_y) < self.gaze_threshold:
+            result.status = LOOKING
+
+        return result
+
+    def report_failure(self, counter, message):
+        """Count a swallowed exception, call from its except block
+
+        With metrics on it is counted there and logged at debug level; with
+        metrics off it would show up nowhere, so it becomes a rate-limited warning.
+        """
+        self.metrics.count(counter)
+        if self.metrics.enabled:
+            logger.debug(message, exc_info=True)
+            return
+        now = time.monotonic()
+        if now - self.failure_logged.get(counter, -self.failure_log_interval) >= self.failure_log_interval:
+            self.failure_logged[counter] = now
+            logger.warning("%s (repeats are not logged for %.0fs)", message, self.failure_log_interval,
+                           exc_info=True)
+
+    def gate_allows(self, frame):
+        """False when the motion gate is idle and this frame is not one of its probes"""
+        if self.motion_gate is None or self.motion_gate.update(frame):
+            return True
+        self.metrics.count("idle_frames_total")
+        return False
+
+    def detect_attention(self, frame, timestamp=None):
+        """Detect which faces are looking at screen based on eye gaze direction"""
+        if not self.gate_allows(frame):
+            return AttentionResult(idle=True)
+        try:
+            # Convert once, the face search downscales it and eyes use the full-resolution ROI
+            gray = self.to_gray(frame)
+
+            # Detect (or track) faces
+            with self.metrics.timer("face_detection"):
+                faces = self.locate_faces(frame, gray)
+            track_ids = self.tracks.assign(faces, timestamp)
+            self.metrics.gauge("active_tracks", len(self.tracks))
+            if self.motion_gate is not None:
+                self.motion_gate.observe_faces(len(faces))
+
+            if len(faces) == 0:
+                # No face detected - default to not looking
+                return AttentionResult()
+
+            # Every face gets its own eyes and gaze, the largest one is the primary subject
+            with self.metrics.timer("eyes_and_gaze"):
+                per_face = self.faces_attention(gray, faces)
+            for track_id, state in zip(track_ids, per_face):
+                self.tracks.update_attention(track_id, state.status, state.gaze)
+
+            primary = per_face[0]
+            return AttentionResult(
+                status=primary.status, face=faces[0], faces=faces, eyes=primary.eyes,
+                gaze=primary.gaze, track_ids=track_ids, per_face=per_face
+            )
+
+        except Exception:
+            # If any error occurs, default to not looking but keep count of it
+            self.report_failure("attention_failures_total", "Attention detection failed")
+            return AttentionResult()
+
+    def detect_track_emotions(self, frame, frame_id, faces, track_ids):
+        """Classify already tracked faces and store the emotions on their tracks"""
+        face_results = self.analyze_emotions([(frame_id, frame)], [faces], [track_ids])[0]
+        for face, track_id in zip(face_results, track_ids):
+            face.track_id = track_id
+            self.tracks.update_emotion(track_id, face.emotion, frame_id)
+        return face_results
+
+    def analyze(self, frame, frame_id=0, timestamp=None, attention=True, emotion=True):
+        """Run the enabled pipeline stages on one frame"""
+        return self.analyze_batch([(frame_id, timestamp, frame)], attention, emotion)[0]
+
+    def analyze_batch(self, frames, attention=True, emotion=True):
+        """Run the pipeline on several (frame_id, timestamp, frame) items
+
+        Attention runs per frame, emotion crops of all frames share model calls.
+        """
+        start = time.perf_counter()
+        results = [
+            FrameResult(frame_id=frame_id, timestamp=time.time() if timestamp is None else timestamp)
+            for frame_id, timestamp, _ in frames
+        ]
+
+        if attention:
+            for result, (_, _, frame) in zip(results, frames):
+                result.attention = self.detect_attention(frame, result.timestamp)
+                result.idle = result.attention.idle
+                result.faces = [
+                    FaceResult(i, box, track_id=track_id, attention=state)
+                    for i, (box, track_id, state) in enumerate(zip(
+                        result.attention.faces, result.attention.track_ids, result.attention.per_face
+                    ))
+                ]
+
+        if emotion and self.emotion_backend is not None:
+            try:
+                if not attention and self.load_emotion_model(wait=self.wait_for_model) is not None:
+                    # No attention pass, track the faces found by the emotion stage
+                    for result, (_, _, frame) in zip(results, frames):
+                        if not self.gate_allows(frame):
+                            result.idle = True
+                            continue
+                        boxes = self.find_emotion_faces(frame)
+                        if self.motion_gate is not None:
+                            self.motion_gate.observe_faces(len(boxes))
+                        track_ids = self.tracks.assign(boxes, result.timestamp)
+                        result.faces = [FaceResult(i, box, track_id=track_id)
+                                        for i, (box, track_id) in enumerate(zip(boxes, track_ids))]
+                # Reuse the known face boxes instead of detecting faces again
+                face_lists = self.analyze_emotions(
+                    [(frame_id, frame) for frame_id, _, frame in frames],
+                    [[face.box for face in r.faces] for r in results],
+                    [[face.track_id for face in r.faces] for r in results],
+                )
+            except Exception:
+                # If face detection or inference fails, leave the emotions empty
+                self.report_failure("emotion_failures_total", "Emotion analysis failed")
+                face_lists = [[] for _ in frames]
+            for result, faces in zip(results, face_lists):
+                for face, emotion_face in zip(result.faces, faces):
+                    face.emotion = emotion_face.emotion
+                for face in result.faces:
+                    self.tracks.update_emotion(face.track_id, face.emotion, result.frame_id)
+                result.emotion = result.faces[0].emotion if result.faces else None
+
+        latency = (time.perf_counter() - start) / max(len(frames), 1)
+        for result in results:
+            result.latency = latency
+        return results
+
+    def run(self, source, attention=True, emotion=True, batch_frames=1):
+        """Yield a FrameResult for every frame of a camera, video, image folder or array
+
+        With batch_frames > 1 the faces of that many frames are scored together,
+        which raises throughput at the cost of latency.
+        """
+        pending = []
+        for frame_id, timestamp, frame in frames_from(source):
+            # Sources may reuse their buffers, keep a private copy while batching
+            pending.append((frame_id, timestamp, frame if batch_frames == 1 else frame.copy()))
+            if len(pending) >= batch_frames:
+                yield from self.analyze_batch(pending, attention, emotion)
+                pending = []
+        if pending:
+            yield from self.analyze_batch(pending, attention, emotion)
@@ -0,0 +1,256 @@
+"""
+Batch Analyzer
+Score recorded videos and image folders without a display
+Academic Project - Polis University
+"""
+
+import argparse
+import csv
+import glob
+import hashlib
+import multiprocessing as mp
+import os
+import time
+from collections import namedtuple
+
+from analysis_engine import LOOKING
+from emotion_backends import EMOTION_LABELS
+from frame_sources import image_dir_frames, list_images, video_frame_count, video_frames
+from result_cache import ResultCache
+from tracks import TrackManager
+
+COLUMNS = [
+    "source", "chunk", "frame_index", "timestamp", "face_index", "track_id",
+    "x", "y", "w", "h", "attention", "gaze_x", "gaze_y",
+    "dominant_emotion", "confidence",
+] + [f"emotion_{label}" for label in EMOTION_LABELS]
+
+# Parquet type of every column, fixed so chunks without faces (all-null
+# columns) still concatenate with the others
+COLUMN_TYPES = dict(
+    {"source": "string", "chunk": "int32", "frame_index": "int64", "timestamp": "float64",
+     "face_index": "int32", "track_id": "int64", "x": "int32", "y": "int32", "w": "int32", "h": "int32",
+     "attention": "int8", "gaze_x": "float64", "gaze_y": "float64",
+     "dominant_emotion": "string", "confidence": "float64"},
+    **{f"emotion_{label}": "float64" for label in EMOTION_LABELS}
+)
+
+# One frame range of one source, written to its own part file
+ChunkJob = namedtuple("ChunkJob", ["source", "kind", "chunk", "start", "stop", "stride",
+                                   "batch_frames", "part_path", "output_format"])
+
+# Engine of the current worker process, built once by _init_worker
+_engine = None
+
+
+def _init_worker(engine_options):
+    global _engine
+    from analysis_engine import AnalysisEngine
+    _engine = AnalysisEngine(**engine_options)
+    _engine.load_emotion_model()
+
+
+def frame_rows(source_name, chunk, result, tracked=True):
+    """Flatten one FrameResult into rows, one per face (face_index -1 if none)
+
+    Track IDs are numbered per chunk, (chunk, track_id) identifies a person.
+    With tracked=False (unrelated still images) the track ID is left empty.
+    """
+    base = {"source": source_name, "chunk": chunk, "frame_index": result.frame_id,
+            "timestamp": result.timestamp}
+    if not result.faces:
+        return [dict(base, face_index=-1)]
+
+    rows = []
+    for face in result.faces:
+        row = dict(base, face_index=face.face_index, track_id=face.track_id if tracked else None)
+        row["x"], row["y"], row["w"], row["h"] = face.box
+        if face.attention is not None:
+            row["attention"] = int(face.attention.status == LOOKING)
+            if face.attention.gaze is not None:
+                row["gaze_x"], row["gaze_y"] = face.attention.gaze
+        if face.emotion is not None:
+            row["dominant_emotion"] = face.emotion.dominant_emotion
+            row["confidence"] = face.emotion.confidence
+            for label in EMOTION_LABELS:
+                row[f"emotion_{label}"] = face.emotion.emotions.get(label)
+        rows.append(row)
+    return rows
+
+
+def parquet_schema():
+    import pyarrow as pa
+    return pa.schema([(column, getattr(pa, COLUMN_TYPES[column])()) for column in COLUMNS])
+
+
+def write_rows(path, rows, output_format):
+    """Write rows to a CSV or Parquet file"""
+    if output_format == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.table({column: [row.get(column) for row in rows] for column in COLUMNS},
+                         schema=parquet_schema())
+        pq.write_table(table, path)
+    else:
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def merge_parts(part_paths, path, output_format):
+    """Concatenate finished chunk files into the final output"""
+    if output_format == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema = parquet_schema()
+        pq.write_table(pa.concat_tables([pq.read_table(p, schema=schema) for p in part_paths]), path)
+    else:
+        with open(path, "w", newline="") as out:
+            for i, part in enumerate(part_paths):
+                with open(part, newline="") as f:
+                    lines = f.readlines()
+                out.writelines(lines if i == 0 else lines[1:])
+
+
+def process_chunk(job):
+    """Worker: analyze one frame range and write it to its own part file"""
+    # Track IDs start over in every chunk, nothing carries over from the previous job
+    _engine.tracks = TrackManager()
+    if job.kind == "video":
+        frames = video_frames(job.source, job.start, job.stop, job.stride)
+    else:
+        frames = image_dir_frames(job.source, job.start, job.stop, job.stride)
+
+    started = time.perf_counter()
+    rows = []
+    frame_count = 0
+    name = os.path.basename(os.path.normpath(job.source))
+    # Images of a folder are separate photos, their frame index is no time axis to track faces along
+    tracked = job.kind == "video"
+    for result in _engine.run(frames, batch_frames=job.batch_frames):
+        rows.extend(frame_rows(name, job.chunk, result, tracked))
+        frame_count += 1
+
+    # Write under a temporary name and rename, a part file only exists once complete
+    tmp_path = job.part_path + ".tmp"
+    write_rows(tmp_path, rows, job.output_format)
+    os.replace(tmp_path, job.part_path)
+    return frame_count, time.perf_counter() - started
+
+
+def part_prefix(source):
+    """Name of a source's part files, the path hash tells apart sources with the same name"""
+    name = os.path.basename(os.path.normpath(source))
+    digest = hashlib.sha1(os.path.abspath(source).encode()).hexdigest()[:8]
+    return f"{name}.{digest}"
+
+
+def plan_chunks(source, chunk_size, stride, batch_frames, output_dir, output_format):
+    """Split a source into frame ranges, each with its own part file"""
+    if os.path.isdir(source):
+        kind, total = "images", len(list_images(source))
+    else:
+        kind, total = "video", video_frame_count(source)
+
+    # Chunk boundaries on multiples of the stride keep the sampling uniform
+    chunk_size = max(chunk_size // stride, 1) * stride
+    name = os.path.basename(os.path.normpath(source))
+    prefix = part_prefix(source)
+    jobs = []
+    for chunk, start in enumerate(range(0, total, chunk_size)):
+        part_path = os.path.join(output_dir, f"{prefix}.part{chunk:05d}.{output_format}")
+        jobs.append(ChunkJob(source, kind, chunk, start, min(start + chunk_size, total), stride,
+                             batch_frames, part_path, output_format))
+    return name, jobs
+
+
+def default_format():
+    try:
+        import pyarrow  # noqa: F401
+        return "parquet"
+    except ImportError:
+        return "csv"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze recorded videos and image folders offline")
+    parser.add_argument("sources", nargs="+", help="video files or image folders (e.g. emotion_images/)")
+    parser.add_argument("-o", "--output-dir", default="analysis_output")
+    parser.add_argument("--format", choices=["parquet", "csv"], default=None,
+                        help="output format (default: parquet if pyarrow is installed, else csv)")
+    parser.add_argument("--backend", choices=["deepface", "fer", "onnx", "none"], default="deepface")
+    parser.add_argument("--stride", type=int, default=1, help="analyze every N-th frame")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--chunk-size", type=int, default=600, help="frames per parallel chunk")
+    parser.add_argument("--batch-frames", type=int, default=4, help="frames whose faces share a model call")
+    parser.add_argument("--cache", default=None,
+                        help="result cache database shared by runs (default: OUTPUT_DIR/results_cache.sqlite)")
+    parser.add_argument("--no-cache", action="store_true", help="always run the models")
+    parser.add_argument("--restart", action="store_true", help="ignore finished chunks from an earlier run")
+    args = parser.parse_args()
+
+    output_format = args.format or default_format()
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    plans = []
+    pending = []
+    skipped = 0
+    names = set()
+    for source in args.sources:
+        name, jobs = plan_chunks(source, args.chunk_size, args.stride, args.batch_frames,
+                                 args.output_dir, output_format)
+        # A second source with the same file name gets the hashed name
+        output_name = part_prefix(source) if name in names else name
+        names.add(name)
+        path = os.path.join(args.output_dir, f"{output_name}.{output_format}")
+        if os.path.exists(path) and not args.restart:
+            print(f"Skipping {source}: {path} already exists")
+            continue
+        plans.append((path, part_prefix(source), jobs))
+        for job in jobs:
+            if args.restart and os.path.exists(job.part_path):
+                os.remove(job.part_path)
+            # Resume: chunks whose part file exists were finished by an earlier run
+            if os.path.exists(job.part_path):
+                skipped += 1
+            else:
+                pending.append(job)
+
+    if skipped:
+        print(f"Resuming: {skipped} chunks already done")
+
+    engine_options = {
+        "emotion_backend": None if args.backend == "none" else args.backend,
+        "detect_every": 1,
+    }
+    if not args.no_cache:
+        # Re-scoring the same footage after a threshold change reuses earlier results
+        cache_path = args.cache or os.path.join(args.output_dir, "results_cache.sqlite")
+        engine_options["result_cache"] = ResultCache(cache_path, max_bytes=512 * 1024 * 1024)
+    started = time.perf_counter()
+    frames_done = 0
+    busy_seconds = 0.0
+    if pending:
+        context = mp.get_context("spawn")
+        with context.Pool(args.jobs, initializer=_init_worker, initargs=(engine_options,)) as pool:
+            for frame_count, seconds in pool.imap_unordered(process_chunk, pending):
+                frames_done += frame_count
+                busy_seconds += seconds
+                print(f"  {frames_done} frames analyzed", end="\r", flush=True)
+        print()
+    wall = time.perf_counter() - started
+
+    for path, prefix, jobs in plans:
+        merge_parts([job.part_path for job in jobs], path, output_format)
+        for part in glob.glob(os.path.join(args.output_dir, f"{prefix}.part*.{output_format}")):
+            os.remove(part)
+        print(f"Wrote {path}")
+
+    if frames_done:
+        print(f"{frames_done} frames in {wall:.1f}s: {frames_done / wall:.1f} FPS total, "
+              f"{frames_done / busy_seconds:.1f} FPS per core with {args.jobs} workers")
+
+
+if __name__ == "__main__":
+    main()
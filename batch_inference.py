@@ -0,0 +1,127 @@
+"""
+Batch Inference
+Gather face crops from several frames and faces into one emotion model call
+Academic Project - Polis University
+"""
+
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+from emotion_backends import EMOTION_LABELS
+
+# One face crop waiting for inference, identified by the frame and face it came from
+CropRequest = namedtuple("CropRequest", ["frame_id", "face_index", "crop", "future"])
+
+
+def scores_to_dict(scores):
+    """Map an emotion score vector to {label: percent}"""
+    return {label: float(score) for label, score in zip(EMOTION_LABELS, scores)}
+
+
+class EmotionBatcher:
+    """Run the emotion model once per batch of crops
+
+    A batch is sent as soon as it holds `max_batch_size` crops or the oldest
+    crop has waited `max_wait` seconds, whichever comes first. A larger batch
+    and longer wait give more throughput, a small wait keeps latency low.
+    At most `max_pending` crops wait at a time, further ones are rejected
+    instead of piling up behind a slow model.
+    """
+
+    def __init__(self, model, max_batch_size=8, max_wait=0.05, max_pending=256):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.requests = queue.Queue(maxsize=max_pending)
+
+        # Statistics for tuning batch size against latency
+        self.batches_run = 0
+        self.crops_run = 0
+        self.rejected = 0
+
+        self.running = True
+        self.worker = threading.Thread(target=self._worker_loop, daemon=True)
+        self.worker.start()
+
+    def submit(self, frame_id, face_index, crop):
+        """Queue one face crop, returns a Future resolving to {label: percent}
+
+        The Future fails with queue.Full when max_pending crops are already waiting.
+        """
+        future = Future()
+        try:
+            self.requests.put_nowait(CropRequest(frame_id, face_index, crop, future))
+        except queue.Full:
+            self.rejected += 1
+            future.set_exception(queue.Full())
+        return future
+
+    def submit_faces(self, frame_id, crops):
+        """Queue every face crop of a frame, returns {(frame_id, face_index): Future}"""
+        return {
+            (frame_id, face_index): self.submit(frame_id, face_index, crop)
+            for face_index, crop in enumerate(crops)
+        }
+
+    def close(self):
+        """Stop the worker once queued crops are finished"""
+        self.running = False
+        self.requests.put(None)
+        self.worker.join(timeout=5.0)
+
+    def _collect_batch(self):
+        """Block for the first crop, then gather more until the batch is full or too old"""
+        first = self.requests.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                self.running = False
+                break
+            batch.append(request)
+        return batch
+
+    def _worker_loop(self):
+        """Run the model on each collected batch and resolve the futures"""
+        while self.running or not self.requests.empty():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+            try:
+                scores = self.model.predict_batch([r.crop for r in batch], self.max_batch_size)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            self.batches_run += 1
+            self.crops_run += len(batch)
+            for request, row in zip(batch, scores):
+                request.future.set_result(scores_to_dict(row))
+
+
+def predict_crops(model, items, max_batch_size=8):
+    """Synchronously score (frame_id, face_index, crop) items in batches
+
+    Returns {(frame_id, face_index): {label: percent}}. Used by headless
+    runs that already hold several frames and do not need a worker thread.
+    """
+    results = {}
+    for start in range(0, len(items), max_batch_size):
+        chunk = items[start:start + max_batch_size]
+        scores = model.predict_batch([crop for _, _, crop in chunk], max_batch_size)
+        for (frame_id, face_index, _), row in zip(chunk, scores):
+            results[(frame_id, face_index)] = scores_to_dict(row)
+    return results
@@ -0,0 +1,334 @@
+"""
+Benchmark Suite
+Time every pipeline stage on fixed frames and save the numbers as JSON
+Academic Project - Polis University
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from analysis_engine import AnalysisEngine
+from detector_backends import DETECTORS
+from tracks import box_iou
+
+RESOLUTIONS = {"480p": (480, 640), "720p": (720, 1280), "1080p": (1080, 1920)}
+FACE_COUNTS = (0, 1, 3)
+SEED = 1234
+
+
+def draw_face(frame, box, rng):
+    """Draw a simple face (skin ellipse, eyes with pupils, mouth) inside a box"""
+    x, y, w, h = box
+    skin = tuple(int(v) for v in rng.integers(120, 220, 3))
+    cv2.ellipse(frame, (x + w // 2, y + h // 2), (w // 2, h // 2), 0, 0, 360, skin, -1)
+    for ex in (x + w * 3 // 10, x + w * 7 // 10):
+        ey = y + h * 2 // 5
+        cv2.ellipse(frame, (ex, ey), (w // 9, h // 16), 0, 0, 360, (245, 245, 245), -1)
+        cv2.circle(frame, (ex + int(rng.integers(-2, 3)), ey), max(h // 22, 2), (30, 20, 20), -1)
+    cv2.ellipse(frame, (x + w // 2, y + h * 3 // 4), (w // 5, h // 14), 0, 0, 180, (60, 40, 120), 3)
+
+
+def synthetic_frame(height, width, faces, rng):
+    """Noisy background with `faces` non-overlapping drawn faces, returns (frame, boxes)"""
+    frame = rng.integers(40, 90, (height, width, 3), dtype=np.uint8)
+    frame = cv2.GaussianBlur(frame, (9, 9), 0)
+    boxes = []
+    side = height // 3
+    for i in range(faces):
+        x = int(width * (i + 0.5) / max(faces, 1) - side / 2)
+        box = (max(x, 0), height // 4, side, int(side * 1.2))
+        draw_face(frame, box, rng)
+        boxes.append(box)
+    return frame, boxes
+
+
+def recorded_frames(path, limit=8):
+    """Load up to `limit` real frames from an image folder or a video"""
+    from frame_sources import frames_from
+    frames = []
+    for _, _, frame in frames_from(path):
+        frames.append(frame)
+        if len(frames) >= limit:
+            break
+    return frames
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / 1024 if sys.platform != "darwin" else peak / (1024 * 1024)
+
+
+def current_rss_mb():
+    """Resident set size right now, the peak where /proc is not available"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def time_stage(fn, inputs, repeat, warmup=2):
+    """Run fn over the inputs `repeat` times, returns latency stats in ms"""
+    for item in inputs[:warmup]:
+        fn(item)
+    samples = []
+    for _ in range(repeat):
+        for item in inputs:
+            start = time.perf_counter_ns()
+            fn(item)
+            samples.append((time.perf_counter_ns() - start) / 1e6)
+    samples = np.array(samples)
+    total_seconds = samples.sum() / 1000
+    return {
+        "samples": int(len(samples)),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "mean_ms": float(samples.mean()),
+        "throughput_per_s": float(len(samples) / total_seconds) if total_seconds > 0 else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def tk_render_chain():
+    """The update_camera display chain, or None when no display is available"""
+    from PIL import Image, ImageTk
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+        root.withdraw()
+    except Exception:
+        root = None
+
+    def render(frame):
+        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        frame_pil = Image.fromarray(frame_rgb)
+        frame_pil.thumbnail((600, 450), Image.Resampling.LANCZOS)
+        if root is not None:
+            ImageTk.PhotoImage(frame_pil)
+    return render, root
+
+
+def preview_render(root):
+    """The PreviewRenderer display path, pasting into one PhotoImage when Tk is available"""
+    from render import PreviewRenderer
+    label = None
+    if root is not None:
+        from tkinter import ttk
+        label = ttk.Label(root)
+    renderer = PreviewRenderer(label, max_size=(600, 450))
+
+    def render(frame):
+        renderer.prepare(frame)
+        renderer.show()
+    return render
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def eye_rects(box):
+    """Both eye rectangles of a face drawn by draw_face"""
+    x, y, w, h = box
+    return [(ex - w // 8, y + h * 2 // 5 - h // 10, w // 4, h // 5) for ex in (x + w * 3 // 10, x + w * 7 // 10)]
+
+
+def detector_comparison(names, cases, repeat):
+    """Speed and recall of every detector backend on the same frames
+
+    On generated frames a drawn face counts as found when a detection
+    overlaps it by IoU >= 0.3; on recorded frames the true faces are unknown,
+    so only the faces per frame are reported. `two_eye_rate` is the share of
+    found faces that got two eyes, which attention needs.
+    """
+    results = {}
+    for name in names:
+        try:
+            engine = AnalysisEngine(emotion_backend=None, detector=name)
+        except (FileNotFoundError, cv2.error) as e:
+            print(f"Skipping detector {name}: {e}")
+            continue
+        results[name] = {}
+        for case, frames, boxes, detected in cases:
+            stats = time_stage(engine.detect_face_opencv, frames, repeat)
+            found, with_eyes, total, detections = 0, 0, 0, 0
+            for frame, truth in zip(frames, boxes):
+                faces = engine.detect_face_opencv(frame)
+                gray = engine.to_gray(frame)
+                detections += len(faces)
+                targets = faces if detected else [
+                    max(faces, key=lambda face: box_iou(face, box)) for box in truth
+                    if faces and max(box_iou(face, box) for face in faces) >= 0.3
+                ]
+                total += len(truth)
+                found += len(targets)
+                with_eyes += sum(len(engine.detect_eyes_in_face(gray, face)) >= 2 for face in targets)
+            stats["faces_per_frame"] = detections / len(frames)
+            stats["face_recall"] = found / total if total and not detected else None
+            stats["two_eye_rate"] = with_eyes / found if found else None
+            results[name][case] = stats
+    return results
+
+
+def benchmark_case(engine, frames, boxes, repeat, render, preview):
+    """All stages on one set of frames that share a resolution and face count"""
+    grays = [engine.to_gray(frame).copy() for frame in frames]
+    face_items = [(gray, box) for gray, frame_boxes in zip(grays, boxes) for box in frame_boxes]
+    eye_items = [(gray, eye) for gray, box in face_items for eye in eye_rects(box)[:1]]
+
+    stages = {
+        "gray": time_stage(lambda f: cv2.cvtColor(f, cv2.COLOR_BGR2GRAY), frames, repeat),
+        "detect_face_opencv": time_stage(engine.detect_face_opencv, frames, repeat),
+        "detect_attention": time_stage(engine.detect_attention, frames, repeat),
+        "render_tk_chain": time_stage(render, frames, repeat),
+        "render_preview": time_stage(preview, frames, repeat),
+    }
+    if face_items:
+        stages["detect_eyes_in_face"] = time_stage(lambda i: engine.detect_eyes_in_face(*i), face_items, repeat)
+        stages["analyze_eye_gaze"] = time_stage(lambda i: engine.analyze_eye_gaze(*i), eye_items, repeat)
+
+    if engine.emotion_backend is not None:
+        crops = [[engine.crop_face(frame, box) for box in frame_boxes]
+                 for frame, frame_boxes in zip(frames, boxes) if frame_boxes]
+        if crops:
+            stages["emotion_batch"] = time_stage(engine.emotion_model.predict_batch, crops, repeat)
+        if engine.emotion_backend in ("deepface", "fer"):
+            # Only the library backends had a full-frame call to compare with, ONNX never did
+            stages["emotion_full_frame"] = time_stage(full_frame_emotion(engine.emotion_backend), frames, repeat)
+        stages["end_to_end"] = time_stage(engine.analyze, frames, repeat)
+    else:
+        stages["end_to_end"] = time_stage(lambda f: engine.analyze(f, emotion=False), frames, repeat)
+    return stages
+
+
+def full_frame_emotion(backend):
+    """The library call the apps originally made on every full frame (deepface or fer)"""
+    if backend == "deepface":
+        from deepface import DeepFace
+        return lambda frame: DeepFace.analyze(frame, actions=['emotion'], enforce_detection=False)
+    from fer import FER
+    detector = FER(mtcnn=True)
+    return detector.detect_emotions
+
+
+def compare(current, baseline_path, threshold):
+    """Print stages whose p50 got slower than the baseline by more than threshold"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = 0
+    for case, stages in current["cases"].items():
+        for stage, stats in stages.items():
+            old = baseline.get("cases", {}).get(case, {}).get(stage)
+            if not old or old["p50_ms"] <= 0:
+                continue
+            change = stats["p50_ms"] / old["p50_ms"] - 1
+            marker = "REGRESSION" if change > threshold else ""
+            if marker:
+                regressions += 1
+            print(f"{case:22} {stage:22} {old['p50_ms']:9.2f} -> {stats['p50_ms']:9.2f} ms "
+                  f"({change * 100:+6.1f}%) {marker}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every stage of the analysis pipeline")
+    parser.add_argument("--backend", choices=["deepface", "fer", "onnx", "none"], default="none",
+                        help="emotion backend to include (needs the library installed)")
+    parser.add_argument("--resolutions", nargs="+", choices=list(RESOLUTIONS), default=list(RESOLUTIONS))
+    parser.add_argument("--faces", nargs="+", type=int, default=list(FACE_COUNTS))
+    parser.add_argument("--recorded", help="image folder or video with real frames, e.g. emotion_images/")
+    parser.add_argument("--frames", type=int, default=4, help="frames per case")
+    parser.add_argument("--repeat", type=int, default=5, help="passes over the frames of each case")
+    parser.add_argument("-o", "--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--detectors", nargs="+", choices=list(DETECTORS),
+                        help="compare the speed and recall of these face detector backends")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown counted as regression")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(SEED)
+    backend = None if args.backend == "none" else args.backend
+    engine = AnalysisEngine(emotion_backend=backend)
+
+    load_start = time.perf_counter()
+    engine.load_emotion_model()
+    model_load_seconds = time.perf_counter() - load_start
+
+    render, tk_root = tk_render_chain()
+    preview = preview_render(tk_root)
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "backend": args.backend,
+            "seed": SEED,
+            "photoimage_included": tk_root is not None,
+            "model_load_seconds": model_load_seconds,
+        },
+        "cases": {},
+    }
+
+    cases = []
+    for name in args.resolutions:
+        height, width = RESOLUTIONS[name]
+        for faces in args.faces:
+            generated = [synthetic_frame(height, width, faces, rng) for _ in range(args.frames)]
+            cases.append((f"{name}_{faces}faces", [g[0] for g in generated], [g[1] for g in generated], False))
+    if args.recorded:
+        frames = recorded_frames(args.recorded, args.frames)
+        # Real frames have unknown boxes, let the cascade find them once
+        boxes = [[tuple(int(v) for v in b) for b in engine.detect_face_opencv(f)] for f in frames]
+        cases.append(("recorded", frames, boxes, True))
+
+    if args.detectors:
+        results["detectors"] = detector_comparison(args.detectors, cases, args.repeat)
+        for name, detector_cases in results["detectors"].items():
+            for case, stats in detector_cases.items():
+                recall = "   n/a" if stats["face_recall"] is None else f"{stats['face_recall']:6.0%}"
+                eyes = "   n/a" if stats["two_eye_rate"] is None else f"{stats['two_eye_rate']:6.0%}"
+                print(f"  {name:6} {case:22} p50 {stats['p50_ms']:8.2f} ms  recall {recall}  "
+                      f"two eyes {eyes}  {stats['faces_per_frame']:.1f} faces/frame")
+
+    for case, frames, boxes, _ in cases:
+        print(f"{case}...", flush=True)
+        results["cases"][case] = benchmark_case(engine, frames, boxes, args.repeat, render, preview)
+        for stage, stats in results["cases"][case].items():
+            print(f"  {stage:22} p50 {stats['p50_ms']:8.2f} ms  p95 {stats['p95_ms']:8.2f} ms  "
+                  f"p99 {stats['p99_ms']:8.2f} ms  {stats['throughput_per_s']:8.1f}/s")
+
+    results["meta"]["peak_rss_mb"] = peak_rss_mb()
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
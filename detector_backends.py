@@ -0,0 +1,204 @@
+"""
+Detector Backends
+Face and eye detectors behind AnalysisEngine: Haar cascades, YuNet and a DNN SSD
+Academic Project - Polis University
+"""
+
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from tracks import box_iou
+
+MODEL_DIR = "models"
+
+
+class DetectorBackend:
+    """Interface of the face and eye detectors the engine can use
+
+    `detect_faces()` gets the frame already downscaled by the engine (gray
+    or BGR, as `color` asks for) and returns (faces, eyes) in the
+    coordinates of that image: face boxes, and for each face either its two
+    eye rectangles or None when the backend does not locate eyes.
+    `detect_eyes()` finds eyes inside one full-resolution face and is used
+    whenever no landmarks are known for that face.
+    """
+
+    name = "base"
+    color = False  # True when detect_faces needs the BGR frame instead of gray
+
+    def __init__(self):
+        self.eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
+
+    def detect_faces(self, image, min_size):
+        raise NotImplementedError
+
+    def detect_eyes(self, gray_frame, face_rect):
+        """Haar eye cascade on the upper part of the face, an (N, 4) int32 array in frame coordinates"""
+        x, y, w, h = face_rect
+        # Focus on upper half of face where eyes are typically located
+        roi_gray = gray_frame[y:y+int(h*0.6), x:x+w]
+        # The cascade's own array is shifted in place, no list of tuples per frame
+        eyes = np.asarray(self.eye_cascade.detectMultiScale(roi_gray, 1.1, 3), dtype=np.int32).reshape(-1, 4)
+        eyes[:, 0] += x
+        eyes[:, 1] += y
+        return eyes
+
+
+class HaarDetector(DetectorBackend):
+    """OpenCV's frontal face Haar cascade, eyes from the eye cascade"""
+
+    name = "haar"
+
+    def __init__(self, scale_factor=1.3, min_neighbors=5):
+        super().__init__()
+        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+
+    def detect_faces(self, image, min_size):
+        faces = self.face_cascade.detectMultiScale(image, self.scale_factor, self.min_neighbors,
+                                                   minSize=(min_size, min_size))
+        return [tuple(int(v) for v in face) for face in faces], [None] * len(faces)
+
+
+def eye_rects_from_landmarks(right_eye, left_eye):
+    """Square eye rectangles around two eye centers, sized by their distance, left to right"""
+    distance = float(np.hypot(left_eye[0] - right_eye[0], left_eye[1] - right_eye[1]))
+    side = max(int(round(distance * 0.5)), 2)
+    rects = [(int(round(cx - side / 2)), int(round(cy - side / 2)), side, side) for cx, cy in (right_eye, left_eye)]
+    return sorted(rects)
+
+
+class YuNetDetector(DetectorBackend):
+    """OpenCV's YuNet CNN (cv2.FaceDetectorYN): faces and five landmarks in one pass
+
+    Handles turned and small faces far better than the cascade, and the eye
+    landmarks replace the eye cascade for every detected face. Needs the
+    model file from the OpenCV model zoo (face_detection_yunet_2023mar.onnx).
+    """
+
+    name = "yunet"
+    color = True
+    default_path = os.path.join(MODEL_DIR, "face_detection_yunet_2023mar.onnx")
+
+    def __init__(self, path=None, score_threshold=0.7, nms_threshold=0.3):
+        super().__init__()
+        self.path = path or os.environ.get("YUNET_MODEL", self.default_path)
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"No YuNet model at {self.path}, download face_detection_yunet_2023mar.onnx "
+                                    "from the OpenCV model zoo")
+        self.detector = cv2.FaceDetectorYN.create(self.path, "", (320, 320), score_threshold, nms_threshold)
+        self.input_size = (320, 320)
+        self.lock = threading.Lock()  # One network instance, shared by the engine's threads
+
+    def detect_faces(self, image, min_size):
+        height, width = image.shape[:2]
+        with self.lock:
+            if self.input_size != (width, height):
+                self.detector.setInputSize((width, height))
+                self.input_size = (width, height)
+            _, detections = self.detector.detect(image)
+        faces, eyes = [], []
+        if detections is None:
+            return faces, eyes
+        for row in detections:
+            x, y, w, h = (int(round(v)) for v in row[:4])
+            if min(w, h) < min_size:
+                continue
+            # Clip to the image, YuNet boxes can reach past the border
+            x0, y0 = max(x, 0), max(y, 0)
+            faces.append((x0, y0, min(x + w, width) - x0, min(y + h, height) - y0))
+            eyes.append(eye_rects_from_landmarks(row[4:6], row[6:8]))
+        return faces, eyes
+
+
+class SSDDetector(DetectorBackend):
+    """ResNet-10 SSD face detector on OpenCV DNN, eyes from the eye cascade
+
+    Needs deploy.prototxt and res10_300x300_ssd_iter_140000.caffemodel from
+    the OpenCV samples.
+    """
+
+    name = "ssd"
+    color = True
+
+    def __init__(self, prototxt=None, weights=None, confidence=0.5):
+        super().__init__()
+        prototxt = prototxt or os.path.join(MODEL_DIR, "deploy.prototxt")
+        weights = weights or os.path.join(MODEL_DIR, "res10_300x300_ssd_iter_140000.caffemodel")
+        for path in (prototxt, weights):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Missing SSD face detector file {path}")
+        self.network = cv2.dnn.readNetFromCaffe(prototxt, weights)
+        self.confidence = confidence
+        self.lock = threading.Lock()
+
+    def detect_faces(self, image, min_size):
+        height, width = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(image, 1.0, (300, 300), (104.0, 177.0, 123.0))
+        with self.lock:
+            self.network.setInput(blob)
+            detections = self.network.forward()[0, 0]
+        detections = detections[detections[:, 2] >= self.confidence]
+        faces = []
+        for x0, y0, x1, y1 in detections[:, 3:7] * np.array([width, height, width, height]):
+            x0, y0 = max(int(x0), 0), max(int(y0), 0)
+            w, h = min(int(x1), width) - x0, min(int(y1), height) - y0
+            if min(w, h) >= min_size:
+                faces.append((x0, y0, w, h))
+        return faces, [None] * len(faces)
+
+
+class LandmarkEyes:
+    """Eye rectangles from the last detection, carried over to tracked face boxes
+
+    Between detections the face tracker moves the boxes. The eyes of the
+    stored box that overlaps a queried box most are moved and scaled with it.
+    """
+
+    def __init__(self, min_iou=0.3):
+        self.min_iou = min_iou
+        self.entries = []  # (face box, eye rects relative to the box as fractions)
+        self.lock = threading.Lock()
+
+    def store(self, faces, eyes):
+        entries = []
+        for (x, y, w, h), face_eyes in zip(faces, eyes):
+            if face_eyes is None or w <= 0 or h <= 0:
+                continue
+            relative = [((ex - x) / w, (ey - y) / h, ew / w, eh / h) for ex, ey, ew, eh in face_eyes]
+            entries.append(((x, y, w, h), relative))
+        with self.lock:
+            self.entries = entries
+
+    def lookup(self, face):
+        """Eye rectangles for a face box, or None when no stored face matches it"""
+        with self.lock:
+            entries = self.entries
+        best, best_iou = None, self.min_iou
+        for box, relative in entries:
+            overlap = box_iou(box, face)
+            if overlap >= best_iou:
+                best, best_iou = relative, overlap
+        if best is None:
+            return None
+        x, y, w, h = face
+        return [(int(round(x + rx * w)), int(round(y + ry * h)), max(int(round(rw * w)), 1),
+                 max(int(round(rh * h)), 1)) for rx, ry, rw, rh in best]
+
+
+DETECTORS = {
+    "haar": HaarDetector,
+    "yunet": YuNetDetector,
+    "ssd": SSDDetector,
+}
+
+
+def create_detector(name):
+    """Build the detector backend registered under `name`"""
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown detector backend: {name}")
+    return DETECTORS[name]()
@@ -0,0 +1,234 @@
+"""
+Emotion Backends
+Emotion classifiers that score a whole batch of face crops in one call
+Academic Project - Polis University
+"""
+
+import hashlib
+import json
+import os
+
+import cv2
+import numpy as np
+
+# Output order shared by the DeepFace and FER emotion models
+EMOTION_LABELS = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+
+
+def batch_bucket(count, max_batch_size):
+    """Round a batch up to a power of two so the model sees few distinct shapes"""
+    size = 1
+    while size < count:
+        size *= 2
+    return min(size, max(max_batch_size, count))
+
+
+class EmotionBackend:
+    """Interface of every emotion classifier the engine can use
+
+    A backend scores a list of BGR face crops with `predict_batch()` and
+    returns an (N, 7) array of percentages in EMOTION_LABELS order. The
+    common batching is implemented here; a backend provides `infer()`, which
+    runs its network on a zero-padded (N, H, W, 1) float32 batch, and can
+    override `normalize()` for its input scaling and `detect_faces()` when it
+    comes with its own face detector. `name`, `version` and `input_size` make
+    up the `cache_key` that keeps cached results of different models apart.
+    """
+
+    name = "base"
+    input_size = (48, 48)
+
+    def __init__(self):
+        self.version = "unknown"  # Library or model file version, part of every cached result's key
+
+    @property
+    def cache_key(self):
+        """Identifies the model and its input format in result cache keys"""
+        width, height = self.input_size
+        return f"{self.name}:{self.version}:{width}x{height}"
+
+    def preprocess(self, crop):
+        """Turn a BGR face crop into one normalized grayscale model input"""
+        gray = crop if crop.ndim == 2 else cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        gray = cv2.resize(gray, self.input_size, interpolation=cv2.INTER_AREA)
+        return self.normalize(gray.astype(np.float32))
+
+    def normalize(self, gray):
+        return gray / 255.0
+
+    def make_batch(self, crops, max_batch_size=32):
+        """Stack face crops into one zero-padded (N, H, W, 1) tensor"""
+        padded = batch_bucket(len(crops), max_batch_size)
+        width, height = self.input_size
+        tensor = np.zeros((padded, height, width, 1), dtype=np.float32)
+        for i, crop in enumerate(crops):
+            tensor[i, :, :, 0] = self.preprocess(crop)
+        return tensor
+
+    def predict_batch(self, crops, max_batch_size=32):
+        """Score face crops in one forward pass, returns an (N, 7) array in percent"""
+        if len(crops) == 0:
+            return np.zeros((0, len(EMOTION_LABELS)), dtype=np.float32)
+        tensor = self.make_batch(crops, max_batch_size)
+        scores = np.asarray(self.infer(tensor))[:len(crops)]
+        # Normalize like DeepFace does so every backend reports percentages
+        totals = scores.sum(axis=1, keepdims=True)
+        totals[totals == 0] = 1
+        return 100.0 * scores / totals
+
+    def infer(self, tensor):
+        """Raw class scores of an (N, H, W, 1) batch"""
+        raise NotImplementedError
+
+    def detect_faces(self, frame):
+        """Backends with their own face detector override this, None means use Haar"""
+        return None
+
+
+class KerasEmotionModel(EmotionBackend):
+    """Backend around a Keras network"""
+
+    def __init__(self):
+        super().__init__()
+        self.network = None
+
+    def infer(self, tensor):
+        return self.network.predict_on_batch(tensor)
+
+
+class DeepFaceEmotionModel(KerasEmotionModel):
+    """DeepFace's 48x48 grayscale emotion CNN, called directly on face crops"""
+
+    name = "deepface"
+    input_size = (48, 48)
+
+    def __init__(self):
+        super().__init__()
+        import deepface
+        from deepface import DeepFace
+
+        self.version = getattr(deepface, "__version__", "unknown")
+
+        try:
+            # Newer DeepFace releases group the emotion model under facial attributes
+            model = DeepFace.build_model(model_name="Emotion", task="facial_attribute")
+        except TypeError:
+            model = DeepFace.build_model("Emotion")
+        # Newer releases wrap the Keras network in a client object
+        self.network = getattr(model, "model", model)
+
+
+class FEREmotionModel(KerasEmotionModel):
+    """FER's mini-Xception classifier with its MTCNN face detector"""
+
+    name = "fer"
+    input_size = (64, 64)
+
+    def __init__(self, mtcnn=True):
+        super().__init__()
+        import fer
+        from fer import FER
+
+        self.version = getattr(fer, "__version__", "unknown")
+
+        self.detector = FER(mtcnn=mtcnn)
+        # FER keeps its Keras classifier private, batch it directly
+        self.network = self.detector._FER__emotion_classifier
+        self.input_size = tuple(self.network.input_shape[1:3])
+
+    def normalize(self, gray):
+        # Same scaling as FER._pre_process_input(v2=True)
+        return (gray / 255.0 - 0.5) * 2.0
+
+    def detect_faces(self, frame):
+        faces = self.detector.find_faces(frame, bgr=True)
+        return [tuple(int(v) for v in face) for face in faces]
+
+
+def file_digest(path):
+    """Short content hash of a model file, used as its version"""
+    digest = hashlib.blake2b(digest_size=6)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class OnnxEmotionModel(EmotionBackend):
+    """An exported (and usually int8-quantized) emotion CNN on ONNX Runtime or OpenCV DNN
+
+    The model comes from emotion_export.py, which writes a JSON file next to
+    it describing the input size and scaling of the network it was exported
+    from. ONNX Runtime is used when installed, otherwise OpenCV's DNN module,
+    so the backend needs neither TensorFlow nor Keras.
+    """
+
+    name = "onnx"
+    default_path = os.path.join("models", "emotion_int8.onnx")
+
+    def __init__(self, path=None, runtime=None, threads=None):
+        super().__init__()
+        self.path = path or os.environ.get("EMOTION_ONNX_MODEL", self.default_path)
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"No ONNX emotion model at {self.path}, create one with emotion_export.py")
+        self.version = file_digest(self.path)
+
+        info = {}
+        info_path = self.path + ".json"
+        if os.path.exists(info_path):
+            with open(info_path) as f:
+                info = json.load(f)
+        self.input_size = tuple(info.get("input_size", self.input_size))
+        self.scaling = info.get("scaling", "unit")  # "unit" = [0, 1] like DeepFace, "symmetric" = [-1, 1] like FER
+
+        if runtime is None:
+            try:
+                import onnxruntime  # noqa: F401
+                runtime = "onnxruntime"
+            except ImportError:
+                runtime = "opencv"
+        self.runtime = runtime
+
+        if runtime == "onnxruntime":
+            import onnxruntime
+            options = onnxruntime.SessionOptions()
+            if threads:
+                options.intra_op_num_threads = threads
+            self.session = onnxruntime.InferenceSession(self.path, options, providers=["CPUExecutionProvider"])
+            self.input_name = self.session.get_inputs()[0].name
+        elif runtime == "opencv":
+            self.session = cv2.dnn.readNetFromONNX(self.path)
+            self.session.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            self.session.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        else:
+            raise ValueError(f"Unknown ONNX runtime: {runtime}")
+
+    def normalize(self, gray):
+        if self.scaling == "symmetric":
+            return (gray / 255.0 - 0.5) * 2.0
+        return gray / 255.0
+
+    def infer(self, tensor):
+        if self.runtime == "onnxruntime":
+            return self.session.run(None, {self.input_name: tensor})[0]
+        self.session.setInput(tensor)
+        return self.session.forward()
+
+
+EMOTION_MODELS = {
+    "deepface": DeepFaceEmotionModel,
+    "fer": FEREmotionModel,
+    "onnx": OnnxEmotionModel,
+}
+
+
+def register_backend(name, factory):
+    """Make an EmotionBackend subclass (or factory) available as `emotion_backend=name`"""
+    EMOTION_MODELS[name] = factory
+
+
+def create_emotion_model(name):
+    """Build the emotion model registered under `name`"""
+    if name not in EMOTION_MODELS:
+        raise ValueError(f"Unknown emotion backend: {name}")
+    return EMOTION_MODELS[name]()
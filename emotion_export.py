@@ -0,0 +1,307 @@
+"""
+Emotion Model Export
+Export the Keras emotion CNN to ONNX, quantize it to int8 and check it against the original
+Academic Project - Polis University
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from emotion_backends import EMOTION_LABELS, OnnxEmotionModel, create_emotion_model
+
+
+# Probe name of DeepFace.analyze itself, the call the apps made before the EmotionBackend interface
+ORIGINAL_CALL = "deepface-analyze"
+
+
+class DeepFaceAnalyzeReference:
+    """Scores crops with DeepFace.analyze(..., enforce_detection=False), one call per crop
+
+    Unlike the deepface backend, DeepFace does its own detection, alignment
+    and preprocessing here, so comparing against it measures the drift from
+    the apps' original behaviour.
+    """
+
+    name = ORIGINAL_CALL
+
+    def __init__(self):
+        import deepface
+        from deepface import DeepFace
+
+        self.version = getattr(deepface, "__version__", "unknown")
+        self.analyze = DeepFace.analyze
+        # DeepFace builds its models on the first call, count that as loading
+        self.scores(np.zeros((48, 48, 3), dtype=np.uint8))
+
+    def scores(self, crop):
+        result = self.analyze(crop, actions=["emotion"], enforce_detection=False)
+        # Newer releases return one dict per detected face
+        emotions = (result[0] if isinstance(result, list) else result)["emotion"]
+        return [float(emotions[label]) for label in EMOTION_LABELS]
+
+    def predict_batch(self, crops, max_batch_size=32):
+        scores = np.array([self.scores(crop) for crop in crops], dtype=np.float32).reshape(-1, len(EMOTION_LABELS))
+        totals = scores.sum(axis=1, keepdims=True)
+        totals[totals == 0] = 1
+        return 100.0 * scores / totals
+
+
+def write_model_info(path, info):
+    """JSON file next to an ONNX model that tells OnnxEmotionModel how to feed it"""
+    with open(path + ".json", "w") as f:
+        json.dump(info, f, indent=2)
+
+
+def export_onnx(backend="deepface", path=os.path.join("models", "emotion.onnx"), opset=13):
+    """Convert the Keras network of a backend to a float32 ONNX model with a dynamic batch size"""
+    import tensorflow as tf
+    import tf2onnx
+
+    model = create_emotion_model(backend)
+    width, height = model.input_size
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    signature = (tf.TensorSpec((None, height, width, 1), tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(model.network, input_signature=signature, opset=opset, output_path=path)
+    write_model_info(path, {
+        "source": backend,
+        "source_version": model.version,
+        "input_size": [width, height],
+        "scaling": "symmetric" if backend == "fer" else "unit",
+        "labels": EMOTION_LABELS,
+    })
+    return path
+
+
+def reference_crops(folder, limit=256):
+    """Face crops of a reference image folder, in name order
+
+    Faces are found with the Haar cascade; images without a detectable face
+    are taken whole, so folders of pre-cropped faces (FER-2013 style) work too.
+    """
+    from analysis_engine import AnalysisEngine
+    from frame_sources import frames_from
+
+    engine = AnalysisEngine(emotion_backend=None)
+    crops = []
+    for _, _, frame in frames_from(folder):
+        faces = engine.detect_face_opencv(frame) if min(frame.shape[:2]) > 96 else []
+        if len(faces) == 0:
+            crops.append(frame.copy())
+        else:
+            crops.extend(engine.crop_face(frame, box).copy() for box in faces)
+        if len(crops) >= limit:
+            break
+    return crops[:limit]
+
+
+class CropCalibrationReader:
+    """Feeds preprocessed reference crops to the int8 calibration of ONNX Runtime"""
+
+    def __init__(self, model, crops, batch_size=8):
+        # Each batch is exactly its crops, zero padding would skew the activation ranges
+        chunks = [crops[i:i + batch_size] for i in range(0, len(crops), batch_size)]
+        self.batches = iter([{model.input_name: model.make_batch(chunk, len(chunk))} for chunk in chunks])
+
+    def get_next(self):
+        return next(self.batches, None)
+
+
+def quantize_int8(source, path, crops, per_channel=True, quant_format="qdq"):
+    """Static int8 quantization of an exported model, calibrated on face crops"""
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    if not crops:
+        raise ValueError("Int8 calibration needs at least one reference image")
+    model = OnnxEmotionModel(source, runtime="onnxruntime")
+    reader = CropCalibrationReader(model, crops)
+
+    with tempfile.TemporaryDirectory() as directory:
+        prepared = os.path.join(directory, "prepared.onnx")
+        quant_pre_process(source, prepared, skip_symbolic_shape=True)
+        quantize_static(
+            prepared, path, reader,
+            quant_format=QuantFormat.QDQ if quant_format == "qdq" else QuantFormat.QOperator,
+            activation_type=QuantType.QInt8, weight_type=QuantType.QInt8, per_channel=per_channel,
+        )
+    if os.path.exists(source + ".json"):
+        shutil.copyfile(source + ".json", path + ".json")
+    return path
+
+
+def score_crops(model, crops, batch_size=8):
+    """(N, 7) percentages of every crop, in batches"""
+    if not crops:
+        return np.zeros((0, len(EMOTION_LABELS)), dtype=np.float32)
+    return np.concatenate([model.predict_batch(crops[i:i + batch_size], batch_size)
+                           for i in range(0, len(crops), batch_size)])
+
+
+def crop_latency(model, crops, batch_size, repeat=3):
+    """Median milliseconds per crop when scoring `batch_size` crops per call"""
+    batches = [crops[i:i + batch_size] for i in range(0, len(crops), batch_size)]
+    samples = []
+    for _ in range(repeat):
+        for batch in batches:
+            start = time.perf_counter()
+            model.predict_batch(batch, batch_size)
+            samples.append((time.perf_counter() - start) * 1000 / len(batch))
+    return float(np.median(samples))
+
+
+def probe(backend, folder, scores_path, limit=256):
+    """Load one backend in this (fresh) process and measure it, used by `parity`"""
+    from benchmark import current_rss_mb, peak_rss_mb
+
+    crops = reference_crops(folder, limit)
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    model = DeepFaceAnalyzeReference() if backend == ORIGINAL_CALL else create_emotion_model(backend)
+    load_seconds = time.perf_counter() - start
+    scores = score_crops(model, crops)
+    np.save(scores_path, scores)
+    # Resident memory the loaded model keeps, not a difference of peaks
+    model_rss = current_rss_mb() - rss_before
+    return {
+        "backend": backend,
+        "version": model.version,
+        "load_seconds": load_seconds,
+        "ms_per_crop_batch1": crop_latency(model, crops, 1),
+        "ms_per_crop_batch8": crop_latency(model, crops, 8),
+        "model_rss_mb": model_rss,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_probe(backend, folder, scores_path, limit, onnx_path=None):
+    """Run `probe` in a child process so each backend's memory is measured on its own"""
+    env = dict(os.environ)
+    if onnx_path is not None:
+        env["EMOTION_ONNX_MODEL"] = onnx_path
+    command = [sys.executable, os.path.abspath(__file__), "probe", backend, folder,
+               "--scores", scores_path, "--limit", str(limit)]
+    output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def agreement(expected, actual):
+    """Dominant-emotion agreement and score differences of two (N, 7) score arrays"""
+    difference = np.abs(expected - actual)
+    return {
+        "crops": int(len(expected)),
+        "dominant_agreement": float((expected.argmax(axis=1) == actual.argmax(axis=1)).mean())
+        if len(expected) else 0.0,
+        "mean_abs_diff_points": float(difference.mean()) if len(expected) else 0.0,
+        "max_abs_diff_points": float(difference.max()) if len(expected) else 0.0,
+    }
+
+
+def parity(folder, onnx_path, reference="deepface", limit=256):
+    """Compare an ONNX model with the backend it was exported from on reference images
+
+    With the deepface reference the same crops are also scored by
+    DeepFace.analyze itself, and the ONNX model is compared with that too
+    (`original`), since the backend's own crop preprocessing differs from it.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        reference_scores = os.path.join(directory, "reference.npy")
+        candidate_scores = os.path.join(directory, "candidate.npy")
+        original_scores = os.path.join(directory, "original.npy")
+        reference_report = run_probe(reference, folder, reference_scores, limit)
+        candidate_report = run_probe("onnx", folder, candidate_scores, limit, onnx_path)
+        expected, actual = np.load(reference_scores), np.load(candidate_scores)
+        original = None
+        if reference == "deepface":
+            original_report = run_probe(ORIGINAL_CALL, folder, original_scores, limit)
+            original = dict(agreement(np.load(original_scores), actual), report=original_report)
+
+    return {
+        **agreement(expected, actual),
+        "original": original,
+        "reference": reference_report,
+        "candidate": candidate_report,
+        "speedup_batch1": reference_report["ms_per_crop_batch1"] / max(candidate_report["ms_per_crop_batch1"], 1e-9),
+        "speedup_batch8": reference_report["ms_per_crop_batch8"] / max(candidate_report["ms_per_crop_batch8"], 1e-9),
+        "memory_saved_mb": reference_report["model_rss_mb"] - candidate_report["model_rss_mb"],
+        "load_seconds_saved": reference_report["load_seconds"] - candidate_report["load_seconds"],
+    }
+
+
+def print_parity(report):
+    comparisons = [(f"vs {report['reference']['backend']} backend", report)]
+    if report["original"] is not None:
+        comparisons.append((f"vs {ORIGINAL_CALL}", report["original"]))
+    print(f"Crops compared:            {report['crops']}")
+    for title, row in comparisons:
+        print(f"{title}:")
+        print(f"  Same dominant emotion:   {row['dominant_agreement']:.1%}")
+        print(f"  Mean / max score change: {row['mean_abs_diff_points']:.2f} / "
+              f"{row['max_abs_diff_points']:.2f} points")
+    rows = [report["reference"], report["candidate"]]
+    if report["original"] is not None:
+        rows.append(report["original"]["report"])
+    for row in rows:
+        print(f"{row['backend']:10} load {row['load_seconds']:6.2f}s  "
+              f"{row['ms_per_crop_batch1']:7.2f} ms/crop (batch 1)  "
+              f"{row['ms_per_crop_batch8']:7.2f} ms/crop (batch 8)  model memory {row['model_rss_mb']:7.1f} MB")
+    print(f"Speedup {report['speedup_batch1']:.1f}x (batch 1), {report['speedup_batch8']:.1f}x (batch 8), "
+          f"{report['memory_saved_mb']:.0f} MB less memory, {report['load_seconds_saved']:.1f}s faster start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export, quantize and check the ONNX emotion backend")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="Keras model to float32 ONNX")
+    export.add_argument("--backend", choices=["deepface", "fer"], default="deepface")
+    export.add_argument("-o", "--output", default=os.path.join("models", "emotion.onnx"))
+
+    quantize = commands.add_parser("quantize", help="float32 ONNX to int8, calibrated on reference images")
+    quantize.add_argument("source", help="exported float32 model")
+    quantize.add_argument("images", help="folder of reference images (e.g. emotion_images/)")
+    quantize.add_argument("-o", "--output", default=OnnxEmotionModel.default_path)
+    quantize.add_argument("--format", choices=["qdq", "qoperator"], default="qdq",
+                          help="qoperator loads in older OpenCV DNN releases")
+    quantize.add_argument("--limit", type=int, default=256, help="calibration crops")
+
+    check = commands.add_parser("parity", help="compare the ONNX model with the original backend")
+    check.add_argument("images", help="folder of reference images")
+    check.add_argument("--model", default=OnnxEmotionModel.default_path)
+    check.add_argument("--reference", choices=["deepface", "fer"], default="deepface")
+    check.add_argument("--limit", type=int, default=256)
+    check.add_argument("--json", help="also save the report to this file")
+
+    measure = commands.add_parser("probe", help=argparse.SUPPRESS)
+    measure.add_argument("backend")
+    measure.add_argument("images")
+    measure.add_argument("--scores", required=True)
+    measure.add_argument("--limit", type=int, default=256)
+
+    args = parser.parse_args()
+    if args.command == "export":
+        print(f"Exported to {export_onnx(args.backend, args.output)}")
+    elif args.command == "quantize":
+        crops = reference_crops(args.images, args.limit)
+        path = quantize_int8(args.source, args.output, crops, quant_format=args.format)
+        before, after = os.path.getsize(args.source) / 1e6, os.path.getsize(path) / 1e6
+        print(f"Quantized to {path} with {len(crops)} calibration crops ({before:.1f} MB -> {after:.1f} MB)")
+    elif args.command == "parity":
+        report = parity(args.images, args.model, args.reference, args.limit)
+        print_parity(report)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+    elif args.command == "probe":
+        print(json.dumps(probe(args.backend, args.images, args.scores, args.limit)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Face Tracker
+Run the face cascade every N frames and follow faces with template matching in between
+Academic Project - Polis University
+"""
+
+import cv2
+import numpy as np
+
+
+class TrackedFace:
+    """Template and last known box of one followed face"""
+
+    __slots__ = ("box", "template", "scale", "confidence")
+
+    def __init__(self, box, template, scale):
+        self.box = box
+        self.template = template
+        self.scale = scale        # Template resolution relative to the full frame
+        self.confidence = 1.0     # Normalized correlation of the last match
+
+
+class FaceTracker:
+    def __init__(self, detect_every=10, min_confidence=0.6, search_margin=0.4, template_width=32):
+        # Full detection runs at least every `detect_every` frames
+        self.detect_every = detect_every
+        # A match weaker than this forces a new detection on the next frame
+        self.min_confidence = min_confidence
+        # Search window grows the last box by this fraction on each side
+        self.search_margin = search_margin
+        # Faces are matched at this template width, so large faces stay cheap
+        self.template_width = template_width
+
+        self.faces = []
+        self.frames_since_detection = detect_every
+        self.detections = 0
+        self.tracked_frames = 0
+
+    def reset(self):
+        """Forget all faces so the next update runs a full detection"""
+        self.faces = []
+        self.frames_since_detection = self.detect_every
+
+    def needs_detection(self):
+        if self.frames_since_detection >= self.detect_every or not self.faces:
+            return True
+        return any(face.confidence < self.min_confidence for face in self.faces)
+
+    def update(self, gray, detect_fn):
+        """Return face boxes for this frame, detecting or tracking as needed
+
+        `detect_fn()` runs the full detector and returns (x, y, w, h) boxes.
+        The second return value tells whether a full detection ran.
+        """
+        if self.needs_detection():
+            boxes = [tuple(int(v) for v in box) for box in detect_fn()]
+            self.faces = [self._make_face(gray, box) for box in boxes]
+            self.frames_since_detection = 1
+            self.detections += 1
+            return boxes, True
+
+        for face in self.faces:
+            self._track(gray, face)
+        self.frames_since_detection += 1
+        self.tracked_frames += 1
+        return [face.box for face in self.faces], False
+
+    def _make_face(self, gray, box):
+        """Cut a small template of the face from the grayscale frame"""
+        x, y, w, h = box
+        scale = min(1.0, self.template_width / max(w, 1))
+        roi = gray[y:y + h, x:x + w]
+        template = cv2.resize(roi, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return TrackedFace(box, template, scale)
+
+    def _track(self, gray, face):
+        """Move the face box to the best template match inside a small search window"""
+        x, y, w, h = face.box
+        pad_x, pad_y = int(w * self.search_margin), int(h * self.search_margin)
+        x0, y0 = max(x - pad_x, 0), max(y - pad_y, 0)
+        x1, y1 = min(x + w + pad_x, gray.shape[1]), min(y + h + pad_y, gray.shape[0])
+
+        window = cv2.resize(gray[y0:y1, x0:x1], None, fx=face.scale, fy=face.scale,
+                            interpolation=cv2.INTER_AREA)
+        th, tw = face.template.shape
+        if window.shape[0] < th or window.shape[1] < tw:
+            # Face is leaving the frame, let the next detection decide
+            face.confidence = 0.0
+            return
+
+        scores = cv2.matchTemplate(window, face.template, cv2.TM_CCOEFF_NORMED)
+        _, best, _, (mx, my) = cv2.minMaxLoc(scores)
+        face.confidence = float(best) if np.isfinite(best) else 0.0
+        face.box = (x0 + int(mx / face.scale), y0 + int(my / face.scale), w, h)
@@ -0,0 +1,187 @@
+"""
+Frame Bus
+Single camera capture thread shared by every consumer of the video feed
+Academic Project - Polis University
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# A captured frame: `image` is a view into the bus ring buffer (no copy)
+FramePacket = namedtuple("FramePacket", ["frame_id", "timestamp", "image", "slot"])
+
+
+class FrameBus:
+    """Capture frames on one thread into a fixed ring of preallocated buffers"""
+
+    def __init__(self, source=0, slots=6, fps=None, loop=False):
+        # An opened VideoCapture, or anything with the same read(image)/grab() interface
+        if hasattr(source, "read"):
+            self.cap = source
+        else:
+            self.cap = cv2.VideoCapture(source)
+        if not self.cap.isOpened():
+            raise ValueError("Unable to open camera")
+
+        # Read one frame to learn the resolution before allocating the ring
+        ret, first = self.cap.read()
+        if not ret:
+            self.cap.release()
+            raise ValueError("Unable to read from camera")
+
+        # Video files decode as fast as the CPU allows, `fps` paces them like a
+        # camera and `loop` starts them over at the end
+        self.fps = fps
+        self.loop = loop
+        self.next_read = 0.0
+        self.ended = False        # A non-looping file reached its last frame
+        self.read_failures = 0    # Failed reads in a row
+
+        self.shape = first.shape
+        self.frames = np.empty((slots,) + first.shape, dtype=first.dtype)
+        self.frame_ids = [-1] * slots     # -1 means the slot holds no valid frame
+        self.timestamps = [0.0] * slots
+        self.pins = [0] * slots           # Consumers currently reading each slot
+
+        self.latest_slot = 0
+        self.next_frame_id = 0
+        self.dropped_frames = 0
+        self.capture_latency = 0.0  # Moving average of cap.read() time in seconds
+        self._publish(0, first)
+
+        self.condition = threading.Condition()
+        self.running = False
+        self.capture_thread = None
+
+    def start(self):
+        """Start the capture thread"""
+        self.running = True
+        self.capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self.capture_thread.start()
+        return self
+
+    def stop(self):
+        """Stop capturing and release the camera"""
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+        if self.capture_thread is not None:
+            self.capture_thread.join(timeout=1.0)
+        self.cap.release()
+
+    def _publish(self, slot, image=None):
+        """Mark a slot as the newest frame, copying `image` in if it was reallocated"""
+        # Indexing makes a new view object every time, so compare memory, not identity
+        if image is not None and not np.shares_memory(image, self.frames[slot]):
+            if image.shape != self.shape:
+                return False
+            np.copyto(self.frames[slot], image)
+        self.frame_ids[slot] = self.next_frame_id
+        self.timestamps[slot] = time.monotonic()
+        self.latest_slot = slot
+        self.next_frame_id += 1
+        return True
+
+    def _free_slot(self):
+        """Find the oldest slot that nobody is reading"""
+        slots = len(self.frame_ids)
+        for offset in range(1, slots):
+            slot = (self.latest_slot + offset) % slots
+            if self.pins[slot] == 0:
+                return slot
+        return None
+
+    def _capture_loop(self):
+        """Continuously read camera frames into the ring buffer"""
+        while self.running:
+            with self.condition:
+                slot = self._free_slot()
+                if slot is None:
+                    # Every buffer is pinned by a consumer, wait for one to be released
+                    self.condition.wait_for(lambda: not self.running or self._free_slot() is not None,
+                                            timeout=0.05)
+                    slot = self._free_slot()
+                if slot is not None:
+                    # Invalidate the slot while the camera writes into it
+                    self.frame_ids[slot] = -1
+
+            if slot is None:
+                # Still pinned: drop a frame so the camera does not fall behind
+                self.cap.grab()
+                self.dropped_frames += 1
+                continue
+
+            if self.fps:
+                delay = self.next_read - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                self.next_read = max(self.next_read, time.monotonic()) + 1.0 / self.fps
+
+            start = time.perf_counter()
+            ret, image = self.cap.read(self.frames[slot])
+            self.capture_latency += 0.1 * (time.perf_counter() - start - self.capture_latency)
+            if not ret:
+                at_end = self._at_end()
+                if self.loop and at_end:
+                    # Only files are rewound, a live camera that fails backs off below
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                if at_end:
+                    # Nothing more will come, wake consumers waiting in acquire()
+                    with self.condition:
+                        self.ended = True
+                        self.running = False
+                        self.condition.notify_all()
+                    break
+                # A camera that hiccups: back off up to half a second instead of spinning
+                self.read_failures += 1
+                time.sleep(min(0.01 * 2 ** min(self.read_failures, 6), 0.5))
+                continue
+            self.read_failures = 0
+
+            with self.condition:
+                if self._publish(slot, image):
+                    self.condition.notify_all()
+
+    def _at_end(self):
+        """True when the source is a file whose last frame was read"""
+        frame_count = self.cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        return frame_count > 0 and self.cap.get(cv2.CAP_PROP_POS_FRAMES) >= frame_count
+
+    def acquire(self, after_id=-1, timeout=None):
+        """Pin and return the newest frame newer than `after_id`
+
+        Frames between `after_id` and the newest one are skipped on purpose so
+        consumers always work on the latest image. Returns None on timeout.
+        The caller must hand the packet back with `release()`.
+        """
+        with self.condition:
+            if not self.condition.wait_for(
+                lambda: not self.running or self.frame_ids[self.latest_slot] > after_id,
+                timeout=timeout
+            ):
+                return None
+
+            slot = self.latest_slot
+            frame_id = self.frame_ids[slot]
+            if frame_id <= after_id:
+                return None
+            self.pins[slot] += 1
+            return FramePacket(frame_id, self.timestamps[slot], self.frames[slot], slot)
+
+    def release(self, packet):
+        """Unpin a frame returned by `acquire()`"""
+        with self.condition:
+            self.pins[packet.slot] -= 1
+            if self.pins[packet.slot] == 0:
+                # The capture thread may be waiting for a free slot
+                self.condition.notify_all()
+
+    @property
+    def latest_frame_id(self):
+        """ID of the most recently captured frame"""
+        return self.frame_ids[self.latest_slot]
@@ -0,0 +1,134 @@
+"""
+Frame Sources
+Iterate frames from cameras, video files, image folders or numpy arrays
+Academic Project - Polis University
+"""
+
+import os
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+SourceFrame = namedtuple("SourceFrame", ["frame_id", "timestamp", "image"])
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def camera_frames(index=0):
+    """Yield frames from a live camera until it stops delivering"""
+    cap = cv2.VideoCapture(index)
+    if not cap.isOpened():
+        raise ValueError("Unable to open camera")
+    try:
+        frame_id = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield SourceFrame(frame_id, time.time(), frame)
+            frame_id += 1
+    finally:
+        cap.release()
+
+
+def video_frames(path, start=0, stop=None, stride=1):
+    """Yield frames from a video file, timestamps are seconds into the video
+
+    Only every `stride`-th frame between `start` and `stop` is decoded, the
+    frames in between are skipped with grab() which avoids decoding them.
+    """
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f"Unable to open video: {path}")
+    try:
+        if start:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        frame_id = start
+        while stop is None or frame_id < stop:
+            if (frame_id - start) % stride:
+                if not cap.grab():
+                    break
+            else:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                yield SourceFrame(frame_id, cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0, frame)
+            frame_id += 1
+    finally:
+        cap.release()
+
+
+def video_frame_count(path):
+    """Number of frames the container reports for a video"""
+    cap = cv2.VideoCapture(path)
+    try:
+        return int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        cap.release()
+
+
+def list_images(path):
+    """Image file names of a folder in name order"""
+    return sorted(n for n in os.listdir(path) if n.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def image_dir_frames(path, start=0, stop=None, stride=1):
+    """Yield every readable image of a folder in name order
+
+    The frame ID is the image's position in the folder listing.
+    """
+    names = list_images(path)
+    for frame_id in range(start, len(names) if stop is None else min(stop, len(names)), stride):
+        frame = cv2.imread(os.path.join(path, names[frame_id]))
+        if frame is None:
+            continue
+        yield SourceFrame(frame_id, float(frame_id), frame)
+
+
+def array_frames(array):
+    """Yield frames from a single HxWx3 image or an NxHxWx3 stack"""
+    array = np.asarray(array)
+    if array.ndim == 3:
+        array = array[np.newaxis]
+    for frame_id, frame in enumerate(array):
+        yield SourceFrame(frame_id, float(frame_id), frame)
+
+
+def bus_frames(frame_bus):
+    """Yield the newest frames of a running FrameBus without copying them"""
+    last_frame_id = -1
+    while frame_bus.running:
+        packet = frame_bus.acquire(after_id=last_frame_id, timeout=1.0)
+        if packet is None:
+            continue
+        last_frame_id = packet.frame_id
+        try:
+            yield SourceFrame(packet.frame_id, packet.timestamp, packet.image)
+        finally:
+            frame_bus.release(packet)
+
+
+def frames_from(source):
+    """Pick the right frame iterator for a camera index, path, array or iterable"""
+    if isinstance(source, int):
+        return camera_frames(source)
+    if isinstance(source, np.ndarray):
+        return array_frames(source)
+    if isinstance(source, (str, os.PathLike)):
+        if os.path.isdir(source):
+            return image_dir_frames(source)
+        return video_frames(os.fspath(source))
+    if hasattr(source, "acquire") and hasattr(source, "release"):
+        return bus_frames(source)
+    return _wrap_iterable(source)
+
+
+def _wrap_iterable(frames):
+    """Number plain frames from an arbitrary iterable"""
+    for frame_id, item in enumerate(frames):
+        if isinstance(item, tuple) and len(item) == 3:
+            yield SourceFrame(*item)
+        else:
+            yield SourceFrame(frame_id, float(frame_id), item)
@@ -0,0 +1,325 @@
+"""
+Instrumentation
+Stage timings, counters and loop rates with an overlay, a periodic dump and a Prometheus endpoint
+Academic Project - Polis University
+"""
+
+import gc
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+
+class RingHistogram:
+    """Last `size` samples of a latency in a preallocated ring buffer"""
+
+    def __init__(self, size=512):
+        self.samples = np.zeros(size, dtype=np.float64)
+        self.index = 0
+        self.count = 0      # Samples ever recorded
+        self.total = 0.0    # Sum of all samples ever recorded
+
+    def add(self, value):
+        self.samples[self.index] = value
+        self.index = (self.index + 1) % len(self.samples)
+        self.count += 1
+        self.total += value
+
+    def quantiles(self, qs=(0.5, 0.95, 0.99)):
+        filled = self.samples[:min(self.count, len(self.samples))]
+        if len(filled) == 0:
+            return {q: 0.0 for q in qs}
+        values = np.quantile(filled, qs)
+        return {q: float(v) for q, v in zip(qs, values)}
+
+
+class RateMeter:
+    """Effective rate of a loop from the timestamps of its last iterations"""
+
+    def __init__(self, size=64):
+        self.stamps = np.zeros(size, dtype=np.float64)
+        self.index = 0
+        self.count = 0
+
+    def tick(self, now):
+        self.stamps[self.index] = now
+        self.index = (self.index + 1) % len(self.stamps)
+        self.count += 1
+
+    def rate(self):
+        filled = min(self.count, len(self.stamps))
+        if filled < 2:
+            return 0.0
+        newest = self.stamps[(self.index - 1) % len(self.stamps)]
+        oldest = self.stamps[self.index % len(self.stamps)] if self.count > len(self.stamps) else self.stamps[0]
+        span = newest - oldest
+        return float((filled - 1) / span) if span > 0 else 0.0
+
+
+class GCMonitor:
+    """Duration of every garbage collector run, through gc.callbacks
+
+    Pauses go to a RingHistogram and `max_pause` keeps the longest one
+    since `start()`. The callback runs wherever the collector interrupts a
+    thread, so it takes no locks; `publish()` copies the figures into Metrics.
+    """
+
+    def __init__(self, size=512):
+        self.pauses = RingHistogram(size)
+        self.max_pause = 0.0
+        self.collections = [0, 0, 0]  # Runs per generation
+        self.started = None
+
+    def _callback(self, phase, info):
+        if phase == "start":
+            self.started = time.perf_counter()
+            return
+        if self.started is None:
+            return
+        pause = time.perf_counter() - self.started
+        self.started = None
+        self.pauses.add(pause)
+        self.max_pause = max(self.max_pause, pause)
+        self.collections[info["generation"]] += 1
+
+    def start(self):
+        if self._callback not in gc.callbacks:
+            gc.callbacks.append(self._callback)
+        return self
+
+    def stop(self):
+        if self._callback in gc.callbacks:
+            gc.callbacks.remove(self._callback)
+
+    def reset(self):
+        """Forget the pauses so far, e.g. those of startup"""
+        self.pauses = RingHistogram(len(self.pauses.samples))
+        self.max_pause = 0.0
+
+    def report(self):
+        """Pause quantiles and the longest pause in milliseconds, runs per generation"""
+        q = self.pauses.quantiles((0.5, 0.99))
+        return {
+            "gc_pause_p50_ms": q[0.5] * 1000,
+            "gc_pause_p99_ms": q[0.99] * 1000,
+            "gc_pause_max_ms": self.max_pause * 1000,
+            "gc_collections": list(self.collections),
+        }
+
+    def publish(self, metrics):
+        report = self.report()
+        collections = report.pop("gc_collections")
+        for name, value in report.items():
+            metrics.gauge(name, round(value, 3))
+        metrics.gauge("gc_full_collections", collections[2])
+
+
+class _Timer:
+    """Context manager recording its duration into a Metrics stage"""
+
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """Collects stage latencies, event counters, gauges and loop rates"""
+
+    enabled = True
+
+    def __init__(self, histogram_size=512, prefix="emotion_app"):
+        self.histogram_size = histogram_size
+        self.prefix = prefix
+        self.stages = {}
+        self.counters = {}
+        self.gauges = {}
+        self.loops = {}
+        self.lock = threading.Lock()
+        self.server = None
+        self.dump_thread = None
+        self.running = False
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = RingHistogram(self.histogram_size)
+            histogram.add(seconds)
+
+    def timer(self, stage):
+        return _Timer(self, stage)
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+    def tick(self, loop):
+        """Mark one iteration of a loop, used to compute its effective FPS"""
+        with self.lock:
+            meter = self.loops.get(loop)
+            if meter is None:
+                meter = self.loops[loop] = RateMeter()
+            meter.tick(time.monotonic())
+
+    def snapshot(self):
+        """Plain dict of everything collected so far"""
+        with self.lock:
+            stages = {}
+            for stage, histogram in self.stages.items():
+                q = histogram.quantiles()
+                stages[stage] = {
+                    "count": histogram.count,
+                    "p50_ms": q[0.5] * 1000, "p95_ms": q[0.95] * 1000, "p99_ms": q[0.99] * 1000,
+                }
+            return {
+                "stages": stages,
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "fps": {loop: meter.rate() for loop, meter in self.loops.items()},
+            }
+
+    def prometheus_text(self):
+        """Metrics in the Prometheus text exposition format"""
+        p = self.prefix
+        lines = [f"# TYPE {p}_stage_latency_seconds summary"]
+        with self.lock:
+            for stage, histogram in sorted(self.stages.items()):
+                for q, value in histogram.quantiles().items():
+                    lines.append(f'{p}_stage_latency_seconds{{stage="{stage}",quantile="{q}"}} {value:.6f}')
+                lines.append(f'{p}_stage_latency_seconds_sum{{stage="{stage}"}} {histogram.total:.6f}')
+                lines.append(f'{p}_stage_latency_seconds_count{{stage="{stage}"}} {histogram.count}')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {p}_{name} counter")
+                lines.append(f"{p}_{name} {value}")
+            for name, value in sorted(self.gauges.items()):
+                lines.append(f"# TYPE {p}_{name} gauge")
+                lines.append(f"{p}_{name} {value}")
+            lines.append(f"# TYPE {p}_loop_fps gauge")
+            for loop, meter in sorted(self.loops.items()):
+                lines.append(f'{p}_loop_fps{{loop="{loop}"}} {meter.rate():.2f}')
+        return "\n".join(lines) + "\n"
+
+    def overlay_lines(self):
+        """Short text lines for the on-frame overlay"""
+        snapshot = self.snapshot()
+        lines = [" ".join(f"{loop} {fps:.1f}fps" for loop, fps in sorted(snapshot["fps"].items()))]
+        for stage, stats in sorted(snapshot["stages"].items()):
+            lines.append(f"{stage}: {stats['p50_ms']:.1f}/{stats['p95_ms']:.1f} ms")
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"{name}: {value}")
+        return lines
+
+    def draw_overlay(self, frame):
+        """Draw the metrics in the top right corner, next to the emotion text"""
+        lines = self.overlay_lines()
+        width = 190
+        x = max(frame.shape[1] - width - 10, 0)
+        cv2.rectangle(frame, (x, 10), (frame.shape[1] - 10, 18 + 15 * len(lines)), (0, 0, 0), -1)
+        for i, line in enumerate(lines):
+            cv2.putText(frame, line, (x + 4, 23 + 15 * i), cv2.FONT_HERSHEY_SIMPLEX, 0.38, (255, 255, 255), 1)
+
+    def start_dump(self, interval, path=None):
+        """Every `interval` seconds print (or append to `path`) a JSON snapshot"""
+        self.running = True
+
+        def dump_loop():
+            while self.running:
+                time.sleep(interval)
+                line = json.dumps(dict(self.snapshot(), time=time.time()))
+                if path is None:
+                    print(line, flush=True)
+                else:
+                    with open(path, "a") as f:
+                        f.write(line + "\n")
+
+        self.dump_thread = threading.Thread(target=dump_loop, daemon=True)
+        self.dump_thread.start()
+
+    def serve(self, port=9100, host="127.0.0.1"):
+        """Serve /metrics in Prometheus format on a local port"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("/metrics", ""):
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server.server_address
+
+    def close(self):
+        self.running = False
+        if self.server is not None:
+            self.server.shutdown()
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class NullMetrics:
+    """Drop-in replacement that records nothing, used when metrics are off"""
+
+    enabled = False
+    _timer = _NullTimer()
+
+    def observe(self, stage, seconds):
+        pass
+
+    def timer(self, stage):
+        return self._timer
+
+    def count(self, name, amount=1):
+        pass
+
+    def gauge(self, name, value):
+        pass
+
+    def tick(self, loop):
+        pass
+
+    def snapshot(self):
+        return {"stages": {}, "counters": {}, "gauges": {}, "fps": {}}
+
+    def draw_overlay(self, frame):
+        pass
+
+    def close(self):
+        pass
+
+
+NULL_METRICS = NullMetrics()
@@ -4,43 +4,103 @@ Uses face recognition to detect emotions in real-time
 Academic Project - Polis University
 """
 
+import argparse
 import cv2
+import gc
 import numpy as np
-from deepface import DeepFace
 import tkinter as tk
 from tkinter import ttk
 import threading
 import time
-from PIL import Image, ImageTk
+from analysis_engine import AnalysisEngine, AttentionResult, LOOKING, NOT_LOOKING
+from frame_bus import FrameBus
+from instrumentation import GCMonitor, Metrics, NULL_METRICS
+from motion_gate import MotionGate
+from render import PreviewRenderer
+from result_cache import ResultCache
+from scheduler import AdaptiveScheduler
+from session_log import SessionRecorder
+from temporal import EmotionSmoother
+from worker_pool import InferencePool
 
 class EmotionRecognitionApp:
-    def __init__(self, root):
+    def __init__(self, root, workers=0, metrics=None, metrics_overlay=False, emotion_backend="deepface",
+                 detector="haar", record_path=None, long_running=False, motion_gate=None):
         self.root = root
         self.root.title("Emotion Recognition App - Polis University")
         self.root.geometry("900x600")
         
-        # Initialize camera
-        self.cap = cv2.VideoCapture(0)
-        if not self.cap.isOpened():
-            raise ValueError("Unable to open camera")
+        # Initialize camera - one capture thread shared by every consumer
+        self.frame_bus = FrameBus(0).start()
+        
+        # Stage timings, loop rates and failure counts (no-op unless enabled)
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self.metrics_overlay = metrics_overlay
+        
+        # Kiosk mode: once the model is loaded, everything alive so far is moved out of
+        # the collector's reach and GC pauses are measured (see freeze_heap)
+        self.long_running = long_running
+        self.heap_frozen = False
+        self.gc_monitor = GCMonitor().start() if long_running else None
+        
+        # Optional binary log of every face on every analyzed frame, written off the Tk thread
+        self.recorder = SessionRecorder(record_path) if record_path else None
+        
+        # Display and emotion rates follow measured stage latencies and CPU load
+        self.scheduler = AdaptiveScheduler(target_fps=30, target_emotion_hz=4, metrics=self.metrics)
         
         # Current emotion state
         self.current_emotion = None
         self.current_confidence = 0.0
+        self.emotion_frame_id = -1  # Frame the current emotion was computed from
+        self.pending_emotions = None  # Set by the emotion or pool thread, shown by the Tk loop
         
         # Attention detection state
-        self.attention_status = "Not looking at screen"  # "Looking at screen", "Not looking at screen"
-        
-        # Initialize OpenCV face and eye detectors
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        self.eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
+        self.attention_status = NOT_LOOKING  # LOOKING or NOT_LOOKING
+        self.attention_frame_id = -1  # Frame the current attention status was computed from
+        self.tracked_faces = ([], [])  # (boxes, track IDs) from the attention path, reused by the emotion thread
+        
+        # With a MotionGate the face, eye and emotion stages drop to a low rate while
+        # nobody is in view and nothing moves, and wake on the first frame with motion
+        self.motion_gate = motion_gate
+        
+        # Face, eye, gaze and emotion pipeline (DeepFace unless another backend is chosen)
+        # Face cascade runs every 5th frame, faces are tracked in between, and
+        # faces that barely changed since their last inference are not re-scored.
+        # Near-identical crops seen earlier come from an in-memory result cache
+        self.engine = AnalysisEngine(emotion_backend=emotion_backend, detect_every=5, change_threshold=4.0,
+                                     result_cache=ResultCache(), cache_near=True, metrics=self.metrics,
+                                     detector=detector,
+                                     motion_gate=motion_gate)
+        
+        # Emotions are smoothed over time, the panel only redraws when they change
+        self.smoother = EmotionSmoother()
+        
+        # With workers > 0 attention and emotions run in separate processes, fed through
+        # shared memory, otherwise attention runs in the Tk loop and emotions in a thread
+        self.pool = None
+        if workers > 0:
+            self.pool = InferencePool(
+                workers, max_frame_shape=self.frame_bus.shape,
+                emotion_backend=emotion_backend, change_threshold=4.0, result_cache=ResultCache(),
+                cache_near=True, detector=detector, on_result=self.on_pool_result
+            )
+        else:
+            # Build and warm up the model in the background while the camera feed is shown
+            self.engine.start_loading()
+        # Tracks shown on screen, with workers the pool's (IDs shared across workers)
+        self.tracks = self.pool.tracks if self.pool is not None else self.engine.tracks
+        self.pool_attention = AttentionResult()  # Latest attention from the workers
+        self.model_status_shown = False
+        self.pool_error_shown = False
         
         # Create GUI
         self.setup_gui()
         
         # Start emotion detection thread
         self.running = True
-        self.detection_thread = threading.Thread(target=self.detect_emotions, daemon=True)
+        detection_loop = self.feed_workers if self.pool is not None else self.detect_emotions
+        self.detection_thread = threading.Thread(target=detection_loop, daemon=True)
         self.detection_thread.start()
         
         # Update camera feed
@@ -58,6 +118,7 @@ class EmotionRecognitionApp:
         
         self.camera_label = ttk.Label(camera_frame)
         self.camera_label.pack()
+        self.renderer = PreviewRenderer(self.camera_label, max_size=(600, 450))
         
         # Emotion display frame
         emotion_frame = ttk.LabelFrame(main_frame, text="Detected Emotion", padding="20")
@@ -74,7 +135,7 @@ class EmotionRecognitionApp:
         # Confidence label
         self.confidence_label = ttk.Label(
             emotion_frame, 
-            text="Waiting for detection...", 
+            text="Loading emotion model...", 
             font=("Arial", 14)
         )
         self.confidence_label.pack(pady=10)
@@ -113,35 +174,85 @@ class EmotionRecognitionApp:
         
     def detect_emotions(self):
         """Continuously detect emotions from camera feed"""
+        last_frame_id = -1
         while self.running:
-            ret, frame = self.cap.read()
-            if not ret:
+            # Nothing to score while the scene is idle, the attention path wakes the gate
+            if self.motion_gate is not None and not self.motion_gate.awake.wait(timeout=1.0):
+                continue
+            packet = self.frame_bus.acquire(after_id=last_frame_id, timeout=1.0)
+            if packet is None:
                 continue
+            last_frame_id = packet.frame_id
                 
             try:
-                # Use DeepFace to analyze emotions
-                result = DeepFace.analyze(frame, actions=['emotion'], enforce_detection=False)
-                
-                if isinstance(result, list):
-                    result = result[0]
-                
-                # Get emotion data
-                emotions = result.get('emotion', {})
-                if emotions:
-                    dominant_emotion = max(emotions, key=emotions.get)
-                    emotion_score = emotions[dominant_emotion]
-                    
-                    # Update emotion if confidence is high enough
-                    if emotion_score > 30:  # Threshold for emotion confidence
-                        self.current_emotion = dominant_emotion
-                        self.current_confidence = emotion_score
-                        self.update_emotion_display(emotions)
+                # Score emotions of every tracked face in one batch
+                faces, track_ids = self.tracked_faces
+                with self.scheduler.measure("emotion"):
+                    face_results = self.engine.detect_track_emotions(packet.image, packet.frame_id, faces, track_ids)
+                self.apply_emotions(packet.frame_id, face_results)
+                self.metrics.tick("emotion")
                         
-            except Exception as e:
-                # If face detection fails, continue
-                pass
+            except Exception:
+                # If face detection fails, count (or log) it and continue
+                self.engine.report_failure("emotion_failures_total", "Emotion analysis failed")
+            finally:
+                self.frame_bus.release(packet)
             
-            time.sleep(0.5)  # Check every 0.5 seconds
+            # Sleep as long as the scheduler asks, shorter on idle machines, longer when busy
+            time.sleep(self.scheduler.emotion_delay())
+    
+    def feed_workers(self):
+        """Send the newest frame to the worker pool whenever a worker is free
+        
+        The workers run attention and emotions on the whole frame, the Tk loop only draws.
+        """
+        last_frame_id = -1
+        while self.running:
+            # Wait for a slot first so the frame sent is the newest one, not a queued one
+            if not self.pool.wait_for_slot(timeout=1.0):
+                continue
+            packet = self.frame_bus.acquire(after_id=last_frame_id, timeout=1.0)
+            if packet is None:
+                continue
+            last_frame_id = packet.frame_id
+            try:
+                # While the scene is idle only a frame now and then goes to the workers
+                if self.motion_gate is not None and not self.motion_gate.update(packet.image):
+                    continue
+                if self.pool.submit(packet.frame_id, packet.timestamp, packet.image):
+                    self.metrics.tick("submit")
+            finally:
+                self.frame_bus.release(packet)
+    
+    def on_pool_result(self, result):
+        """Handle a FrameResult coming back from a worker process, in frame order"""
+        # The pool already stored attention and emotions on its tracks
+        if result.attention is not None:
+            self.pool_attention = result.attention
+            if self.motion_gate is not None:
+                self.motion_gate.observe_faces(len(result.attention.faces))
+            if self.recorder is not None:
+                self.record_frame(result.frame_id, result.attention)
+        self.apply_emotions(result.frame_id, result.faces)
+        self.metrics.tick("emotion")
+    
+    def apply_emotions(self, frame_id, face_results):
+        """Show the smoothed emotion of the largest face"""
+        face = face_results[0] if face_results else None
+        if face is None or face.emotion is None:
+            return
+        
+        # Nothing is shown until an emotion is confident enough, then it only switches
+        # when another one clearly leads
+        result, changed = self.smoother.update(face.track_id, face.emotion.emotions)
+        if result is None:
+            return
+        self.current_emotion = result.dominant_emotion
+        self.current_confidence = result.confidence
+        self.emotion_frame_id = frame_id
+        if changed:
+            # Widgets may only be touched on the Tk thread, update_camera shows it
+            self.pending_emotions = result.emotions
     
     def update_emotion_display(self, emotions):
         """Update the emotion display in GUI"""
@@ -170,146 +281,9 @@ class EmotionRecognitionApp:
         
         self.details_text.insert(1.0, details)
     
-    def detect_face_opencv(self, frame):
-        """Detect face using OpenCV"""
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
-        return faces
-    
-    def detect_eyes_in_face(self, gray_frame, face_rect):
-        """Detect eyes within a face region"""
-        x, y, w, h = face_rect
-        # Focus on upper half of face where eyes are typically located
-        roi_gray = gray_frame[y:y+int(h*0.6), x:x+w]
-        eyes = self.eye_cascade.detectMultiScale(roi_gray, 1.1, 3)
-        # Adjust eye coordinates to full frame coordinates
-        adjusted_eyes = [(ex + x, ey + y, ew, eh) for (ex, ey, ew, eh) in eyes]
-        return adjusted_eyes
-    
-    def analyze_eye_gaze(self, gray_frame, eye_rect):
-        """Analyze if eye is looking forward by detecting iris/pupil position"""
-        ex, ey, ew, eh = eye_rect
-        
-        # Extract eye region
-        eye_roi = gray_frame[ey:ey+eh, ex:ex+ew]
-        if eye_roi.size == 0 or ew < 10 or eh < 10:
-            return None
-        
-        # Apply Gaussian blur to reduce noise
-        eye_roi_blur = cv2.GaussianBlur(eye_roi, (5, 5), 0)
-        
-        # Use adaptive threshold to find dark regions (pupil/iris)
-        thresh = cv2.adaptiveThreshold(eye_roi_blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                                      cv2.THRESH_BINARY_INV, 11, 2)
-        
-        # Find contours
-        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        if len(contours) > 0:
-            # Filter contours by area (pupil should be reasonably sized)
-            min_area = (ew * eh) * 0.05  # At least 5% of eye area
-            max_area = (ew * eh) * 0.4   # At most 40% of eye area
-            valid_contours = [c for c in contours if min_area < cv2.contourArea(c) < max_area]
-            
-            if len(valid_contours) > 0:
-                # Find the largest valid contour (likely the pupil)
-                largest_contour = max(valid_contours, key=cv2.contourArea)
-                
-                # Get the center of the contour
-                M = cv2.moments(largest_contour)
-                if M["m00"] != 0:
-                    cx = int(M["m10"] / M["m00"])
-                    cy = int(M["m01"] / M["m00"])
-                    
-                    # Calculate offset from eye center
-                    eye_center_x = ew // 2
-                    eye_center_y = eh // 2
-                    offset_x = cx - eye_center_x
-                    offset_y = cy - eye_center_y
-                    
-                    # Normalize offset (as percentage of eye size)
-                    offset_x_percent = (offset_x / ew) * 100 if ew > 0 else 0
-                    offset_y_percent = (offset_y / eh) * 100 if eh > 0 else 0
-                    
-                    return (offset_x_percent, offset_y_percent)
-        
-        # Alternative method: find darkest point in eye region
-        # This works when threshold fails
-        min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(eye_roi_blur)
-        cx, cy = min_loc  # Darkest point (likely pupil)
-        
-        # Calculate offset from eye center
-        eye_center_x = ew // 2
-        eye_center_y = eh // 2
-        offset_x = cx - eye_center_x
-        offset_y = cy - eye_center_y
-        
-        # Normalize offset
-        offset_x_percent = (offset_x / ew) * 100 if ew > 0 else 0
-        offset_y_percent = (offset_y / eh) * 100 if eh > 0 else 0
-        
-        return (offset_x_percent, offset_y_percent)
-    
-    def detect_attention(self, frame):
-        """Detect if user is looking at screen based on eye gaze direction"""
-        try:
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            
-            # Detect face
-            faces = self.detect_face_opencv(frame)
-            
-            if len(faces) == 0:
-                # No face detected - default to not looking
-                self.attention_status = "Not looking at screen"
-                return None
-            
-            # Get the largest face
-            face = max(faces, key=lambda rect: rect[2] * rect[3])
-            x, y, w, h = face
-            
-            # Detect eyes within the face
-            eyes = self.detect_eyes_in_face(gray, face)
-            
-            if len(eyes) < 2:
-                # Need at least 2 eyes for gaze detection
-                self.attention_status = "Not looking at screen"
-                return (face, eyes)
-            
-            # Analyze gaze direction for each eye
-            gaze_offsets = []
-            for eye in eyes[:2]:  # Use first 2 eyes detected
-                gaze = self.analyze_eye_gaze(gray, eye)
-                if gaze is not None:
-                    gaze_offsets.append(gaze)
-            
-            if len(gaze_offsets) < 2:
-                # Couldn't analyze both eyes
-                self.attention_status = "Not looking at screen"
-                return (face, eyes)
-            
-            # Calculate average gaze offset
-            avg_offset_x = sum(g[0] for g in gaze_offsets) / len(gaze_offsets)
-            avg_offset_y = sum(g[1] for g in gaze_offsets) / len(gaze_offsets)
-            
-            # Threshold for "looking at screen" - iris should be centered in eyes
-            # If looking forward, iris should be near the center of each eye
-            gaze_threshold = 15  # percent offset from eye center
-            
-            if abs(avg_offset_x) < gaze_threshold and abs(avg_offset_y) < gaze_threshold:
-                self.attention_status = "Looking at screen"
-            else:
-                self.attention_status = "Not looking at screen"
-            
-            return (face, eyes)
-                
-        except Exception as e:
-            # If any error occurs, default to not looking
-            self.attention_status = "Not looking at screen"
-            return None
-    
     def update_attention_display(self):
         """Update the attention status display in GUI"""
-        if self.attention_status == "Looking at screen":
+        if self.attention_status == LOOKING:
             color = "green"
         else:  # Not looking at screen
             color = "orange"
@@ -319,76 +293,223 @@ class EmotionRecognitionApp:
             foreground=color
         )
     
+    def update_model_status(self):
+        """Show the emotion model load timings once the background load finishes"""
+        if self.pool is not None and self.pool.model_error is not None and not self.pool_error_shown:
+            # A worker reported that its model failed to load
+            self.pool_error_shown = True
+            self.confidence_label.config(text="Emotion model failed to load in a worker")
+        if self.model_status_shown:
+            return
+        if self.pool is not None:
+            self.model_status_shown = True
+            self.confidence_label.config(text=f"Emotion model in {self.pool.workers} worker processes")
+            return
+        report = self.engine.model_report()
+        if report is None:
+            return
+        self.model_status_shown = True
+        if report.error:
+            self.confidence_label.config(text="Emotion model failed to load")
+        else:
+            self.confidence_label.config(
+                text=f"Model ready (load {report.load_seconds:.1f}s, warmup {report.warmup_seconds:.1f}s)"
+            )
+    
     def update_camera(self):
         """Update the camera feed display"""
-        ret, frame = self.cap.read()
-        if ret:
-            # Detect attention
-            detection_result = self.detect_attention(frame)
+        self.update_model_status()
+        
+        # Widgets are only touched here, on the Tk thread
+        if self.pending_emotions is not None:
+            emotions, self.pending_emotions = self.pending_emotions, None
+            self.update_emotion_display(emotions)
+        if self.long_running and self.model_status_shown and not self.heap_frozen:
+            self.freeze_heap()
+        
+        # Only take a frame newer than the one already shown, never wait on the Tk thread
+        packet = self.frame_bus.acquire(after_id=self.attention_frame_id, timeout=0)
+        if packet is not None:
+            if self.attention_frame_id >= 0:
+                # Camera frames that arrived while the display was busy
+                self.metrics.count("display_skipped_frames_total", packet.frame_id - self.attention_frame_id - 1)
+            # Nothing is drawn while the window is minimized or hidden, attention still runs
+            visible = self.renderer.visible()
+            try:
+                if self.pool is None:
+                    # Detect attention on the shared buffer, then shrink it into the preview buffer
+                    with self.scheduler.measure("attention"):
+                        attention = self.engine.detect_attention(packet.image)
+                    self.tracked_faces = (attention.faces, attention.track_ids)
+                    if self.recorder is not None:
+                        self.record_frame(packet.frame_id, attention)
+                else:
+                    # The workers analyzed a recent frame, draw their latest result
+                    attention = self.pool_attention
+                self.attention_status = attention.status
+                self.attention_frame_id = packet.frame_id
+                render_start = time.perf_counter()
+                if visible:
+                    frame = self.renderer.prepare(packet.image)
+            finally:
+                self.frame_bus.release(packet)
             self.update_attention_display()
+            if self.metrics.enabled:
+                self.record_queue_metrics()
             
-            # Draw face and eyes if detected
-            if detection_result is not None:
-                if isinstance(detection_result, tuple) and len(detection_result) == 2:
-                    face_rect, eyes = detection_result
-                    if face_rect is not None:
-                        x, y, w, h = face_rect
-                        # Draw face rectangle
-                        face_color = (0, 255, 0) if self.attention_status == "Looking at screen" else (0, 165, 255)
-                        cv2.rectangle(frame, (x, y), (x + w, y + h), face_color, 2)
-                        
-                        # Draw eyes
-                        for eye in eyes:
-                            ex, ey, ew, eh = eye
-                            cv2.rectangle(frame, (ex, ey), (ex + ew, ey + eh), (255, 0, 0), 2)
-            
-            # Draw attention status on frame
-            if self.attention_status == "Looking at screen":
-                attention_color = (0, 255, 0)  # Green
-            else:  # Not looking at screen
-                attention_color = (0, 165, 255)  # Orange
+            if visible:
+                self.draw_overlays(frame, attention)
+                self.renderer.show()
+                self.scheduler.record("render", time.perf_counter() - render_start)
+                self.metrics.tick("display")
+            self.scheduler.record("capture", self.frame_bus.capture_latency)
+        
+        if self.running:
+            # Aim for ~30 FPS, slower when the CPU is saturated
+            self.root.after(self.scheduler.display_delay_ms(), self.update_camera)
+    
+    def freeze_heap(self):
+        """Collect once, then exclude the model, widgets and buffers from later collections
+        
+        After gc.freeze() the collector only walks objects created since, so
+        full collections stay short no matter how large the loaded model is.
+        """
+        gc.collect()
+        gc.freeze()
+        self.heap_frozen = True
+    
+    def record_frame(self, frame_id, attention):
+        """Queue the faces of this frame with their tracks' latest emotions for the session log"""
+        faces = []
+        for face_rect, track_id, state in zip(attention.faces, attention.track_ids, attention.per_face):
+            track = self.tracks.get(track_id)
+            emotions = track.emotions if track is not None else None
+            faces.append((track_id, face_rect, emotions, state.gaze, state.status == LOOKING))
+        self.recorder.record(time.time(), frame_id, faces)
+    
+    def draw_overlays(self, frame, attention):
+        """Draw faces, eyes and status text on the preview-sized frame"""
+        # Draw every face and its eyes
+        for face_rect, track_id, state in zip(attention.faces, attention.track_ids, attention.per_face):
+            x, y, w, h = self.renderer.scale_box(face_rect)
+            # Draw face rectangle
+            face_color = (0, 255, 0) if state.status == LOOKING else (0, 165, 255)
+            cv2.rectangle(frame, (x, y), (x + w, y + h), face_color, 2)
             
-            # Draw attention status background
-            cv2.rectangle(frame, (10, frame.shape[0] - 80), (400, frame.shape[0] - 10), (0, 0, 0), -1)
-            cv2.putText(frame, f"Attention: {self.attention_status}", 
-                       (15, frame.shape[0] - 50), cv2.FONT_HERSHEY_SIMPLEX, 0.7, attention_color, 2)
+            # Label the face with its track ID and latest emotion
+            track = self.tracks.get(track_id)
+            label = f"#{track_id}"
+            if track is not None and track.dominant_emotion:
+                label += f" {track.dominant_emotion.capitalize()}"
+            cv2.putText(frame, label, (x, max(y - 8, 15)),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, face_color, 2)
             
-            # Draw emotion on frame if detected
-            if self.current_emotion:
-                emotion_text = f"Emotion: {self.current_emotion.capitalize()}"
-                confidence_text = f"Confidence: {self.current_confidence:.1f}%"
-                
-                # Draw background rectangle for text
-                cv2.rectangle(frame, (10, 10), (400, 80), (0, 0, 0), -1)
-                
-                # Draw emotion text
-                cv2.putText(frame, emotion_text, 
-                           (15, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-                cv2.putText(frame, confidence_text, 
-                           (15, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+            # Draw eyes
+            for eye in state.eyes:
+                ex, ey, ew, eh = self.renderer.scale_box(eye)
+                cv2.rectangle(frame, (ex, ey), (ex + ew, ey + eh), (255, 0, 0), 2)
+        
+        # Draw attention status on frame
+        if self.attention_status == LOOKING:
+            attention_color = (0, 255, 0)  # Green
+        else:  # Not looking at screen
+            attention_color = (0, 165, 255)  # Orange
+        
+        # Draw attention status background
+        cv2.rectangle(frame, (10, frame.shape[0] - 80), (400, frame.shape[0] - 10), (0, 0, 0), -1)
+        cv2.putText(frame, f"Attention: {self.attention_status}", 
+                   (15, frame.shape[0] - 50), cv2.FONT_HERSHEY_SIMPLEX, 0.7, attention_color, 2)
+        
+        # Draw emotion on frame if detected
+        if self.current_emotion:
+            emotion_text = f"Emotion: {self.current_emotion.capitalize()}"
+            confidence_text = f"Confidence: {self.current_confidence:.1f}%"
             
-            # Convert to RGB for tkinter
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            frame_pil = Image.fromarray(frame_rgb)
-            frame_pil.thumbnail((600, 450), Image.Resampling.LANCZOS)
-            frame_tk = ImageTk.PhotoImage(frame_pil)
+            # Draw background rectangle for text
+            cv2.rectangle(frame, (10, 10), (400, 80), (0, 0, 0), -1)
             
-            self.camera_label.config(image=frame_tk, text="")
-            self.camera_label.image = frame_tk  # Keep a reference
-        
-        if self.running:
-            self.root.after(30, self.update_camera)  # Update ~30 FPS
+            # Draw emotion text
+            cv2.putText(frame, emotion_text, 
+                       (15, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+            cv2.putText(frame, confidence_text, 
+                       (15, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        
+        if self.metrics_overlay:
+            # Next to the emotion text, in the top right corner
+            self.metrics.draw_overlay(frame)
+    
+    def record_queue_metrics(self):
+        """Copy queue depths and drop counters of the bus and the pool into the metrics"""
+        self.metrics.gauge("capture_dropped_frames", self.frame_bus.dropped_frames)
+        if self.motion_gate is not None:
+            self.metrics.gauge("motion_idle", int(not self.motion_gate.active))
+            self.metrics.gauge("motion_wakeups", self.motion_gate.wakeups)
+        if self.pool is not None:
+            self.metrics.gauge("pool_busy_slots", len(self.pool.slots) - self.pool.free_slots.qsize())
+            self.metrics.gauge("pool_dropped_frames", self.pool.dropped)
+            self.metrics.gauge("pool_failures", self.pool.failed)
+            self.metrics.gauge("pool_stale_results", self.pool.stale)
+            self.metrics.gauge("pool_worker_restarts", self.pool.restarts)
+        if self.gc_monitor is not None:
+            self.gc_monitor.publish(self.metrics)
     
     def on_closing(self):
         """Handle window closing"""
         self.running = False
-        self.cap.release()
+        if self.gc_monitor is not None:
+            self.gc_monitor.stop()
+        if self.pool is not None:
+            self.pool.close()
+        self.frame_bus.stop()
+        self.metrics.close()
+        if self.recorder is not None:
+            self.recorder.close()
         self.root.destroy()
 
 def main():
+    parser = argparse.ArgumentParser(description="Real-time emotion and attention recognition")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="run attention and emotions in this many worker processes (0 = in the app)")
+    parser.add_argument("--backend", choices=["deepface", "fer", "onnx"], default="deepface",
+                        help="emotion model, onnx runs the exported int8 model without TensorFlow")
+    parser.add_argument("--detector", choices=["haar", "yunet", "ssd"], default="haar",
+                        help="face detector, yunet also finds the eyes (needs its model in models/)")
+    parser.add_argument("--record", metavar="PATH",
+                        help="log every face to this session file, summarize it with session_log.py")
+    parser.add_argument("--long-running", action="store_true",
+                        help="kiosk mode: freeze the heap after model load and track GC pauses")
+    parser.add_argument("--no-idle", action="store_true",
+                        help="analyze every frame even when nobody is in view and nothing moves")
+    parser.add_argument("--idle-after", type=float, default=3.0,
+                        help="seconds without motion or faces before analysis drops to idle rate")
+    parser.add_argument("--wake-frames", type=int, default=1,
+                        help="consecutive frames with motion needed to leave idle (1 = first frame)")
+    parser.add_argument("--metrics-overlay", action="store_true",
+                        help="draw stage timings and loop FPS on the camera feed")
+    parser.add_argument("--metrics-port", type=int,
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-dump", type=float, metavar="SECONDS",
+                        help="print a JSON metrics snapshot every SECONDS")
+    args = parser.parse_args()
+    
+    # Metrics are only collected when one of their outputs is requested
+    metrics = None
+    if args.metrics_overlay or args.metrics_port or args.metrics_dump:
+        metrics = Metrics()
+        if args.metrics_port:
+            metrics.serve(args.metrics_port)
+        if args.metrics_dump:
+            metrics.start_dump(args.metrics_dump)
+    
+    # Analysis idles while the scene is empty and still, unless --no-idle
+    motion_gate = None if args.no_idle else MotionGate(idle_after=args.idle_after, wake_frames=args.wake_frames)
+    
     # Create and run the application
     root = tk.Tk()
-    app = EmotionRecognitionApp(root)
+    app = EmotionRecognitionApp(root, workers=args.workers, metrics=metrics,
+                                metrics_overlay=args.metrics_overlay, emotion_backend=args.backend,
+                                detector=args.detector, record_path=args.record,
+                                long_running=args.long_running, motion_gate=motion_gate)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
     root.mainloop()
 
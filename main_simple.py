@@ -4,37 +4,66 @@ Alternative version with lighter dependencies
 Academic Project - Polis University
 """
 
+import argparse
 import cv2
 import numpy as np
-from fer import FER
 import tkinter as tk
 from tkinter import ttk
+import threading
 import time
-from PIL import Image, ImageTk
+from analysis_engine import AnalysisEngine
+from frame_bus import FrameBus
+from instrumentation import Metrics, NULL_METRICS
+from motion_gate import MotionGate
+from render import PreviewRenderer
+from result_cache import ResultCache
+from scheduler import AdaptiveScheduler
+from temporal import EmotionSmoother
 
 class SimpleEmotionApp:
-    def __init__(self, root):
+    def __init__(self, root, metrics=None, metrics_overlay=False):
         self.root = root
         self.root.title("Emotion Recognition App (Simple) - Polis University")
         self.root.geometry("900x600")
         
-        # Initialize camera
-        self.cap = cv2.VideoCapture(0)
-        if not self.cap.isOpened():
-            raise ValueError("Unable to open camera")
+        # Initialize camera - captured on its own thread, shared by display and detection
+        self.frame_bus = FrameBus(0).start()
+        self.display_frame_id = -1
         
-        # Initialize emotion detector
-        self.detector = FER(mtcnn=True)
+        # Stage timings, loop rates and failure counts (no-op unless enabled)
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self.metrics_overlay = metrics_overlay
+        
+        # Display and emotion rates follow measured stage latencies and CPU load
+        self.scheduler = AdaptiveScheduler(target_fps=20, target_emotion_hz=4, metrics=self.metrics)
+        
+        # Initialize emotion detector (FER with MTCNN face detection), faces that
+        # barely changed since their last inference are not re-scored and repeated
+        # crops come from an in-memory result cache. While nobody is in view and nothing
+        # moves, MTCNN and FER only run about once a second
+        self.engine = AnalysisEngine(emotion_backend="fer", change_threshold=4.0, result_cache=ResultCache(),
+                                     cache_near=True, motion_gate=MotionGate(), metrics=self.metrics)
+        
+        # Emotions are smoothed over time, the panel only redraws when they change
+        self.smoother = EmotionSmoother()
+        
+        # Build and warm up the model in the background while the camera feed is shown
+        self.engine.start_loading()
+        self.model_status_shown = False
         
         # Current emotion state
         self.current_emotion = None
         self.current_confidence = 0.0
+        self.pending_emotions = None  # Set by the detection thread, shown by the Tk loop
         
         # Create GUI
         self.setup_gui()
         
-        # Start emotion detection
+        # Start emotion detection off the Tk thread, FER blocks for a long time
         self.running = True
+        self.detection_thread = threading.Thread(target=self.detect_emotions, daemon=True)
+        self.detection_thread.start()
+        
         self.update_camera()
         
     def setup_gui(self):
@@ -49,6 +78,7 @@ class SimpleEmotionApp:
         
         self.camera_label = ttk.Label(camera_frame)
         self.camera_label.pack()
+        self.renderer = PreviewRenderer(self.camera_label, max_size=(600, 450))
         
         # Emotion display frame
         emotion_frame = ttk.LabelFrame(main_frame, text="Detected Emotion", padding="20")
@@ -65,7 +95,7 @@ class SimpleEmotionApp:
         # Confidence label
         self.confidence_label = ttk.Label(
             emotion_frame, 
-            text="Waiting for detection...", 
+            text="Loading emotion model...", 
             font=("Arial", 14)
         )
         self.confidence_label.pack(pady=10)
@@ -90,33 +120,45 @@ class SimpleEmotionApp:
         main_frame.columnconfigure(1, weight=1)
         main_frame.rowconfigure(0, weight=1)
         
-    def detect_emotion(self, frame):
-        """Detect emotion in a frame"""
-        try:
-            emotions = self.detector.detect_emotions(frame)
-            if emotions:
-                # Get the first detected face's emotions
-                emotion_dict = emotions[0]['emotions']
-                dominant_emotion = max(emotion_dict, key=emotion_dict.get)
-                emotion_score = emotion_dict[dominant_emotion] * 100
-                
-                # Update if confidence is high enough
-                if emotion_score > 30:
-                    self.current_emotion = dominant_emotion
-                    self.current_confidence = emotion_score
-                    self.update_emotion_display(emotion_dict)
-                    
-        except Exception as e:
-            pass
+    def detect_emotions(self):
+        """Continuously detect emotions on the newest camera frame"""
+        last_frame_id = -1
+        while self.running:
+            packet = self.frame_bus.acquire(after_id=last_frame_id, timeout=1.0)
+            if packet is None:
+                continue
+            last_frame_id = packet.frame_id
+            start = time.perf_counter()
+            try:
+                result = self.engine.analyze(packet.image, packet.frame_id, packet.timestamp, attention=False)
+            finally:
+                self.frame_bus.release(packet)
+            
+            if result.idle:
+                # Idle frames only cost a thumbnail, check the next one right away so motion wakes us within a frame
+                continue
+            self.scheduler.record("emotion", time.perf_counter() - start)
+            self.metrics.tick("emotion")
+            
+            if result.emotion is not None:
+                # Shown once confident enough, switches only when another emotion clearly leads
+                smoothed, changed = self.smoother.update(result.faces[0].track_id, result.emotion.emotions)
+                if smoothed is not None:
+                    self.current_emotion = smoothed.dominant_emotion
+                    self.current_confidence = smoothed.confidence
+                    if changed:
+                        self.pending_emotions = smoothed.emotions
+            
+            time.sleep(self.scheduler.emotion_delay())
     
     def update_emotion_display(self, emotions):
         """Update the emotion display in GUI"""
         if not emotions:
             return
             
-        # Get dominant emotion
+        # Get dominant emotion (scores are already in percent)
         dominant_emotion = max(emotions, key=emotions.get)
-        emotion_score = emotions[dominant_emotion] * 100
+        emotion_score = emotions[dominant_emotion]
         
         # Update main emotion label
         emotion_text = f"{dominant_emotion.capitalize()}"
@@ -129,20 +171,49 @@ class SimpleEmotionApp:
         # Update details text
         self.details_text.delete(1.0, tk.END)
         details = "Emotion Breakdown:\n\n"
-        for emotion, score in sorted(emotions.items(), key=lambda x: x[1], reverse=True):
-            score_percent = score * 100
+        for emotion, score_percent in sorted(emotions.items(), key=lambda x: x[1], reverse=True):
             bar_length = int(score_percent / 5)  # Scale to 20 chars max
             bar = "█" * bar_length
             details += f"{emotion.capitalize():12} {score_percent:6.1f}% {bar}\n"
         
         self.details_text.insert(1.0, details)
     
+    def update_model_status(self):
+        """Show the emotion model load timings once the background load finishes"""
+        if self.model_status_shown:
+            return
+        report = self.engine.model_report()
+        if report is None:
+            return
+        self.model_status_shown = True
+        if report.error:
+            self.confidence_label.config(text="Emotion model failed to load")
+        else:
+            self.confidence_label.config(
+                text=f"Model ready (load {report.load_seconds:.1f}s, warmup {report.warmup_seconds:.1f}s)"
+            )
+    
     def update_camera(self):
         """Update the camera feed display"""
-        ret, frame = self.cap.read()
-        if ret:
-            # Detect emotions
-            self.detect_emotion(frame)
+        self.update_model_status()
+        
+        # Widgets are only touched here, on the Tk thread
+        if self.pending_emotions is not None:
+            emotions, self.pending_emotions = self.pending_emotions, None
+            self.update_emotion_display(emotions)
+        
+        # Skip the preview entirely while the window is minimized or hidden
+        packet = None
+        if self.renderer.visible():
+            packet = self.frame_bus.acquire(after_id=self.display_frame_id, timeout=0)
+        if packet is not None:
+            self.display_frame_id = packet.frame_id
+            render_start = time.perf_counter()
+            try:
+                # Shrink straight from the shared buffer, overlays are drawn at preview size
+                frame = self.renderer.prepare(packet.image)
+            finally:
+                self.frame_bus.release(packet)
             
             # Draw emotion on frame if detected
             if self.current_emotion:
@@ -158,28 +229,49 @@ class SimpleEmotionApp:
                 cv2.putText(frame, confidence_text, 
                            (15, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
             
-            # Convert to RGB for tkinter
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            frame_pil = Image.fromarray(frame_rgb)
-            frame_pil.thumbnail((600, 450), Image.Resampling.LANCZOS)
-            frame_tk = ImageTk.PhotoImage(frame_pil)
+            if self.metrics_overlay:
+                # Next to the emotion text, in the top right corner
+                self.metrics.draw_overlay(frame)
             
-            self.camera_label.config(image=frame_tk, text="")
-            self.camera_label.image = frame_tk  # Keep a reference
+            # Paste into the persistent PhotoImage
+            self.renderer.show()
+            self.scheduler.record("render", time.perf_counter() - render_start)
+            self.metrics.tick("display")
+            self.scheduler.record("capture", self.frame_bus.capture_latency)
         
         if self.running:
-            self.root.after(100, self.update_camera)  # Update every 100ms
+            self.root.after(self.scheduler.display_delay_ms(), self.update_camera)
     
     def on_closing(self):
         """Handle window closing"""
         self.running = False
-        self.cap.release()
+        self.frame_bus.stop()
+        self.metrics.close()
         self.root.destroy()
 
 def main():
+    parser = argparse.ArgumentParser(description="Real-time emotion recognition with FER")
+    parser.add_argument("--metrics-overlay", action="store_true",
+                        help="draw stage timings and loop FPS on the camera feed")
+    parser.add_argument("--metrics-port", type=int,
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-dump", type=float, metavar="SECONDS",
+                        help="print a JSON metrics snapshot every SECONDS")
+    args = parser.parse_args()
+    
+    # Metrics are only collected when one of their outputs is requested,
+    # without them emotion failures are still logged as warnings
+    metrics = None
+    if args.metrics_overlay or args.metrics_port or args.metrics_dump:
+        metrics = Metrics()
+        if args.metrics_port:
+            metrics.serve(args.metrics_port)
+        if args.metrics_dump:
+            metrics.start_dump(args.metrics_dump)
+    
     # Create and run the application
     root = tk.Tk()
-    app = SimpleEmotionApp(root)
+    app = SimpleEmotionApp(root, metrics=metrics, metrics_overlay=args.metrics_overlay)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
     root.mainloop()
 
@@ -0,0 +1,112 @@
+"""
+Model Registry
+Build each emotion model once, in the background, and keep it warm
+Academic Project - Polis University
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from emotion_backends import create_emotion_model
+
+
+@dataclass
+class LoadReport:
+    """How long a model took to become usable"""
+    name: str
+    load_seconds: float = 0.0    # Heavy imports plus building the network
+    warmup_seconds: float = 0.0  # First dummy inference (graph tracing, allocations)
+    error: Optional[str] = None
+
+
+class _Entry:
+    """Registry slot for one model name"""
+
+    def __init__(self, name):
+        self.name = name
+        self.model = None
+        self.report = None
+        self.ready = threading.Event()
+        self.thread = None
+
+
+class ModelRegistry:
+    """Process-wide cache of emotion models keyed by backend name"""
+
+    def __init__(self, factory=create_emotion_model, warmup_batch_sizes=(1, 2, 4, 8)):
+        self.factory = factory
+        self.warmup_batch_sizes = warmup_batch_sizes
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def _entry(self, name):
+        with self.lock:
+            if name not in self.entries:
+                self.entries[name] = _Entry(name)
+            return self.entries[name]
+
+    def load_async(self, name):
+        """Start building `name` on a background thread, returns immediately"""
+        entry = self._entry(name)
+        with self.lock:
+            if entry.thread is None and not entry.ready.is_set():
+                entry.thread = threading.Thread(target=self._build, args=(entry,), daemon=True)
+                entry.thread.start()
+        return entry.ready
+
+    def get(self, name, wait=True, timeout=None):
+        """Return the warm model, building it first if nobody has started yet
+
+        With wait=False a model that is still loading gives None instead of
+        blocking, so render loops can keep drawing frames meanwhile.
+        """
+        ready = self.load_async(name)
+        if wait:
+            ready.wait(timeout)
+        entry = self._entry(name)
+        if entry.report is not None and entry.report.error is not None and wait:
+            raise RuntimeError(f"Loading {name} failed: {entry.report.error}")
+        return entry.model
+
+    def is_ready(self, name):
+        entry = self._entry(name)
+        return entry.ready.is_set() and entry.model is not None
+
+    def report(self, name):
+        """LoadReport once loading finished (or failed), else None"""
+        return self._entry(name).report
+
+    def _build(self, entry):
+        """Import, build and warm up one model"""
+        report = LoadReport(entry.name)
+        try:
+            start = time.perf_counter()
+            model = self.factory(entry.name)
+            report.load_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            self.warmup(model)
+            report.warmup_seconds = time.perf_counter() - start
+
+            entry.model = model
+        except Exception as e:
+            report.error = str(e)
+        finally:
+            entry.report = report
+            entry.ready.set()
+
+    def warmup(self, model):
+        """Run dummy inferences so the first real frame does not pay for tracing"""
+        crop = np.zeros((96, 96, 3), dtype=np.uint8)
+        for batch_size in self.warmup_batch_sizes:
+            model.predict_batch([crop] * batch_size, max(self.warmup_batch_sizes))
+        # Backends with their own face detector (FER's MTCNN) warm it up too
+        model.detect_faces(np.zeros((240, 320, 3), dtype=np.uint8))
+
+
+# Shared by every engine in the process so each model is built exactly once
+registry = ModelRegistry()
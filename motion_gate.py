@@ -0,0 +1,102 @@
+"""
+Motion Gate
+Idle the face, eye and emotion stages while nothing moves in front of the camera
+Academic Project - Polis University
+"""
+
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Frame differencing on a tiny gray thumbnail, deciding which frames get analyzed
+
+    Every frame is shrunk to `size` and compared with the previous one by
+    mean absolute difference, which costs a fraction of a millisecond. While
+    the gate is active every frame is analyzed. After `idle_after` seconds
+    without motion and without a face it goes idle: then only one frame
+    every `idle_interval` seconds is analyzed (so a person sitting still is
+    still found). `wake_frames` consecutive frames with motion wake it up
+    again, 1 wakes it on the very first one; a face found wakes it too.
+    `awake` is set while the gate is active, other threads can wait on it.
+    """
+
+    def __init__(self, threshold=2.5, size=(32, 24), idle_after=3.0, idle_interval=1.0, wake_frames=1):
+        self.threshold = threshold          # Mean absolute gray-level difference (0-255) that counts as motion
+        self.size = size
+        self.idle_after = idle_after
+        self.idle_interval = idle_interval
+        self.wake_frames = wake_frames
+
+        # Thumbnail buffers, the previous and current one swap every frame
+        self.small = None
+        self.thumbnails = [np.zeros((size[1], size[0]), dtype=np.uint8) for _ in range(2)]
+        self.difference = np.zeros((size[1], size[0]), dtype=np.uint8)
+        self.current = 0
+        self.has_previous = False
+
+        self.awake = threading.Event()
+        self.awake.set()
+        self.motion = 0.0
+        self.motion_frames = 0
+        self.last_activity = time.monotonic()
+        self.last_probe = 0.0
+
+        # Statistics
+        self.wakeups = 0
+        self.skipped = 0
+
+    @property
+    def active(self):
+        return self.awake.is_set()
+
+    def measure(self, frame):
+        """Mean gray-level change since the previous frame"""
+        if frame.ndim == 3:
+            if self.small is None:
+                self.small = np.zeros((self.size[1], self.size[0], frame.shape[2]), dtype=np.uint8)
+            cv2.resize(frame, self.size, dst=self.small, interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(self.small, cv2.COLOR_BGR2GRAY, dst=self.thumbnails[self.current])
+        else:
+            cv2.resize(frame, self.size, dst=self.thumbnails[self.current], interpolation=cv2.INTER_AREA)
+        previous = self.thumbnails[1 - self.current]
+        motion = 0.0
+        if self.has_previous:
+            cv2.absdiff(self.thumbnails[self.current], previous, dst=self.difference)
+            motion = cv2.mean(self.difference)[0]
+        self.has_previous = True
+        self.current = 1 - self.current
+        return motion
+
+    def update(self, frame, now=None):
+        """Feed the newest frame, True when it should be analyzed"""
+        now = time.monotonic() if now is None else now
+        self.motion = self.measure(frame)
+        self.motion_frames = self.motion_frames + 1 if self.motion > self.threshold else 0
+        if self.motion_frames >= self.wake_frames:
+            self.wake(now)
+        elif self.active and now - self.last_activity > self.idle_after:
+            self.awake.clear()
+
+        if self.active:
+            return True
+        if now - self.last_probe >= self.idle_interval:
+            # Low-rate check for someone who appeared without moving much
+            self.last_probe = now
+            return True
+        self.skipped += 1
+        return False
+
+    def observe_faces(self, count, now=None):
+        """Tell the gate how many faces the analysis found, any face keeps it awake"""
+        if count:
+            self.wake(time.monotonic() if now is None else now)
+
+    def wake(self, now):
+        self.last_activity = now
+        if not self.active:
+            self.wakeups += 1
+            self.awake.set()
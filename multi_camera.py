@@ -0,0 +1,376 @@
+"""
+Multi-Camera Analysis
+Several capture sources sharing one analysis thread under a fair scheduler
+Academic Project - Polis University
+"""
+
+import argparse
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from analysis_engine import AnalysisEngine, EmotionResult
+from batch_inference import EmotionBatcher
+from frame_bus import FrameBus
+from instrumentation import RateMeter, RingHistogram
+from model_registry import registry
+from result_cache import ResultCache
+
+
+def parse_source(text):
+    """"2" is a camera index, anything else a file path or stream URL"""
+    return int(text) if text.isdigit() else text
+
+
+def parse_stream(text):
+    """"front=rtsp://..." names a source, a bare source is named by its position later"""
+    name, sep, source = text.partition("=")
+    if sep and name and not any(c in name for c in ":/\\."):
+        return name, parse_source(source)
+    return parse_source(text)
+
+
+def open_capture(source, loop=True):
+    """VideoCapture plus the pacing FrameBus needs: files play at their own FPS"""
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise ValueError(f"Unable to open source: {source}")
+    if isinstance(source, str) and os.path.isfile(source):
+        return cap, cap.get(cv2.CAP_PROP_FPS) or 25.0, loop
+    return cap, None, False
+
+
+class CameraStream:
+    """One source: its own capture thread, face tracks and statistics
+
+    Every stream has an AnalysisEngine of its own so track IDs and the face
+    tracker never mix cameras; their emotion crops are scored together by
+    the analyzer's shared EmotionBatcher.
+    """
+
+    def __init__(self, name, source, engine_options, slots=4, loop=True):
+        self.name = name
+        self.source = source
+        cap, fps, loop = open_capture(source, loop)
+        self.bus = FrameBus(cap, slots, fps=fps, loop=loop)
+        self.engine = AnalysisEngine(wait_for_model=False, **engine_options)
+
+        self.last_frame_id = -1
+        self.last_result = None
+        self.last_emotion_at = 0.0
+
+        # Scheduler state
+        self.pass_value = 0.0   # Weighted analysis time received so far
+        self.served_at = time.monotonic()
+        self.motion = 0.0       # Mean gray-level change between analyzed frames
+        self.faces = 0
+        self.thumbnail = None
+
+        # Statistics
+        self.rate = RateMeter()
+        self.latency = RingHistogram(256)   # Capture to result, seconds
+        self.analysis = RingHistogram(256)  # Time spent analyzing, seconds
+        self.analyzed = 0
+        self.skipped = 0                    # Captured frames never analyzed
+        self.busy_seconds = 0.0
+
+    def has_new_frame(self):
+        return self.bus.latest_frame_id > self.last_frame_id
+
+    def update_motion(self, frame):
+        """Cheap activity estimate from a 32x24 gray thumbnail"""
+        thumbnail = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (32, 24),
+                               interpolation=cv2.INTER_AREA).astype(np.int16)
+        if self.thumbnail is not None:
+            self.motion = float(np.abs(thumbnail - self.thumbnail).mean())
+        self.thumbnail = thumbnail
+
+
+class FairScheduler:
+    """Pick the next stream to analyze and keep the total work within a CPU budget
+
+    Stride scheduling: every stream is charged the analysis time it used,
+    divided by its weight, and the ready stream with the smallest charge goes
+    next. With "round_robin" all weights are 1, "motion" and "faces" give
+    busier streams up to `max_weight` times the share of an idle one. A
+    stream that waited longer than `max_wait` seconds goes first regardless,
+    so no camera starves.
+    """
+
+    def __init__(self, weighting="round_robin", max_weight=4.0, max_wait=1.0, cpu_budget=0.5,
+                 motion_scale=4.0):
+        if weighting not in ("round_robin", "motion", "faces"):
+            raise ValueError(f"Unknown weighting: {weighting}")
+        self.weighting = weighting
+        self.max_weight = max_weight
+        self.max_wait = max_wait
+        self.cpu_budget = cpu_budget      # Fraction of all cores the process may use
+        self.motion_scale = motion_scale  # Motion that earns one extra share
+        self.cores = os.cpu_count() or 1
+        self.virtual_time = 0.0
+
+    def weight(self, stream):
+        if self.weighting == "motion":
+            extra = stream.motion / self.motion_scale
+        elif self.weighting == "faces":
+            extra = stream.faces
+        else:
+            extra = 0.0
+        return 1.0 + min(extra, self.max_weight - 1.0)
+
+    def pick(self, streams):
+        """Ready stream to analyze next, or None when no stream has a new frame"""
+        ready = [s for s in streams if s.has_new_frame()]
+        if not ready:
+            return None
+        now = time.monotonic()
+        starving = [s for s in ready if now - s.served_at > self.max_wait]
+        if starving:
+            return min(starving, key=lambda s: s.served_at)
+        chosen = min(ready, key=lambda s: s.pass_value)
+        self.virtual_time = max(self.virtual_time, chosen.pass_value)
+        return chosen
+
+    def charge(self, stream, seconds):
+        # A stream returning from idle starts at the current virtual time
+        # instead of catching up on everything it missed
+        stream.pass_value = max(stream.pass_value, self.virtual_time) + seconds / self.weight(stream)
+        stream.served_at = time.monotonic()
+
+    def budget_delay(self, cpu_seconds, wall_seconds):
+        """Pause after an analysis that used `cpu_seconds` of CPU time on the analysis thread"""
+        return max(cpu_seconds / (self.cpu_budget * self.cores) - wall_seconds, 0.0)
+
+
+class MultiCameraAnalyzer:
+    """Capture N sources on their own threads and analyze them on one shared thread
+
+    Sources are camera indices, video files (played at their frame rate and
+    looped) or stream URLs. `on_result(stream_name, FrameResult)` is called
+    for every analyzed frame, from the analysis thread, or from the batcher
+    thread once the frame's emotions are scored. Emotions are scored at most
+    every `emotion_interval` seconds per stream, attention on every analyzed
+    frame. The face crops of all streams go through one EmotionBatcher, so
+    crops of different cameras share model calls; the CPU budget covers the
+    analysis thread, emotion inference is paced by `emotion_interval`.
+    """
+
+    def __init__(self, sources, weighting="round_robin", cpu_budget=0.5, max_wait=1.0,
+                 emotion_interval=0.25, on_result=None, loop=True, max_batch_size=8, batch_wait=0.02,
+                 **engine_options):
+        engine_options.setdefault("detect_every", 3)
+        engine_options.setdefault("change_threshold", 4.0)
+        # One cache for all cameras, the same face seen twice is only scored once
+        engine_options.setdefault("result_cache", ResultCache())
+        engine_options.setdefault("cache_near", True)
+        self.streams = []
+        for i, source in enumerate(sources):
+            name, source = source if isinstance(source, tuple) else (f"cam{i}", source)
+            self.streams.append(CameraStream(name, source, engine_options, loop=loop))
+        self.scheduler = FairScheduler(weighting, max_wait=max_wait, cpu_budget=cpu_budget)
+        self.emotion_interval = emotion_interval
+        self.on_result = on_result
+        self.emotion_backend = self.streams[0].engine.emotion_backend if self.streams else None
+        self.max_batch_size = max_batch_size
+        self.batch_wait = batch_wait
+        self.batcher = None
+        self.running = False
+        self.thread = None
+        self.started_at = time.monotonic()
+
+    def start(self):
+        for stream in self.streams:
+            stream.bus.start()
+            stream.engine.start_loading()
+        self.running = True
+        self.started_at = time.monotonic()
+        self.thread = threading.Thread(target=self._analysis_loop, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=5.0)
+        for stream in self.streams:
+            stream.bus.stop()
+        if self.batcher is not None:
+            self.batcher.close()
+
+    def get_batcher(self):
+        """Emotion batcher shared by every stream, None until the model finished loading"""
+        if self.batcher is None and self.emotion_backend is not None and registry.is_ready(self.emotion_backend):
+            model = registry.get(self.emotion_backend, wait=False)
+            if model is not None:
+                self.batcher = EmotionBatcher(model, self.max_batch_size, self.batch_wait)
+        return self.batcher
+
+    def _analysis_loop(self):
+        while self.running:
+            stream = self.scheduler.pick(self.streams)
+            if stream is None:
+                # Nothing new on any camera
+                time.sleep(0.002)
+                continue
+            self.analyze_next(stream)
+
+    def analyze_next(self, stream):
+        """Analyze the newest frame of one stream and update its statistics"""
+        packet = stream.bus.acquire(after_id=stream.last_frame_id, timeout=0)
+        if packet is None:
+            return None
+        # CPU of this thread only, the capture threads of the other streams do not count
+        cpu_start, wall_start = time.thread_time(), time.perf_counter()
+        batcher = self.get_batcher()
+        emotion = batcher is not None and time.monotonic() - stream.last_emotion_at >= self.emotion_interval
+        try:
+            result = stream.engine.analyze(packet.image, packet.frame_id, packet.timestamp, emotion=False)
+            pending = self.submit_emotions(batcher, stream, packet.image, result) if emotion else {}
+            stream.update_motion(packet.image)
+        finally:
+            stream.bus.release(packet)
+        wall = time.perf_counter() - wall_start
+        cpu = time.thread_time() - cpu_start
+
+        now = time.monotonic()
+        if emotion:
+            stream.last_emotion_at = now
+        if stream.last_frame_id >= 0:
+            stream.skipped += max(packet.frame_id - stream.last_frame_id - 1, 0)
+        stream.last_frame_id = packet.frame_id
+        stream.last_result = result
+        stream.faces = len(result.faces)
+        stream.analyzed += 1
+        stream.busy_seconds += wall
+        stream.rate.tick(now)
+        stream.analysis.add(wall)
+        stream.latency.add(now - packet.timestamp)
+        self.scheduler.charge(stream, wall)
+
+        self.when_scored(stream, result, pending)
+        delay = self.scheduler.budget_delay(cpu, wall)
+        if delay:
+            time.sleep(delay)
+        return result
+
+    def submit_emotions(self, batcher, stream, frame, result):
+        """Queue the face crops of a frame on the shared batcher, {face_index: (future, thumbnail)}
+
+        Faces that barely changed since their last scoring reuse it through the
+        stream's change gate and are not queued.
+        """
+        gate = stream.engine.change_gate
+        pending = {}
+        for face in result.faces:
+            crop = stream.engine.crop_face(frame, face.box)
+            if crop.size == 0:
+                continue
+            thumbnail = None
+            if gate is not None:
+                cached, thumbnail = gate.lookup(face.track_id, crop)
+                if cached is not None:
+                    face.emotion = EmotionResult.from_scores(cached)
+                    continue
+            # The crop is copied, the frame buffer goes back to the bus before the batch runs
+            pending[face.face_index] = (batcher.submit(result.frame_id, face.face_index, crop.copy()), thumbnail)
+        return pending
+
+    def when_scored(self, stream, result, pending):
+        """Fill in the emotions once every queued crop of the frame is scored, then report it"""
+        if not pending:
+            self._deliver(stream, result)
+            return
+        remaining = [len(pending)]
+        lock = threading.Lock()
+
+        def done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            gate = stream.engine.change_gate
+            for face in result.faces:
+                future, thumbnail = pending.get(face.face_index, (None, None))
+                if future is None or future.exception() is not None:
+                    continue
+                emotions = future.result()
+                if gate is not None:
+                    gate.store(face.track_id, thumbnail, emotions)
+                face.emotion = EmotionResult.from_scores(emotions)
+            self._deliver(stream, result)
+
+        for future, _ in pending.values():
+            future.add_done_callback(done)
+
+    def _deliver(self, stream, result):
+        for face in result.faces:
+            stream.engine.tracks.update_emotion(face.track_id, face.emotion, result.frame_id)
+        result.emotion = result.faces[0].emotion if result.faces else None
+        if self.on_result is not None:
+            self.on_result(stream.name, result)
+
+    def report(self):
+        """Per-stream rates and latencies in milliseconds"""
+        elapsed = max(time.monotonic() - self.started_at, 1e-6)
+        streams = {}
+        for stream in self.streams:
+            latency = stream.latency.quantiles((0.5, 0.95))
+            streams[stream.name] = {
+                "capture_fps": stream.bus.latest_frame_id / elapsed,
+                "analyzed_fps": stream.rate.rate(),
+                "latency_p50_ms": latency[0.5] * 1000,
+                "latency_p95_ms": latency[0.95] * 1000,
+                "analysis_p50_ms": stream.analysis.quantiles((0.5,))[0.5] * 1000,
+                "share": stream.busy_seconds / elapsed,
+                "skipped": stream.skipped,
+                "faces": stream.faces,
+                "weight": self.scheduler.weight(stream),
+            }
+        return streams
+
+
+def print_report(report):
+    print(f"{'stream':10} {'capture':>8} {'analyzed':>9} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'share':>6} {'faces':>5} {'weight':>6}")
+    for name, row in report.items():
+        print(f"{name:10} {row['capture_fps']:8.1f} {row['analyzed_fps']:9.1f} {row['latency_p50_ms']:8.1f} "
+              f"{row['latency_p95_ms']:8.1f} {row['share']:6.0%} {row['faces']:5d} {row['weight']:6.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze several cameras, videos or streams at once")
+    parser.add_argument("sources", nargs="+",
+                        help="camera indices, video files or stream URLs, optionally as name=source")
+    parser.add_argument("--backend", choices=["deepface", "fer", "onnx", "none"], default="deepface")
+    parser.add_argument("--weighting", choices=["round_robin", "motion", "faces"], default="round_robin",
+                        help="how analysis time is shared between streams")
+    parser.add_argument("--cpu-budget", type=float, default=0.5, help="fraction of all cores to use")
+    parser.add_argument("--max-wait", type=float, default=1.0,
+                        help="seconds after which a waiting stream goes first")
+    parser.add_argument("--emotion-interval", type=float, default=0.25,
+                        help="seconds between emotion updates per stream")
+    parser.add_argument("--report-every", type=float, default=5.0, help="seconds between reports")
+    parser.add_argument("--duration", type=float, default=None, help="stop after this many seconds")
+    args = parser.parse_args()
+
+    sources = [parse_stream(text) for text in args.sources]
+    analyzer = MultiCameraAnalyzer(
+        sources, weighting=args.weighting, cpu_budget=args.cpu_budget, max_wait=args.max_wait,
+        emotion_interval=args.emotion_interval,
+        emotion_backend=None if args.backend == "none" else args.backend,
+    ).start()
+    try:
+        while args.duration is None or time.monotonic() - analyzer.started_at < args.duration:
+            time.sleep(args.report_every)
+            print_report(analyzer.report())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        analyzer.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Preview Renderer
+Shrink camera frames into reused buffers and show them in one persistent Tk image
+Academic Project - Polis University
+"""
+
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+
+class PreviewRenderer:
+    """Display path of the camera preview without per-frame allocations
+
+    `prepare()` resizes a full-resolution frame with INTER_AREA into a
+    preallocated BGR buffer, overlays are then drawn on that small buffer
+    (scale box coordinates with `scale_box()`). `show()` converts it into a
+    preallocated RGBA buffer shared with a PIL image and pastes that into the
+    same PhotoImage every frame.
+    """
+
+    def __init__(self, label=None, max_size=(600, 450)):
+        self.label = label          # ttk.Label showing the preview, None to skip the Tk step
+        self.max_size = max_size    # Largest (width, height), frames are never enlarged
+        self.source_shape = None
+        self.scale = 1.0
+        self.frame = None           # Preview-sized BGR buffer overlays are drawn on
+        self.rgba = None            # Preview-sized RGBA buffer backing self.image
+        self.image = None
+        self.photo = None
+
+    def _allocate(self, shape):
+        """Size the buffers for frames of `shape`, like PIL's thumbnail()"""
+        height, width = shape[:2]
+        max_width, max_height = self.max_size
+        self.scale = min(max_width / width, max_height / height, 1.0)
+        size = (max(int(width * self.scale), 1), max(int(height * self.scale), 1))
+        self.source_shape = shape
+        self.frame = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        self.rgba = np.empty((size[1], size[0], 4), dtype=np.uint8)
+        # The PIL image reads the RGBA buffer directly, no copy per frame
+        self.image = Image.frombuffer("RGBA", size, self.rgba, "raw", "RGBA", 0, 1)
+        self.photo = None
+
+    def visible(self):
+        """False while the window is minimized or the preview is not mapped"""
+        if self.label is None:
+            return True
+        try:
+            return bool(self.label.winfo_viewable()) and self.label.winfo_toplevel().state() != "iconic"
+        except Exception:
+            return False
+
+    def prepare(self, frame):
+        """Resize a frame into the preview buffer and return that buffer"""
+        if frame.shape != self.source_shape:
+            self._allocate(frame.shape)
+        if self.scale == 1.0:
+            np.copyto(self.frame, frame)
+        else:
+            cv2.resize(frame, (self.frame.shape[1], self.frame.shape[0]),
+                       dst=self.frame, interpolation=cv2.INTER_AREA)
+        return self.frame
+
+    def scale_box(self, box):
+        """Map an (x, y, w, h) box from frame to preview coordinates"""
+        return tuple(int(v * self.scale) for v in box)
+
+    def show(self):
+        """Push the prepared (and drawn on) preview buffer to the label"""
+        cv2.cvtColor(self.frame, cv2.COLOR_BGR2RGBA, dst=self.rgba)
+        if self.label is None:
+            return
+        if self.photo is None:
+            self.photo = ImageTk.PhotoImage(self.image)
+            self.label.config(image=self.photo, text="")
+            self.label.image = self.photo  # Keep a reference
+        else:
+            self.photo.paste(self.image)
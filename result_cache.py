@@ -0,0 +1,248 @@
+"""
+Result Cache
+Remember emotion and gaze results by image content across runs and processes
+Academic Project - Polis University
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from batch_inference import predict_crops
+
+
+class NearTier:
+    """Ring of recent 16x16 thumbnails searched for the closest one in a single NumPy call"""
+
+    def __init__(self, capacity=256, threshold=2.0):
+        self.thumbnails = np.zeros((capacity, 16, 16), dtype=np.int16)
+        self.values = [None] * capacity
+        self.threshold = threshold  # Largest mean absolute difference still counted as a match
+        self.index = 0
+        self.count = 0
+
+    @staticmethod
+    def thumbnail(image):
+        return cv2.resize(image, (16, 16), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def get(self, thumbnail):
+        if self.count == 0:
+            return None
+        distance = np.abs(self.thumbnails[:self.count] - thumbnail).mean(axis=(1, 2))
+        best = int(distance.argmin())
+        return self.values[best] if distance[best] <= self.threshold else None
+
+    def put(self, thumbnail, value):
+        self.thumbnails[self.index] = thumbnail
+        self.values[self.index] = value
+        self.index = (self.index + 1) % len(self.values)
+        self.count = min(self.count + 1, len(self.values))
+
+
+class ResultCache:
+    """Two-tier cache of analysis results keyed by a hash of the analyzed pixels
+
+    The memory tier is a small LRU of exact matches plus, per namespace, a
+    ring of thumbnails that matches near-identical images (16x16, mean
+    absolute difference), which is what the live loop sees from a still
+    face. The optional disk tier is an SQLite database in WAL mode keyed by
+    the exact content hash; every process and thread opens its own
+    connection, so worker processes can share one file. When the database
+    grows past `max_bytes` the least recently used entries go.
+
+    Keys always include a namespace such as the model name and version, so
+    results of different models or settings never mix.
+    """
+
+    def __init__(self, path=None, max_bytes=64 * 1024 * 1024, memory_entries=1024, near_entries=256):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.near_entries = near_entries
+        self.memory = OrderedDict()
+        self.near = {}  # namespace -> NearTier
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.writes_since_trim = 0
+        if path is not None:
+            self._connection()
+
+    def __getstate__(self):
+        # Worker processes get the settings and open their own connection
+        return {"path": self.path, "max_bytes": self.max_bytes, "memory_entries": self.memory_entries,
+                "near_entries": self.near_entries}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key BLOB PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+            self.local.connection = connection
+        return connection
+
+    @staticmethod
+    def exact_key(namespace, image):
+        digest = hashlib.blake2b(namespace.encode(), digest_size=16)
+        digest.update(str(image.shape).encode())
+        digest.update(np.ascontiguousarray(image).tobytes())
+        return digest.digest()
+
+    def _memory_get(self, key):
+        with self.lock:
+            value = self.memory.get(key)
+            if value is not None:
+                self.memory.move_to_end(key)
+            return value
+
+    def _memory_put(self, key, value):
+        with self.lock:
+            self.memory[key] = value
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_entries:
+                self.memory.popitem(last=False)
+
+    def _near_tier(self, namespace):
+        tier = self.near.get(namespace)
+        if tier is None:
+            tier = self.near[namespace] = NearTier(self.near_entries)
+        return tier
+
+    def get(self, namespace, image, near=False):
+        """Cached result for a uint8 image, or None
+
+        With `near` an image that only differs by noise from a recently
+        stored one also counts as a hit.
+        """
+        exact = self.exact_key(namespace, image)
+        value = self._memory_get(exact)
+        if value is None and near:
+            with self.lock:
+                value = self._near_tier(namespace).get(NearTier.thumbnail(image))
+        if value is not None:
+            self._count(hit=True)
+            return value
+
+        if self.path is not None:
+            connection = self._connection()
+            row = connection.execute("SELECT value FROM results WHERE key = ?", (exact,)).fetchone()
+            if row is not None:
+                value = json.loads(row[0])
+                connection.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), exact))
+                self._memory_put(exact, value)
+
+        self._count(hit=value is not None)
+        return value
+
+    def _count(self, hit):
+        # Shared by threads and server streams, so counted under the lock
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def put(self, namespace, image, value, near=False):
+        """Store a JSON-serializable result for a uint8 image"""
+        exact = self.exact_key(namespace, image)
+        self._memory_put(exact, value)
+        if near:
+            with self.lock:
+                self._near_tier(namespace).put(NearTier.thumbnail(image), value)
+        if self.path is None:
+            return
+
+        text = json.dumps(value)
+        self._connection().execute(
+            "INSERT OR REPLACE INTO results (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+            (exact, text, len(text) + len(exact), time.time())
+        )
+        with self.lock:
+            self.writes_since_trim += 1
+            due = self.writes_since_trim >= 256
+            if due:
+                self.writes_since_trim = 0
+        if due:
+            self.trim()
+
+    def trim(self):
+        """Delete least recently used rows until the database fits in max_bytes"""
+        if self.path is None:
+            return
+        connection = self._connection()
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        # Walk the oldest rows until enough bytes are covered, delete them in one statement
+        cutoff, freed = None, 0
+        for last_used, size in connection.execute("SELECT last_used, size FROM results ORDER BY last_used"):
+            freed += size
+            cutoff = last_used
+            if freed >= excess:
+                break
+        if cutoff is not None:
+            connection.execute("DELETE FROM results WHERE last_used <= ?", (cutoff,))
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0, "memory_entries": len(self.memory)}
+
+    def close(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+
+def model_input(model, crop):
+    """The crop as the model sees it (grayscale at input size), uint8 for hashing"""
+    gray = crop if crop.ndim == 2 else cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, model.input_size, interpolation=cv2.INTER_AREA)
+
+
+def predict_crops_cached(cache, model, items, max_batch_size=8, near=False):
+    """predict_crops that serves repeated crops from the cache and stores the new ones
+
+    With near=True a crop may also get the result of a near-identical one,
+    which suits a live camera; offline scoring keeps exact matches only so
+    its results do not depend on processing order.
+    """
+    namespace = f"emotion:{model.cache_key}"
+    results = {}
+    misses = []
+    inputs = {}
+    for frame_id, face_index, crop in items:
+        image = model_input(model, crop)
+        cached = cache.get(namespace, image, near=near)
+        if cached is not None:
+            results[(frame_id, face_index)] = cached
+        else:
+            inputs[(frame_id, face_index)] = image
+            misses.append((frame_id, face_index, crop))
+
+    predicted = predict_crops(model, misses, max_batch_size)
+    for key, emotions in predicted.items():
+        cache.put(namespace, inputs[key], emotions, near=near)
+    results.update(predicted)
+    return results
@@ -0,0 +1,104 @@
+"""
+Scheduler
+Pick display and emotion refresh rates from measured stage latencies and CPU load
+Academic Project - Polis University
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from instrumentation import NULL_METRICS
+
+
+class AdaptiveScheduler:
+    """Replace fixed sleeps with delays derived from what each stage really costs
+
+    Stages report their latency with `measure()` or `record()`. The display
+    loop asks `display_delay_ms()` what to pass to `root.after`, the emotion
+    loop asks `emotion_delay()` how long to sleep. Both aim for their target
+    rate and back off together when the process uses more CPU than
+    `cpu_budget` (fraction of all cores), speeding up again when there is room.
+    """
+
+    def __init__(self, target_fps=30, target_emotion_hz=4, min_emotion_hz=0.5,
+                 cpu_budget=0.75, emotion_duty=0.5, smoothing=0.2, metrics=None):
+        self.target_fps = target_fps
+        self.target_emotion_hz = target_emotion_hz
+        self.min_emotion_hz = min_emotion_hz
+        self.cpu_budget = cpu_budget
+        # Largest fraction of wall time the emotion loop may spend inferring
+        self.emotion_duty = emotion_duty
+        self.smoothing = smoothing
+        # Every recorded sample is also forwarded to the metrics histograms
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+
+        # Exponential moving average of each stage's latency in seconds
+        self.latency = {}
+        # >= 1, grows while the CPU is saturated and shrinks when it is idle
+        self.pressure = 1.0
+
+        self.cores = os.cpu_count() or 1
+        self.cpu_usage = 0.0
+        self._last_wall = time.monotonic()
+        self._last_cpu = time.process_time()
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        """Fold one latency sample into the stage's moving average"""
+        self.metrics.observe(stage, seconds)
+        with self.lock:
+            previous = self.latency.get(stage)
+            if previous is None:
+                self.latency[stage] = seconds
+            else:
+                self.latency[stage] = previous + self.smoothing * (seconds - previous)
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def _update_pressure(self):
+        """Compare process CPU time to wall time and adjust the back-off factor"""
+        now, cpu = time.monotonic(), time.process_time()
+        elapsed = now - self._last_wall
+        if elapsed < 0.5:
+            return
+        self.cpu_usage = (cpu - self._last_cpu) / (elapsed * self.cores)
+        self._last_wall, self._last_cpu = now, cpu
+
+        if self.cpu_usage > self.cpu_budget:
+            self.pressure = min(self.pressure * 1.25, 8.0)
+        elif self.cpu_usage < self.cpu_budget * 0.7:
+            self.pressure = max(self.pressure * 0.9, 1.0)
+
+    def display_delay_ms(self):
+        """Milliseconds until the next display update"""
+        with self.lock:
+            self._update_pressure()
+            period = 1.0 / self.target_fps
+            work = sum(self.latency.get(stage, 0.0) for stage in ("attention", "render"))
+            # Under pressure the display gives up frames first so inference keeps up
+            delay = max(period - work, 0.001) + (self.pressure - 1.0) * period
+        return max(int(delay * 1000), 1)
+
+    def emotion_delay(self):
+        """Seconds the emotion loop should sleep before its next inference"""
+        with self.lock:
+            self._update_pressure()
+            inference = self.latency.get("emotion", 0.0)
+            # Do not spend more than emotion_duty of the time inferring
+            period = max(1.0 / self.target_emotion_hz, inference / self.emotion_duty)
+            period = min(period * self.pressure, 1.0 / self.min_emotion_hz)
+            return max(period - inference, 0.0)
+
+    def snapshot(self):
+        """Current latencies (ms), CPU usage and pressure for display or logging"""
+        with self.lock:
+            stages = {stage: seconds * 1000 for stage, seconds in self.latency.items()}
+            return {"latency_ms": stages, "cpu_usage": self.cpu_usage, "pressure": self.pressure}
@@ -0,0 +1,470 @@
+"""
+Analysis Server
+Serve the attention and emotion pipeline to many camera clients over HTTP
+Academic Project - Polis University
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from analysis_engine import AnalysisEngine, EmotionResult
+from batch_inference import EmotionBatcher
+from model_registry import registry
+
+MJPEG_TYPE = "multipart/x-mixed-replace"
+
+
+class BodyReader:
+    """Read a request body that is either chunked or streamed until the client closes"""
+
+    def __init__(self, reader, chunked):
+        self.reader = reader
+        self.chunked = chunked
+        self.buffer = bytearray()
+        self.eof = False
+
+    async def _fill(self):
+        if self.eof:
+            return False
+        if self.chunked:
+            size_line = await self.reader.readline()
+            size = int(size_line.split(b";")[0].strip() or b"0", 16)
+            if size < 0:
+                raise ValueError(f"Bad chunk size: {size}")
+            if size == 0:
+                await self.reader.readline()
+                self.eof = True
+                return False
+            self.buffer += await self.reader.readexactly(size)
+            await self.reader.readexactly(2)
+        else:
+            data = await self.reader.read(65536)
+            if not data:
+                self.eof = True
+                return False
+            self.buffer += data
+        return True
+
+    async def readline(self):
+        while b"\n" not in self.buffer:
+            if not await self._fill():
+                line, self.buffer = bytes(self.buffer), bytearray()
+                return line
+        end = self.buffer.index(b"\n") + 1
+        line = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        return line
+
+    async def readexactly(self, count):
+        while len(self.buffer) < count:
+            if not await self._fill():
+                raise asyncio.IncompleteReadError(bytes(self.buffer), count)
+        data = bytes(self.buffer[:count])
+        del self.buffer[:count]
+        return data
+
+
+async def read_mjpeg_parts(body, max_part_bytes=None):
+    """Yield the images of a multipart/x-mixed-replace body, each part needs a Content-Length"""
+    while True:
+        line = await body.readline()
+        if not line:
+            return
+        if not line.startswith(b"--"):
+            continue
+        if line.strip().endswith(b"--"):
+            return
+        length = None
+        while True:
+            header = await body.readline()
+            if header in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = header.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value.strip())
+        if length is None:
+            raise ValueError("MJPEG parts need a Content-Length header")
+        if length < 0 or (max_part_bytes is not None and length > max_part_bytes):
+            raise ValueError(f"MJPEG part Content-Length out of range: {length}")
+        yield await body.readexactly(length)
+
+
+def decode_image(data):
+    """JPEG or PNG bytes to a BGR frame"""
+    frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError("Could not decode image")
+    return frame
+
+
+def face_payload(face_index, box, track_id, state, emotions):
+    """JSON-ready description of one face"""
+    payload = {
+        "face_index": face_index,
+        "track_id": track_id,
+        "box": [int(v) for v in box],
+        "attention": state.status if state is not None else None,
+        "gaze": [float(v) for v in state.gaze] if state is not None and state.gaze is not None else None,
+        "emotions": None,
+        "dominant_emotion": None,
+        "confidence": None,
+    }
+    if emotions:
+        result = EmotionResult.from_scores(emotions)
+        payload.update(emotions=result.emotions, dominant_emotion=result.dominant_emotion,
+                       confidence=result.confidence)
+    return payload
+
+
+class ClientState:
+    """Per-client engine (own tracks and face tracker) and counters"""
+
+    def __init__(self, client_id, engine_options):
+        self.client_id = client_id
+        self.engine = AnalysisEngine(wait_for_model=False, **engine_options)
+        self.lock = asyncio.Lock()  # One frame of a client is analyzed at a time
+        self.next_frame_id = 0
+        self.received = 0
+        self.analyzed = 0
+        self.dropped = 0
+        self.last_seen = time.monotonic()
+
+
+class AnalysisServer:
+    """asyncio HTTP server running the analysis pipeline for many clients
+
+    POST /analyze   one JPEG/PNG frame, answered with the faces as JSON
+    POST /stream    an MJPEG (multipart/x-mixed-replace) body, answered with
+                    one NDJSON line per analyzed frame while the client sends
+    GET  /stats     counters per client
+    GET  /health    readiness of the emotion model
+
+    Clients are told apart by the X-Client-Id header. The emotion crops of
+    all clients go through one EmotionBatcher, at most `max_in_flight`
+    frames are analyzed at once and a stream that falls behind only keeps its
+    newest frame, the older ones are dropped.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8765, emotion_backend="deepface", max_in_flight=8,
+                 max_batch_size=8, max_wait=0.02, threads=4, busy_timeout=2.0, client_timeout=60.0,
+                 max_body_bytes=16 * 1024 * 1024, **engine_options):
+        self.host = host
+        self.port = port
+        self.emotion_backend = emotion_backend
+        self.engine_options = dict(engine_options, emotion_backend=emotion_backend)
+        self.max_in_flight = max_in_flight
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.busy_timeout = busy_timeout      # How long a single POST may wait for a free slot
+        self.client_timeout = client_timeout  # Idle clients are forgotten after this many seconds
+        self.max_body_bytes = max_body_bytes  # Largest /analyze body or /stream part that is buffered
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix="analysis")
+        self.clients = {}
+        self.batcher = None
+        self.in_flight = None
+        self.server = None
+        self.rejected = 0
+
+    async def start(self):
+        if self.emotion_backend is not None:
+            registry.load_async(self.emotion_backend)
+        self.in_flight = asyncio.Semaphore(self.max_in_flight)
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.batcher is not None:
+            self.batcher.close()
+        self.executor.shutdown(wait=False)
+
+    def get_batcher(self):
+        """Shared emotion batcher, None until the model finished loading"""
+        if self.batcher is None and self.emotion_backend is not None and registry.is_ready(self.emotion_backend):
+            model = registry.get(self.emotion_backend, wait=False)
+            if model is not None:
+                self.batcher = EmotionBatcher(model, self.max_batch_size, self.max_wait)
+        return self.batcher
+
+    def client(self, client_id):
+        now = time.monotonic()
+        for stale in [c for c, s in self.clients.items() if now - s.last_seen > self.client_timeout]:
+            del self.clients[stale]
+        state = self.clients.get(client_id)
+        if state is None:
+            state = self.clients[client_id] = ClientState(client_id, self.engine_options)
+        state.last_seen = now
+        return state
+
+    async def analyze(self, client, data):
+        """Decode and analyze one frame of a client, returns the JSON-ready result"""
+        loop = asyncio.get_running_loop()
+        async with client.lock:
+            start = time.perf_counter()
+            frame_id = client.next_frame_id
+            client.next_frame_id += 1
+            timestamp = time.time()
+            frame = await loop.run_in_executor(self.executor, decode_image, data)
+            engine = client.engine
+            attention = await loop.run_in_executor(self.executor, engine.detect_attention, frame, timestamp)
+
+            # Crops of every client share the batched model calls
+            emotions = {}
+            batcher = self.get_batcher()
+            if batcher is not None and attention.faces:
+                crops = {i: engine.crop_face(frame, box) for i, box in enumerate(attention.faces)}
+                futures = {i: batcher.submit(frame_id, i, crop) for i, crop in crops.items() if crop.size > 0}
+                results = await asyncio.gather(*(asyncio.wrap_future(f) for f in futures.values()),
+                                               return_exceptions=True)
+                for i, result in zip(futures, results):
+                    if not isinstance(result, Exception):
+                        emotions[i] = result
+
+            faces = []
+            for i, (box, track_id, state) in enumerate(zip(attention.faces, attention.track_ids,
+                                                            attention.per_face)):
+                if i in emotions:
+                    engine.tracks.update_emotion(track_id, EmotionResult.from_scores(emotions[i]), frame_id)
+                faces.append(face_payload(i, box, track_id, state, emotions.get(i)))
+            client.analyzed += 1
+            return {
+                "client_id": client.client_id,
+                "frame_id": frame_id,
+                "timestamp": timestamp,
+                "attention": attention.status,
+                "faces": faces,
+                "latency": time.perf_counter() - start,
+            }
+
+    async def handle_connection(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            try:
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+            except ValueError:
+                await self.respond(writer, 400, {"error": "malformed request line"})
+                return
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            client_id = headers.get("x-client-id") or "%s:%s" % writer.get_extra_info("peername")[:2]
+            if method == "GET" and path == "/health":
+                ready = self.emotion_backend is None or registry.is_ready(self.emotion_backend)
+                await self.respond(writer, 200, {"ready": ready, "clients": len(self.clients)})
+            elif method == "GET" and path == "/stats":
+                await self.respond(writer, 200, self.stats())
+            elif method == "POST" and path == "/analyze":
+                try:
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "bad content-length"})
+                    return
+                if length < 0:
+                    await self.respond(writer, 400, {"error": "bad content-length"})
+                    return
+                if length > self.max_body_bytes:
+                    await self.respond(writer, 413, {"error": f"body larger than {self.max_body_bytes} bytes"})
+                    return
+                body = await reader.readexactly(length)
+                await self.handle_single(writer, self.client(client_id), body)
+            elif method == "POST" and path == "/stream":
+                chunked = headers.get("transfer-encoding", "").lower() == "chunked"
+                await self.handle_stream(reader, writer, self.client(client_id), BodyReader(reader, chunked))
+            else:
+                await self.respond(writer, 404, {"error": "not found"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload):
+        body = json.dumps(payload).encode()
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+                  503: "Service Unavailable"}[status]
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+
+    async def handle_single(self, writer, client, body):
+        client.received += 1
+        # Bounded in-flight work: a single frame waits briefly, then the client is told to retry
+        try:
+            await asyncio.wait_for(self.in_flight.acquire(), self.busy_timeout)
+        except asyncio.TimeoutError:
+            client.dropped += 1
+            self.rejected += 1
+            await self.respond(writer, 503, {"error": "busy"})
+            return
+        try:
+            result = await self.analyze(client, body)
+        except ValueError as e:
+            await self.respond(writer, 400, {"error": str(e)})
+            return
+        finally:
+            self.in_flight.release()
+        await self.respond(writer, 200, result)
+
+    async def handle_stream(self, reader, writer, client, body):
+        """Analyze the newest frame of an MJPEG upload whenever the previous one is done"""
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                     b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+        latest = asyncio.Queue(maxsize=1)
+        done = object()
+
+        async def receive():
+            error = None
+            try:
+                async for data in read_mjpeg_parts(body, self.max_body_bytes):
+                    client.received += 1
+                    # An active stream is never evicted as idle
+                    client.last_seen = time.monotonic()
+                    if latest.full():
+                        # The analysis fell behind, replace the waiting frame with the newer one
+                        latest.get_nowait()
+                        client.dropped += 1
+                    latest.put_nowait(data)
+            except ValueError as e:
+                # Malformed part or chunk, reported to the client as the last line
+                error = {"error": str(e)}
+            finally:
+                # The end marker carries a frame still waiting, so it is analyzed too,
+                # and put_nowait never blocks (also not after receiver.cancel())
+                last = None if latest.empty() else latest.get_nowait()
+                latest.put_nowait((done, last, error))
+
+        receiver = asyncio.create_task(receive())
+        try:
+            while True:
+                data = await latest.get()
+                final = isinstance(data, tuple) and data[0] is done
+                results = []
+                if final:
+                    _, data, error = data
+                if data is not None:
+                    async with self.in_flight:
+                        try:
+                            results.append(await self.analyze(client, data))
+                        except ValueError as e:
+                            results.append({"error": str(e)})
+                if final and error is not None:
+                    results.append(error)
+                for result in results:
+                    line = json.dumps(result).encode() + b"\n"
+                    writer.write(b"%x\r\n%s\r\n" % (len(line), line))
+                # A slow reader blocks here, meanwhile newer frames replace older ones
+                await writer.drain()
+                if final:
+                    break
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        finally:
+            receiver.cancel()
+            # Retrieve what the receiver raised (a dropped connection, or the cancellation)
+            await asyncio.gather(receiver, return_exceptions=True)
+
+    def stats(self):
+        return {
+            "in_flight_limit": self.max_in_flight,
+            "rejected": self.rejected,
+            "batches_run": self.batcher.batches_run if self.batcher else 0,
+            "crops_run": self.batcher.crops_run if self.batcher else 0,
+            "crops_rejected": self.batcher.rejected if self.batcher else 0,
+            "clients": {
+                client_id: {"received": c.received, "analyzed": c.analyzed, "dropped": c.dropped}
+                for client_id, c in self.clients.items()
+            },
+        }
+
+
+def encode_frame(frame, quality=85):
+    ok, data = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Could not encode frame")
+    return data.tobytes()
+
+
+def post_frame(host, port, frame, client_id="client", timeout=30):
+    """Loopback client: send one frame to /analyze and return the decoded JSON"""
+    connection = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        connection.request("POST", "/analyze", body=encode_frame(frame),
+                           headers={"Content-Type": "image/jpeg", "X-Client-Id": client_id})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def stream_frames(host, port, frames, client_id="client", timeout=30):
+    """Loopback client: upload frames as one MJPEG stream, returns the NDJSON results"""
+    boundary = "frame"
+
+    def body():
+        for frame in frames:
+            data = encode_frame(frame)
+            yield (f"--{boundary}\r\nContent-Type: image/jpeg\r\n"
+                   f"Content-Length: {len(data)}\r\n\r\n").encode() + data + b"\r\n"
+        yield f"--{boundary}--\r\n".encode()
+
+    connection = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        connection.request("POST", "/stream", body=body(), encode_chunked=True, headers={
+            "Content-Type": f"{MJPEG_TYPE}; boundary={boundary}", "X-Client-Id": client_id,
+        })
+        response = connection.getresponse()
+        return [json.loads(line) for line in response.read().splitlines() if line.strip()]
+    finally:
+        connection.close()
+
+
+async def serve(args):
+    server = AnalysisServer(
+        args.host, args.port, None if args.backend == "none" else args.backend,
+        max_in_flight=args.max_in_flight, max_batch_size=args.batch_size, threads=args.threads,
+        detect_every=args.detect_every, max_body_bytes=int(args.max_body_mb * 1024 * 1024),
+    )
+    await server.start()
+    print(f"Serving on http://{server.host}:{server.port} (POST /analyze, POST /stream, GET /stats)")
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve attention and emotion analysis to camera clients")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--backend", choices=["deepface", "fer", "onnx", "none"], default="deepface")
+    parser.add_argument("--max-in-flight", type=int, default=8, help="frames analyzed at the same time")
+    parser.add_argument("--batch-size", type=int, default=8, help="largest emotion batch across clients")
+    parser.add_argument("--threads", type=int, default=4, help="threads for decoding and attention")
+    parser.add_argument("--detect-every", type=int, default=1, help="face cascade every N frames per client")
+    parser.add_argument("--max-body-mb", type=float, default=16.0,
+                        help="largest frame accepted in one request or stream part")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
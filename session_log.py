@@ -0,0 +1,316 @@
+"""
+Session Log
+Record every analyzed face to a compact binary file and summarize long sessions
+Academic Project - Polis University
+"""
+
+import argparse
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from analysis_engine import LOOKING
+from emotion_backends import EMOTION_LABELS
+
+MAGIC = b"EMOLOG1\0"
+# magic, format version, record size, index interval, start time, record count
+HEADER = struct.Struct("<8sHHIdQ")
+HEADER_SIZE = 64
+
+# Flag bits of a record
+LOOKING_FLAG = 1
+EMOTION_FLAG = 2
+GAZE_FLAG = 4
+
+# One face in one frame, 48 bytes
+RECORD = np.dtype([
+    ("timestamp", "<f8"),         # Seconds since the epoch
+    ("frame_id", "<u4"),
+    ("track_id", "<i4"),
+    ("box", "<i2", 4),            # x, y, w, h in pixels
+    ("emotions", "<f2", 7),       # Percent, EMOTION_LABELS order
+    ("gaze", "<f2", 2),           # Iris offset in percent of the eye size
+    ("flags", "u1"),
+    ("reserved", "u1", 5),
+])
+
+# Every index_every-th record's number and timestamp, for seeking by time
+INDEX_ENTRY = np.dtype([("record", "<u8"), ("timestamp", "<f8")])
+
+Summary = namedtuple("Summary", ["start", "frames", "faces", "attention_rate", "emotions", "dominant_emotion"])
+
+
+class SessionRecorder:
+    """Append per-face results to a memory-mapped log from a background thread
+
+    `record()` only puts the frame on a bounded queue, so the live loop
+    never waits for the disk; when the writer falls behind, frames are
+    dropped and counted. The file grows in blocks of `grow_records`, the
+    header's record count is updated every `flush_interval` seconds and on
+    close, and every `index_every` records an entry goes to `<path>.idx`.
+    """
+
+    def __init__(self, path, index_every=4096, grow_records=65536, queue_size=1024, flush_interval=1.0):
+        self.path = path
+        self.index_every = index_every
+        self.grow_records = grow_records
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.count = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.file = open(path, "w+b")
+        self.index_file = open(path + ".idx", "wb")
+        self.start_time = time.time()
+        self.capacity = 0
+        self.map = None
+        self.records = None
+        self._grow()
+        self._write_header()
+
+        self.thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self.thread.start()
+
+    def record(self, timestamp, frame_id, faces):
+        """Queue one frame, `faces` holds (track_id, box, emotions or None, gaze or None, looking)"""
+        try:
+            self.queue.put_nowait((timestamp, frame_id, faces))
+        except queue.Full:
+            self.dropped += 1
+
+    def record_result(self, result, timestamp=None):
+        """Queue the faces of an AnalysisEngine FrameResult"""
+        faces = [
+            (face.track_id if face.track_id is not None else -1, face.box,
+             face.emotion.emotions if face.emotion is not None else None,
+             face.attention.gaze if face.attention is not None else None,
+             face.attention is not None and face.attention.status == LOOKING)
+            for face in result.faces
+        ]
+        self.record(time.time() if timestamp is None else timestamp, result.frame_id, faces)
+
+    def _grow(self):
+        """Extend the file by grow_records and map it again"""
+        if self.map is not None:
+            self.records = None
+            self.map.close()
+        self.capacity += self.grow_records
+        self.file.truncate(HEADER_SIZE + self.capacity * RECORD.itemsize)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.records = np.frombuffer(self.map, dtype=RECORD, count=self.capacity, offset=HEADER_SIZE)
+
+    def _write_header(self):
+        self.map[:HEADER.size] = HEADER.pack(MAGIC, 1, RECORD.itemsize, self.index_every,
+                                             self.start_time, self.count)
+
+    def _write(self, timestamp, frame_id, faces):
+        if not faces:
+            return
+        if self.count + len(faces) > self.capacity:
+            self._grow()
+        for track_id, box, emotions, gaze, looking in faces:
+            if self.count % self.index_every == 0:
+                np.array([(self.count, timestamp)], dtype=INDEX_ENTRY).tofile(self.index_file)
+            row = self.records[self.count]
+            row["timestamp"] = timestamp
+            row["frame_id"] = frame_id
+            row["track_id"] = track_id
+            row["box"] = box
+            flags = LOOKING_FLAG if looking else 0
+            if emotions:
+                row["emotions"] = [emotions.get(label, 0.0) for label in EMOTION_LABELS]
+                flags |= EMOTION_FLAG
+            if gaze is not None:
+                row["gaze"] = gaze
+                flags |= GAZE_FLAG
+            row["flags"] = flags
+            self.count += 1
+
+    def _writer_loop(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                # Sentinel from close(), everything queued before it is written
+                break
+            if item:
+                self._write(*item)
+            if time.monotonic() - last_flush >= self.flush_interval:
+                self._write_header()
+                self.index_file.flush()
+                last_flush = time.monotonic()
+
+    def close(self):
+        """Write what is queued, then cut the file to the records actually written"""
+        self.queue.put(None)
+        self.thread.join()
+        self._write_header()
+        self.map.flush()
+        self.records = None
+        self.map.close()
+        self.file.truncate(HEADER_SIZE + self.count * RECORD.itemsize)
+        self.file.close()
+        self.index_file.close()
+
+
+class SessionLog:
+    """Read a recorded session through a memory map, without loading it
+
+    Records are in time order, `chunks()` hands out memory-mapped slices
+    and `summarize()` reduces them chunk by chunk, so multi-hour logs need
+    only as much memory as one chunk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version, record_size, index_every, start_time, count = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or record_size != RECORD.itemsize:
+            raise ValueError(f"Not a session log: {path}")
+        self.version = version
+        self.index_every = index_every
+        self.start_time = start_time
+        # A log that was not closed cleanly may hold more records than the
+        # header counted at its last flush, those are ignored
+        available = (os.path.getsize(path) - HEADER_SIZE) // RECORD.itemsize
+        self.count = min(count, available)
+        self.records = (np.memmap(path, dtype=RECORD, mode="r", offset=HEADER_SIZE, shape=(self.count,))
+                        if self.count else np.zeros(0, dtype=RECORD))
+
+        index_path = path + ".idx"
+        index = np.fromfile(index_path, dtype=INDEX_ENTRY) if os.path.exists(index_path) else None
+        self.index = index[index["record"] < self.count] if index is not None else None
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def first_time(self):
+        return float(self.records[0]["timestamp"]) if self.count else self.start_time
+
+    @property
+    def end_time(self):
+        return float(self.records[-1]["timestamp"]) if self.count else self.start_time
+
+    def seek(self, timestamp):
+        """Number of the first record at or after `timestamp`"""
+        if self.count == 0:
+            return 0
+        low, high = 0, self.count
+        if self.index is not None and len(self.index):
+            # The index narrows the search to one block, only that block is read
+            block = int(np.searchsorted(self.index["timestamp"], timestamp, side="right")) - 1
+            if block >= 0:
+                low = int(self.index["record"][block])
+            if block + 1 < len(self.index):
+                high = int(self.index["record"][block + 1])
+        times = self.records["timestamp"][low:high]
+        return low + int(np.searchsorted(times, timestamp, side="left"))
+
+    def chunks(self, start=None, end=None, chunk_records=1 << 18):
+        """Memory-mapped record slices between two timestamps"""
+        first = 0 if start is None else self.seek(start)
+        last = self.count if end is None else self.seek(end)
+        for offset in range(first, last, chunk_records):
+            yield self.records[offset:min(offset + chunk_records, last)]
+
+    def summarize(self, period=60.0, start=None, end=None, chunk_records=1 << 18):
+        """Attention and emotion per `period` seconds (a minute by default)
+
+        Each Summary has the period's start time, the frames and faces
+        recorded, the share of faces looking at the screen and the mean of
+        every emotion over the faces that had emotion scores.
+        """
+        if start is not None:
+            origin = start
+        else:
+            # Periods start on whole minutes (or periods) of the clock
+            origin = self.first_time // period * period
+        faces = np.zeros(0)
+        looking = np.zeros(0)
+        frames = np.zeros(0)
+        scored = np.zeros(0)
+        emotion_sums = np.zeros((0, len(EMOTION_LABELS)))
+        last_frame = None
+
+        for chunk in self.chunks(start, end, chunk_records):
+            bins = ((chunk["timestamp"] - origin) // period).astype(np.int64)
+            bins = np.maximum(bins, 0)
+            size = int(bins[-1]) + 1
+            if size > len(faces):
+                faces, looking, frames, scored = (np.pad(a, (0, size - len(a))) for a in (faces, looking, frames, scored))
+                emotion_sums = np.pad(emotion_sums, ((0, size - len(emotion_sums)), (0, 0)))
+
+            flags = chunk["flags"]
+            faces += np.bincount(bins, minlength=size)
+            looking += np.bincount(bins, weights=(flags & LOOKING_FLAG) > 0, minlength=size)
+
+            # A new frame starts wherever the frame ID changes, also across chunk borders
+            frame_ids = chunk["frame_id"].astype(np.int64)
+            starts = np.empty(len(chunk), dtype=bool)
+            starts[0] = last_frame is None or frame_ids[0] != last_frame
+            starts[1:] = frame_ids[1:] != frame_ids[:-1]
+            frames += np.bincount(bins, weights=starts, minlength=size)
+            last_frame = frame_ids[-1]
+
+            has_emotion = (flags & EMOTION_FLAG) > 0
+            scored += np.bincount(bins, weights=has_emotion, minlength=size)
+            emotions = chunk["emotions"][has_emotion].astype(np.float64)
+            for k in range(len(EMOTION_LABELS)):
+                emotion_sums[:, k] += np.bincount(bins[has_emotion], weights=emotions[:, k], minlength=size)
+
+        summaries = []
+        for i in range(len(faces)):
+            if faces[i] == 0:
+                continue
+            means = emotion_sums[i] / scored[i] if scored[i] else None
+            summaries.append(Summary(
+                start=origin + i * period,
+                frames=int(frames[i]),
+                faces=int(faces[i]),
+                attention_rate=float(looking[i] / faces[i]),
+                emotions=dict(zip(EMOTION_LABELS, means.tolist())) if means is not None else None,
+                dominant_emotion=EMOTION_LABELS[int(means.argmax())] if means is not None else None,
+            ))
+        return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a recorded session log")
+    parser.add_argument("path", help="log written with --record")
+    parser.add_argument("--period", type=float, default=60.0, help="seconds per summary row")
+    parser.add_argument("--csv", help="also write the summary to this CSV file")
+    args = parser.parse_args()
+
+    log = SessionLog(args.path)
+    print(f"{len(log)} face records, {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(log.first_time))} "
+          f"for {(log.end_time - log.first_time) / 60:.1f} minutes")
+    summaries = log.summarize(args.period)
+    print(f"{'time':8} {'frames':>7} {'faces':>7} {'looking':>8}  dominant emotion")
+    for row in summaries:
+        dominant = f"{row.dominant_emotion} ({row.emotions[row.dominant_emotion]:.0f}%)" if row.emotions else "-"
+        print(f"{time.strftime('%H:%M:%S', time.localtime(row.start))} {row.frames:7d} {row.faces:7d} "
+              f"{row.attention_rate:8.0%}  {dominant}")
+
+    if args.csv:
+        with open(args.csv, "w") as f:
+            f.write(",".join(["start", "frames", "faces", "attention_rate"] + EMOTION_LABELS) + "\n")
+            for row in summaries:
+                emotions = [f"{row.emotions[label]:.2f}" if row.emotions else "" for label in EMOTION_LABELS]
+                f.write(",".join([f"{row.start:.3f}", str(row.frames), str(row.faces),
+                                  f"{row.attention_rate:.4f}"] + emotions) + "\n")
+
+
+if __name__ == "__main__":
+    main()
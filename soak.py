@@ -0,0 +1,220 @@
+"""
+Soak Test
+Run the live pipeline against a synthetic camera for hours and check memory and GC pauses
+Academic Project - Polis University
+"""
+
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from analysis_engine import AnalysisEngine, LOOKING
+from benchmark import current_rss_mb, synthetic_frame
+from frame_bus import FrameBus
+from instrumentation import GCMonitor, RateMeter
+from render import PreviewRenderer
+from result_cache import ResultCache
+
+
+class SyntheticCapture:
+    """Stand-in for cv2.VideoCapture that cycles through pre-rendered frames
+
+    Scenes with zero to three drawn faces alternate every `scene_frames`
+    frames, so tracks are created and evicted all the time. `read(image)`
+    copies into the caller's buffer like a real capture does.
+    """
+
+    def __init__(self, width=640, height=480, scene_frames=90, seed=0):
+        rng = np.random.default_rng(seed)
+        self.frames = [synthetic_frame(height, width, faces, rng)[0] for faces in (1, 2, 0, 3)]
+        self.scene_frames = scene_frames
+        self.position = 0
+        self.opened = True
+
+    def isOpened(self):
+        return self.opened
+
+    def grab(self):
+        self.position += 1
+        return self.opened
+
+    def read(self, image=None):
+        if not self.opened:
+            return False, image
+        frame = self.frames[(self.position // self.scene_frames) % len(self.frames)]
+        self.position += 1
+        if image is None or image.shape != frame.shape:
+            return True, frame.copy()
+        np.copyto(image, frame)
+        return True, image
+
+    def set(self, prop, value):
+        return False
+
+    def get(self, prop):
+        return 0.0
+
+    def release(self):
+        self.opened = False
+
+
+def rss_slope(samples):
+    """Least-squares RSS growth in MB per hour over (seconds, MB) samples"""
+    if len(samples) < 2:
+        return 0.0
+    seconds, rss = np.array(samples).T
+    seconds = seconds - seconds.mean()
+    spread = float((seconds * seconds).sum())
+    if spread == 0:
+        return 0.0
+    return float((seconds * (rss - rss.mean())).sum() / spread * 3600)
+
+
+def draw_preview(renderer, frame, attention):
+    """Same drawing work as the app's overlays, on the preview buffer"""
+    for face, state in zip(attention.faces, attention.per_face):
+        x, y, w, h = renderer.scale_box(face)
+        color = (0, 255, 0) if state.status == LOOKING else (0, 165, 255)
+        cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
+        for eye in state.eyes:
+            ex, ey, ew, eh = renderer.scale_box(eye)
+            cv2.rectangle(frame, (ex, ey), (ex + ew, ey + eh), (255, 0, 0), 2)
+    cv2.putText(frame, f"Attention: {attention.status}", (15, frame.shape[0] - 20),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+
+
+def soak(duration, emotion_backend=None, fps=30, warmup=60.0, sample_every=10.0, report_every=60.0,
+         emotion_interval=0.25, freeze=True, trace=False, log=print):
+    """Run capture, attention, emotions and preview rendering for `duration` seconds
+
+    RSS is sampled every `sample_every` seconds once `warmup` seconds have
+    passed (caches and buffers fill up during warmup). Returns a report with
+    the RSS growth after warmup, its slope and the GC pauses.
+    """
+    bus = FrameBus(SyntheticCapture(), slots=4, fps=fps).start()
+    engine = AnalysisEngine(emotion_backend=emotion_backend, wait_for_model=False, detect_every=5,
+                            change_threshold=4.0, result_cache=ResultCache(), cache_near=True)
+    engine.start_loading()
+    renderer = PreviewRenderer(label=None)
+    monitor = GCMonitor().start()
+    rate = RateMeter()
+
+    samples = []
+    snapshot = None
+    frames = 0
+    last_frame_id = -1
+    last_emotion = 0.0
+    started = time.monotonic()
+    next_sample = started + warmup
+    next_report = started + report_every
+    warm = False
+    try:
+        while time.monotonic() - started < duration:
+            packet = bus.acquire(after_id=last_frame_id, timeout=1.0)
+            if packet is None:
+                continue
+            last_frame_id = packet.frame_id
+            try:
+                attention = engine.detect_attention(packet.image, packet.timestamp)
+                now = time.monotonic()
+                if emotion_backend is not None and now - last_emotion >= emotion_interval:
+                    engine.detect_track_emotions(packet.image, packet.frame_id, attention.faces,
+                                                 attention.track_ids)
+                    last_emotion = now
+                preview = renderer.prepare(packet.image)
+            finally:
+                bus.release(packet)
+            draw_preview(renderer, preview, attention)
+            renderer.show()
+            frames += 1
+            rate.tick(now)
+
+            if not warm and now >= started + warmup:
+                # Everything allocated during warmup stays, like main.py --long-running
+                warm = True
+                if freeze:
+                    gc.collect()
+                    gc.freeze()
+                monitor.reset()
+                if trace:
+                    tracemalloc.start(10)
+                    snapshot = tracemalloc.take_snapshot()
+            if warm and now >= next_sample:
+                samples.append((now - started, current_rss_mb()))
+                next_sample = now + sample_every
+            if now >= next_report:
+                gc_report = monitor.report()
+                rss = samples[-1][1] if samples else current_rss_mb()
+                log(f"{(now - started) / 60:7.1f} min  {rate.rate():5.1f} fps  RSS {rss:7.1f} MB  "
+                    f"slope {rss_slope(samples):+7.2f} MB/h  GC p99 {gc_report['gc_pause_p99_ms']:.2f} ms  "
+                    f"max {gc_report['gc_pause_max_ms']:.2f} ms")
+                next_report = now + report_every
+    finally:
+        bus.stop()
+        monitor.stop()
+
+    if trace and snapshot is not None:
+        log("Largest allocation growth since warmup:")
+        for stat in tracemalloc.take_snapshot().compare_to(snapshot, "lineno")[:10]:
+            log(f"  {stat}")
+        tracemalloc.stop()
+
+    report = dict(monitor.report())
+    report.update({
+        "seconds": time.monotonic() - started,
+        "frames": frames,
+        "fps": frames / max(time.monotonic() - started, 1e-6),
+        "rss_start_mb": samples[0][1] if samples else 0.0,
+        "rss_end_mb": samples[-1][1] if samples else 0.0,
+        "rss_growth_mb": samples[-1][1] - samples[0][1] if samples else 0.0,
+        "rss_slope_mb_per_hour": rss_slope(samples),
+        "rss_samples": len(samples),
+    })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test the pipeline on a synthetic camera")
+    parser.add_argument("--hours", type=float, default=None, help="run time in hours")
+    parser.add_argument("--minutes", type=float, default=10.0, help="run time in minutes (if --hours is not set)")
+    parser.add_argument("--backend", choices=["deepface", "fer", "onnx", "none"], default="none")
+    parser.add_argument("--fps", type=float, default=30.0, help="synthetic camera frame rate")
+    parser.add_argument("--warmup", type=float, default=60.0, help="seconds before RSS sampling starts")
+    parser.add_argument("--max-growth-mb", type=float, default=20.0,
+                        help="fail if RSS grows more than this after warmup")
+    parser.add_argument("--max-gc-pause-ms", type=float, default=50.0,
+                        help="fail if a GC pause after warmup is longer")
+    parser.add_argument("--no-freeze", action="store_true", help="do not gc.freeze() after warmup")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="print the allocation sites that grew since warmup (slow)")
+    args = parser.parse_args()
+
+    duration = args.hours * 3600 if args.hours is not None else args.minutes * 60
+    report = soak(duration, None if args.backend == "none" else args.backend, fps=args.fps,
+                  warmup=min(args.warmup, duration / 2), freeze=not args.no_freeze, trace=args.tracemalloc)
+
+    print(f"{report['frames']} frames in {report['seconds'] / 60:.1f} min ({report['fps']:.1f} fps)")
+    print(f"RSS {report['rss_start_mb']:.1f} -> {report['rss_end_mb']:.1f} MB after warmup "
+          f"({report['rss_growth_mb']:+.1f} MB, {report['rss_slope_mb_per_hour']:+.2f} MB/h)")
+    print(f"GC pauses p50 {report['gc_pause_p50_ms']:.2f} ms, p99 {report['gc_pause_p99_ms']:.2f} ms, "
+          f"max {report['gc_pause_max_ms']:.2f} ms, full collections {report['gc_collections'][2]}")
+
+    failures = []
+    if report["rss_growth_mb"] > args.max_growth_mb:
+        failures.append(f"RSS grew {report['rss_growth_mb']:.1f} MB (limit {args.max_growth_mb} MB)")
+    if report["gc_pause_max_ms"] > args.max_gc_pause_ms:
+        failures.append(f"GC paused {report['gc_pause_max_ms']:.1f} ms (limit {args.max_gc_pause_ms} ms)")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("PASS")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Temporal Filtering
+Skip emotion inference on unchanged faces and smooth emotions over time
+Academic Project - Polis University
+"""
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import cv2
+import numpy as np
+
+from emotion_backends import EMOTION_LABELS
+
+# Same fields as EmotionResult, with the dominant emotion chosen by hysteresis
+SmoothedEmotion = namedtuple("SmoothedEmotion", ["emotions", "dominant_emotion", "confidence"])
+
+
+class ChangeGate:
+    """Remember the last analyzed crop of each face and tell whether it changed
+
+    Crops are compared as tiny gray thumbnails by mean absolute difference,
+    which ignores sensor noise but catches a change of expression. A face
+    is re-analyzed at least every `max_age` seconds even if it looks the same.
+    """
+
+    def __init__(self, threshold=4.0, size=16, max_age=2.0, max_entries=64):
+        self.threshold = threshold  # Mean absolute gray-level difference (0-255)
+        self.size = size
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (thumbnail, result, analyzed at)
+        self.lock = threading.Lock()
+
+    def thumbnail(self, crop):
+        if crop.ndim == 3:
+            crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(crop, (self.size, self.size), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def lookup(self, key, crop):
+        """(cached result or None, thumbnail) for a face crop
+
+        A cached result is only returned when the crop barely changed since
+        it was analyzed, pass the thumbnail back to `store()` otherwise.
+        """
+        thumbnail = self.thumbnail(crop)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None, thumbnail
+            previous, result, analyzed_at = entry
+            if time.monotonic() - analyzed_at > self.max_age:
+                return None, thumbnail
+            if np.abs(thumbnail - previous).mean() > self.threshold:
+                return None, thumbnail
+            self.entries.move_to_end(key)
+            return result, thumbnail
+
+    def store(self, key, thumbnail, result):
+        with self.lock:
+            self.entries[key] = (thumbnail, result, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class EmotionSmoother:
+    """Exponential moving average of each face's emotion scores with hysteresis
+
+    The dominant emotion only switches when another emotion leads it by
+    `switch_margin` points, and `update()` reports a change only when the
+    dominant emotion changes or a shown score moved by `display_step` points,
+    so the GUI is redrawn only when there is something new to show.
+    """
+
+    def __init__(self, alpha=0.35, switch_margin=10.0, min_confidence=30.0, display_step=2.0,
+                 max_entries=32):
+        self.alpha = alpha
+        self.switch_margin = switch_margin
+        self.min_confidence = min_confidence  # Score an emotion needs before it is shown at all
+        self.display_step = display_step
+        self.max_entries = max_entries
+        self.states = OrderedDict()  # key -> [average scores, dominant index, shown scores]
+
+    def update(self, key, emotions):
+        """Fold one emotion distribution in, returns (SmoothedEmotion or None, changed)"""
+        scores = np.array([emotions.get(label, 0.0) for label in EMOTION_LABELS], dtype=np.float64)
+        state = self.states.get(key)
+        if state is None:
+            state = self.states[key] = [scores, -1, None]
+            while len(self.states) > self.max_entries:
+                self.states.popitem(last=False)
+        else:
+            state[0] += self.alpha * (scores - state[0])
+            self.states.move_to_end(key)
+        average, dominant, shown = state
+
+        leader = int(np.argmax(average))
+        if dominant < 0:
+            if average[leader] >= self.min_confidence:
+                dominant = leader
+        elif leader != dominant and average[leader] >= average[dominant] + self.switch_margin:
+            dominant = leader
+        if dominant < 0:
+            return None, False
+
+        changed = (dominant != state[1] or shown is None
+                   or np.abs(average - shown).max() >= self.display_step)
+        state[1] = dominant
+        if changed:
+            state[2] = average.copy()
+        smoothed = SmoothedEmotion(
+            {label: float(v) for label, v in zip(EMOTION_LABELS, average)},
+            EMOTION_LABELS[dominant], float(average[dominant])
+        )
+        return smoothed, changed
+
+    def reset(self, key=None):
+        if key is None:
+            self.states.clear()
+        else:
+            self.states.pop(key, None)
@@ -0,0 +1,136 @@
+"""
+Tracks
+Stable IDs and per-person emotion and attention state for every face in view
+Academic Project - Polis University
+"""
+
+import threading
+import time
+
+
+class Track:
+    """Compact state of one person, kept across frames"""
+
+    __slots__ = (
+        "track_id", "box", "first_seen", "last_seen", "hits",
+        "emotions", "dominant_emotion", "confidence", "emotion_frame_id",
+        "attention_status", "gaze",
+    )
+
+    def __init__(self, track_id, box, timestamp):
+        self.track_id = track_id
+        self.box = box
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.hits = 1
+
+        # Emotion distribution in percent, filled once the face has been classified
+        self.emotions = None
+        self.dominant_emotion = None
+        self.confidence = 0.0
+        self.emotion_frame_id = -1
+
+        self.attention_status = None
+        self.gaze = None
+
+
+def box_iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+class TrackManager:
+    """Match face boxes to tracks by overlap and evict people who left"""
+
+    def __init__(self, iou_threshold=0.3, max_age=2.0, max_tracks=64):
+        # Boxes overlapping an existing track by at least this IoU keep its ID
+        self.iou_threshold = iou_threshold
+        # Tracks unseen for this many seconds are dropped
+        self.max_age = max_age
+        # Beyond this many tracks the least recently seen ones are dropped too
+        self.max_tracks = max_tracks
+
+        self.tracks = {}
+        self.next_track_id = 1
+        self.lock = threading.Lock()
+
+    def assign(self, boxes, timestamp=None):
+        """Return one track ID per box, creating tracks for new faces"""
+        now = time.monotonic() if timestamp is None else timestamp
+        with self.lock:
+            # Greedy matching, best overlaps first
+            candidates = []
+            for box_index, box in enumerate(boxes):
+                for track in self.tracks.values():
+                    iou = box_iou(box, track.box)
+                    if iou >= self.iou_threshold:
+                        candidates.append((iou, box_index, track.track_id))
+            candidates.sort(reverse=True)
+
+            track_ids = [None] * len(boxes)
+            used = set()
+            for iou, box_index, track_id in candidates:
+                if track_ids[box_index] is None and track_id not in used:
+                    track_ids[box_index] = track_id
+                    used.add(track_id)
+
+            for box_index, box in enumerate(boxes):
+                track_id = track_ids[box_index]
+                if track_id is None:
+                    track_id = self.next_track_id
+                    self.next_track_id += 1
+                    self.tracks[track_id] = Track(track_id, box, now)
+                    track_ids[box_index] = track_id
+                else:
+                    track = self.tracks[track_id]
+                    track.box = box
+                    track.last_seen = now
+                    track.hits += 1
+
+            self._evict(now)
+            return track_ids
+
+    def _evict(self, now):
+        stale = [tid for tid, track in self.tracks.items() if now - track.last_seen > self.max_age]
+        for track_id in stale:
+            del self.tracks[track_id]
+        if len(self.tracks) > self.max_tracks:
+            oldest = sorted(self.tracks.values(), key=lambda t: t.last_seen)
+            for track in oldest[:len(self.tracks) - self.max_tracks]:
+                del self.tracks[track.track_id]
+
+    def update_emotion(self, track_id, emotion, frame_id=-1):
+        """Store an EmotionResult on a track, ignored if the track was evicted"""
+        with self.lock:
+            track = self.tracks.get(track_id)
+            if track is None or emotion is None:
+                return
+            track.emotions = emotion.emotions
+            track.dominant_emotion = emotion.dominant_emotion
+            track.confidence = emotion.confidence
+            track.emotion_frame_id = frame_id
+
+    def update_attention(self, track_id, status, gaze):
+        with self.lock:
+            track = self.tracks.get(track_id)
+            if track is not None:
+                track.attention_status = status
+                track.gaze = gaze
+
+    def get(self, track_id):
+        return self.tracks.get(track_id)
+
+    def active(self):
+        """Current tracks, largest face first"""
+        with self.lock:
+            tracks = list(self.tracks.values())
+        return sorted(tracks, key=lambda t: t.box[2] * t.box[3], reverse=True)
+
+    def __len__(self):
+        return len(self.tracks)
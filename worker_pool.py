@@ -0,0 +1,282 @@
+"""
+Worker Pool
+Run the analysis engine in worker processes, frames travel through shared memory
+Academic Project - Polis University
+"""
+
+import logging
+import multiprocessing as mp
+import queue
+import threading
+import time
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from tracks import TrackManager
+
+logger = logging.getLogger(__name__)
+
+# Small picklable job description, the pixels stay in the shared memory slot
+Task = namedtuple("Task", ["slot", "frame_id", "timestamp", "shape", "attention", "emotion",
+                           "faces", "track_ids"])
+
+
+def _worker_main(index, busy, task_queue, result_queue, slot_names, engine_options):
+    """Worker process: attach to the shared slots, build an engine, serve tasks
+
+    busy[2 * index] holds the slot this worker is working on (-1 when idle)
+    and busy[2 * index + 1] its frame ID, so the parent can reclaim the slot
+    if the process dies.
+    """
+    # Imported here so the parent does not pay for it before spawning
+    from analysis_engine import AnalysisEngine, FrameResult
+
+    slots = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    engine = AnalysisEngine(**engine_options)
+    try:
+        engine.load_emotion_model()
+    except Exception as e:
+        # Keep serving frames without emotions, but tell the parent why
+        logger.exception("Emotion model failed to load in worker")
+        result_queue.put((None, -1, None, f"Emotion model failed to load: {e!r}"))
+        engine.emotion_backend = None
+
+    try:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            busy[2 * index + 1] = task.frame_id
+            busy[2 * index] = task.slot
+
+            # View the shared buffer as a frame, no copy
+            frame = np.ndarray(task.shape, dtype=np.uint8, buffer=slots[task.slot].buf)
+            try:
+                if task.faces is not None:
+                    # Only classify boxes already tracked by the caller
+                    start = time.perf_counter()
+                    result = FrameResult(task.frame_id, time.time() if task.timestamp is None else task.timestamp)
+                    keys = [task.track_ids] if task.track_ids else None
+                    result.faces = engine.analyze_emotions([(task.frame_id, frame)], [task.faces], keys)[0]
+                    for face, track_id in zip(result.faces, task.track_ids or []):
+                        face.track_id = track_id
+                    result.emotion = result.faces[0].emotion if result.faces else None
+                    result.latency = time.perf_counter() - start
+                else:
+                    result = engine.analyze(frame, task.frame_id, task.timestamp,
+                                            attention=task.attention, emotion=task.emotion)
+                error = None
+            except Exception as e:
+                result, error = None, repr(e)
+            del frame
+            result_queue.put((task.slot, task.frame_id, result, error))
+            busy[2 * index] = -1
+    finally:
+        for shm in slots:
+            shm.close()
+
+
+class InferencePool:
+    """Pool of engine processes fed through preallocated shared memory slots
+
+    There is one slot per in-flight frame. When every slot is busy `submit()`
+    returns False and the caller drops the frame instead of queueing it, so
+    results never fall behind the camera. Results are handed on in frame
+    order: one that finishes after a newer frame's result is dropped. A
+    worker that dies is replaced and the slot it held is freed again.
+    """
+
+    def __init__(self, workers=2, max_frame_shape=(1080, 1920, 3), slots=None,
+                 on_result=None, **engine_options):
+        self.workers = workers
+        self.max_frame_bytes = int(np.prod(max_frame_shape))
+        self.on_result = on_result
+        # Workers keep their own trackers, so each frame is detected fully
+        engine_options.setdefault("detect_every", 1)
+
+        # Two slots per worker keeps every worker busy while the next frame is copied in
+        slot_count = slots or workers * 2
+        self.slots = [shared_memory.SharedMemory(create=True, size=self.max_frame_bytes)
+                      for _ in range(slot_count)]
+        self.free_slots = queue.Queue()
+        self.relabel = [False] * slot_count  # Whether the slot's result needs pool track IDs
+        self.slot_freed = threading.Condition()
+        self.in_flight = {}  # slot -> frame ID, guarded by slot_freed
+        for slot in range(slot_count):
+            self.free_slots.put(slot)
+
+        # Spawn avoids forking a parent that already runs camera and Tk threads
+        self.context = mp.get_context("spawn")
+        self.engine_options = engine_options
+        self.task_queue = self.context.Queue()
+        self.result_queue = self.context.Queue()
+        # (slot, frame ID) per worker, slot -1 while idle
+        self.busy = self.context.Array("q", [-1] * (2 * workers), lock=False)
+        self.processes = [self._spawn(index) for index in range(workers)]
+        self.closing = False
+
+        # Each worker numbers faces on its own, IDs are reassigned here across workers
+        self.tracks = TrackManager()
+
+        # Results nobody collected are dropped oldest first instead of accumulating
+        self.results = queue.Queue(maxsize=slot_count * 4)
+        self.submitted = 0
+        self.dropped = 0
+        self.failed = 0
+        self.stale = 0     # Results dropped because a newer frame's result came first
+        self.restarts = 0  # Workers replaced after they died
+        self.last_frame_id = -1
+        self.model_error = None  # Set when a worker could not load the emotion model
+        self.collector = threading.Thread(target=self._collect_results, daemon=True)
+        self.collector.start()
+
+    def _spawn(self, index):
+        self.busy[2 * index] = -1
+        process = self.context.Process(
+            target=_worker_main,
+            args=(index, self.busy, self.task_queue, self.result_queue, [s.name for s in self.slots],
+                  self.engine_options),
+            daemon=True
+        )
+        process.start()
+        return process
+
+    def submit(self, frame_id, timestamp, frame, attention=True, emotion=True,
+               faces=None, track_ids=None, block=False):
+        """Copy a frame into a free slot and queue it, False if the frame was dropped
+
+        With `faces` (and their `track_ids`) the worker only classifies those boxes.
+        """
+        if frame.nbytes > self.max_frame_bytes:
+            raise ValueError(f"Frame of {frame.nbytes} bytes does not fit the shared slots")
+        try:
+            slot = self.free_slots.get(block=block)
+        except queue.Empty:
+            self.dropped += 1
+            return False
+
+        view = np.ndarray(frame.shape, dtype=np.uint8, buffer=self.slots[slot].buf)
+        np.copyto(view, frame)
+        del view
+        self.relabel[slot] = faces is None
+        with self.slot_freed:
+            self.in_flight[slot] = frame_id
+        self.task_queue.put(Task(slot, frame_id, timestamp, frame.shape, attention, emotion,
+                                 faces, track_ids))
+        self.submitted += 1
+        return True
+
+    def has_free_slot(self):
+        return not self.free_slots.empty()
+
+    def wait_for_slot(self, timeout=None):
+        """Block until a worker slot frees up, so the caller can then grab its newest frame"""
+        with self.slot_freed:
+            return self.slot_freed.wait_for(self.has_free_slot, timeout=timeout)
+
+    def get(self, timeout=None):
+        """Next FrameResult, in frame order, or None on timeout"""
+        try:
+            return self.results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _release(self, slot, frame_id):
+        """Put a slot back on the free list, unless it was already reclaimed (and reused)"""
+        with self.slot_freed:
+            if self.in_flight.get(slot) != frame_id:
+                return False
+            del self.in_flight[slot]
+            self.free_slots.put(slot)
+            self.slot_freed.notify_all()
+            return True
+
+    def _check_workers(self):
+        """Replace dead workers and free the slot each of them was working on"""
+        for index, process in enumerate(self.processes):
+            if process.is_alive() or self.closing:
+                continue
+            slot, frame_id = self.busy[2 * index], self.busy[2 * index + 1]
+            logger.error("Inference worker %d died (exit code %s), starting a new one", index, process.exitcode)
+            if slot >= 0 and self._release(slot, frame_id):
+                # Only if the slot still holds that frame, its result may have come in already
+                self.failed += 1
+            self.restarts += 1
+            self.processes[index] = self._spawn(index)
+
+    def _collect_results(self):
+        """Return slots to the free list and hand results to the caller"""
+        while True:
+            try:
+                item = self.result_queue.get(timeout=0.5)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            if item is None:
+                break
+            slot, frame_id, result, error = item
+            if slot is None:
+                # Not a frame: a worker reports that its emotion model failed to load
+                self.model_error = error
+                logger.error("Inference worker: %s", error)
+                continue
+            relabel = self.relabel[slot]
+            if not self._release(slot, frame_id):
+                # The slot was reclaimed from a worker taken for dead, its result is late
+                continue
+            self._check_workers()
+            if error is not None:
+                self.failed += 1
+                logger.debug("Frame %d failed in a worker: %s", frame_id, error)
+                continue
+            if frame_id <= self.last_frame_id:
+                # Workers finish out of order, never let an older frame overwrite newer tracks
+                self.stale += 1
+                continue
+            self.last_frame_id = frame_id
+            if relabel:
+                self._assign_tracks(result)
+            if self.on_result is not None:
+                self.on_result(result)
+            else:
+                self._put_result(result)
+
+    def _put_result(self, result):
+        while True:
+            try:
+                self.results.put_nowait(result)
+                return
+            except queue.Full:
+                try:
+                    self.results.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def _assign_tracks(self, result):
+        """Replace worker-local track IDs with IDs shared across all workers"""
+        track_ids = self.tracks.assign([face.box for face in result.faces], result.timestamp)
+        for face, track_id in zip(result.faces, track_ids):
+            face.track_id = track_id
+            self.tracks.update_emotion(track_id, face.emotion, result.frame_id)
+            if face.attention is not None:
+                self.tracks.update_attention(track_id, face.attention.status, face.attention.gaze)
+        if result.attention is not None:
+            result.attention.track_ids = track_ids
+
+    def close(self):
+        """Stop the workers and free the shared memory"""
+        self.closing = True
+        for _ in self.processes:
+            self.task_queue.put(None)
+        for process in self.processes:
+            process.join(timeout=5.0)
+            if process.is_alive():
+                process.terminate()
+        self.result_queue.put(None)
+        self.collector.join(timeout=1.0)
+        for shm in self.slots:
+            shm.close()
+            shm.unlink()